@@ -1,12 +1,19 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from salon.media import serve_media
 
 urlpatterns = [
     path('', include('salon.urls')),   
     path('admin/', admin.site.urls),   
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Uploaded media is served by the app itself (ranges, ETags, sendfile under
+# gunicorn); set SERVE_MEDIA=False when a CDN or web server serves MEDIA_ROOT
+if settings.SERVE_MEDIA:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+    ]
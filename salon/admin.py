@@ -1,45 +1,81 @@
 # salon/admin.py
+from django import forms
 from django.contrib import admin
-from django.db.models import Min, Max
+from django.db.models import Min, Max, Q
 from django.utils.safestring import mark_safe 
-from .models import Service, SubService, HairStyle, Wig, Appointment, WigOrder
+from .models import Service, SubService, HairStyle, Wig, Appointment, WigOrder, OutboxEmail, StockMovement, update_status
+from .search import matching_ids
+
+
+class IndexedSearchMixin:
+    """Changelist search through the catalog search index instead of
+    icontains scans over every search_fields column. search_fields still
+    has to be set for the admin to show the search box.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        matches = matching_ids(search_term, self.model._meta.model_name, queryset.db, active_only=False)
+        if matches is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=matches), False
+
+
+class StockEditForm(forms.ModelForm):
+    """Carries the stock the editor was shown, so saving applies only the
+    change they typed on top of orders placed while the form was open
+    """
+    stock_shown = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['stock_shown'].initial = self.instance.stock
+
+    def save(self, commit=True):
+        if self.instance.pk and self.cleaned_data.get('stock_shown') is not None:
+            self.instance._stock_loaded = self.cleaned_data['stock_shown']
+        return super().save(commit)
 
 
 @admin.register(Service)
-class ServiceAdmin(admin.ModelAdmin):
+class ServiceAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ['name', 'get_price_range', 'get_duration_range', 'is_active', 'created_at']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'description']
 
-    
-    def get_price_range(self, obj):
-        # Get price range from subservices
-        prices = obj.subservices.filter(is_active=True).aggregate(
-            min_price=Min('price'),
-            max_price=Max('price')
+    def get_queryset(self, request):
+        # Ranges over active subservices, computed in the changelist query
+        active = Q(subservices__is_active=True)
+        return super().get_queryset(request).annotate(
+            min_price=Min('subservices__price', filter=active),
+            max_price=Max('subservices__price', filter=active),
+            min_duration=Min('subservices__duration', filter=active),
+            max_duration=Max('subservices__duration', filter=active),
         )
-        if prices['min_price'] is not None and prices['max_price'] is not None:
-            if prices['min_price'] == prices['max_price']:
-                return f"${prices['min_price']}"
-            return f"${prices['min_price']} - ${prices['max_price']}"
+
+    def get_price_range(self, obj):
+        if obj.min_price is not None and obj.max_price is not None:
+            if obj.min_price == obj.max_price:
+                return f"${obj.min_price}"
+            return f"${obj.min_price} - ${obj.max_price}"
         return "No pricing"
     get_price_range.short_description = 'Price Range'
+    get_price_range.admin_order_field = 'min_price'
     
     def get_duration_range(self, obj):
-        durations = obj.subservices.filter(is_active=True).aggregate(
-            min_duration=Min('duration'),
-            max_duration=Max('duration')
-        )
-        if durations['min_duration'] is not None and durations['max_duration'] is not None:
-            if durations['min_duration'] == durations['max_duration']:
-                return f"{durations['min_duration']}"
-            return f"{durations['min_duration']} - {durations['max_duration']}"
+        if obj.min_duration is not None and obj.max_duration is not None:
+            if obj.min_duration == obj.max_duration:
+                return f"{obj.min_duration}"
+            return f"{obj.min_duration} - {obj.max_duration}"
         return "No duration"
     get_duration_range.short_description = 'Duration Range'
+    get_duration_range.admin_order_field = 'min_duration'
 
 @admin.register(SubService)
-class SubServiceAdmin(admin.ModelAdmin):
+class SubServiceAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    form = StockEditForm
     list_display = ['name', 'service', 'price', 'get_duration', 'get_stock', 'is_active'] 
+    list_select_related = ['service']
     list_filter = ['service', 'is_active']
     search_fields = ['name', 'description']
     list_editable = ['price', 'is_active'] 
@@ -61,20 +97,22 @@ class SubServiceAdmin(admin.ModelAdmin):
     image_preview.short_description = 'Image Preview'
 
 @admin.register(HairStyle)
-class HairStyleAdmin(admin.ModelAdmin):
+class HairStyleAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'is_active')
     list_filter = ('is_active',)
-    search_fields = ('name',)
+    search_fields = ('name', 'description')
 
 @admin.register(Wig)
-class WigAdmin(admin.ModelAdmin):
+class WigAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    form = StockEditForm
     list_display = ('name', 'price', 'stock', 'is_active')
     list_filter = ('is_active',)
-    search_fields = ('name',)
+    search_fields = ('name', 'description')
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ('customer_name', 'service', 'subservice', 'appointment_date', 'status', 'created_at')
+    list_select_related = ('service', 'subservice__service')
     list_filter = ('status', 'service', 'appointment_date')
     search_fields = ('customer_name', 'customer_phone', 'customer_email')
     date_hierarchy = 'appointment_date'
@@ -82,17 +120,41 @@ class AppointmentAdmin(admin.ModelAdmin):
     actions = ['confirm_selected', 'cancel_selected']
     
     def confirm_selected(self, request, queryset):
-        queryset.update(status='confirmed')
+        update_status(queryset, 'confirmed')
     confirm_selected.short_description = "Confirm selected appointments"
     
     def cancel_selected(self, request, queryset):
-        queryset.update(status='cancelled')
+        update_status(queryset, 'cancelled')
     cancel_selected.short_description = "Cancel selected appointments"
 
 @admin.register(WigOrder)
 class WigOrderAdmin(admin.ModelAdmin):
     list_display = ('customer_name', 'wig', 'quantity', 'total_price', 'status', 'payment_method', 'payment_confirmed')
+    list_select_related = ('wig',)
     list_filter = ('status', 'payment_method', 'payment_confirmed', 'order_date')
     search_fields = ('customer_name', 'customer_phone', 'customer_email')
     readonly_fields = ('order_date', 'total_price')
 
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to_email', 'subject')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    """Read-only view of the append-only stock ledger"""
+    list_display = ('item_kind', 'item_id', 'kind', 'quantity', 'reference', 'created_at')
+    list_filter = ('item_kind', 'kind')
+    search_fields = ('reference',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
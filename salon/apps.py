@@ -1,6 +1,38 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 
 
 class SalonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'salon'
+
+    def ready(self):
+        from .cache import invalidate_catalog
+        from .db import configure_sqlite
+        from .images import build_image_derivatives
+        from .models import touch_deleted_appointment, uncount_deleted_row, uncount_detached_product_orders
+        from .search import index_catalog_item, unindex_catalog_item
+        from .storage import release_deleted_image, release_replaced_image
+
+        connection_created.connect(configure_sqlite, dispatch_uid='salon.configure_sqlite')
+        for name in ('Appointment', 'WigOrder', 'ProductOrder'):
+            pre_delete.connect(uncount_deleted_row, sender=self.get_model(name), dispatch_uid=f'salon.counters.{name}')
+        pre_delete.connect(touch_deleted_appointment, sender=self.get_model('Appointment'), dispatch_uid='salon.availability')
+        pre_delete.connect(
+            uncount_detached_product_orders, sender=self.get_model('SubService'),
+            dispatch_uid='salon.counters.SubService',
+        )
+        # Images and the search index first: what they write must be in
+        # before the catalog bump
+        for name in ('SubService', 'HairStyle', 'Wig'):
+            model = self.get_model(name)
+            pre_save.connect(release_replaced_image, sender=model, dispatch_uid=f'salon.media.save.{name}')
+            post_delete.connect(release_deleted_image, sender=model, dispatch_uid=f'salon.media.delete.{name}')
+            post_save.connect(build_image_derivatives, sender=model, dispatch_uid=f'salon.images.{name}')
+        for name in ('Service', 'SubService', 'HairStyle', 'Wig'):
+            model = self.get_model(name)
+            post_save.connect(index_catalog_item, sender=model, dispatch_uid=f'salon.search.save.{name}')
+            post_delete.connect(unindex_catalog_item, sender=model, dispatch_uid=f'salon.search.delete.{name}')
+            post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'salon.catalog.save.{name}')
+            post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'salon.catalog.delete.{name}')
@@ -0,0 +1,212 @@
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+import zlib
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+from django.db import connections, transaction
+
+from .db import primary_reads
+
+CATALOG_CACHE = 'catalog'
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_STATS_KEYS = {'hits': 'catalog:hits', 'misses': 'catalog:misses'}
+CATALOG_LOCK_TIMEOUT = 30  # seconds a worker may hold a recompute lock
+CATALOG_LOCK_WAIT = 5  # seconds other workers wait for its result
+CATALOG_STATS_FLUSH_EVERY = 5  # seconds between writes of this worker's counts
+
+_MISSING = object()
+# Single flight between threads of one worker; cache.add covers other workers
+_recompute_locks = [threading.Lock() for _ in range(16)]
+# Hit/miss counts not yet added to the shared totals
+_pending_stats = {'hits': 0, 'misses': 0, 'flushed_at': time.monotonic()}
+_stats_lock = threading.Lock()
+
+
+class CatalogFileCache(FileBasedCache):
+    """FileBasedCache with an atomic add and incr, safe to share between
+    worker processes, whose culling never evicts the catalog version or
+    the hit/miss counters.
+    """
+
+    pinned_keys = (CATALOG_VERSION_KEY, *CATALOG_STATS_KEYS.values())
+    lock_suffix = '.lock'
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Hard-linking a fully written file fails if the key exists, so
+        # exactly one process wins and readers never see a partial entry
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    if self.has_key(key, version):
+                        return False
+                    # It had expired and has_key removed it: try again
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def incr(self, key, delta=1, version=None):
+        """Add delta under an exclusive lock, keeping the entry's expiry"""
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        with open(fname + self.lock_suffix, 'wb') as lock:
+            locks.lock(lock, locks.LOCK_EX)
+            try:
+                try:
+                    with open(fname, 'rb') as f:
+                        expiry = pickle.load(f)
+                        value = pickle.loads(zlib.decompress(f.read()))
+                except (FileNotFoundError, EOFError):
+                    expiry, value = 0, None
+                if value is None or (expiry is not None and expiry < time.time()):
+                    raise ValueError(f"Key '{key}' not found")
+                value += delta
+                self.set(key, value, None if expiry is None else expiry - time.time(), version)
+                return value
+            finally:
+                locks.unlock(lock)
+
+    def _cull(self):
+        pinned = {self._key_to_file(key) for key in self.pinned_keys}
+        filelist = [fname for fname in self._list_cache_files() if fname not in pinned]
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency:
+            filelist = random.sample(filelist, int(num_entries / self._cull_frequency))
+        for fname in filelist:
+            self._delete(fname)
+
+
+def catalog_cache():
+    return caches[CATALOG_CACHE]
+
+
+def catalog_version():
+    """Current catalog version; every entry is keyed under it"""
+    cache = catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Retire every cached catalog entry at once.
+
+    Versions are timestamps rather than a counter so a lost or evicted
+    version key can never bring an old version's entries back.
+    """
+    catalog_cache().set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_catalog(sender, using=None, **kwargs):
+    """post_save/post_delete receiver for catalog models.
+
+    Bumps now, so this process stops serving the old rows, and again on
+    commit, so nothing another worker cached from the pre-commit rows in
+    between survives.
+    """
+    if using and connections[using].in_atomic_block:
+        bump_catalog_version()
+    transaction.on_commit(bump_catalog_version, using=using)
+
+
+def _flush_stats():
+    with _stats_lock:
+        counts = {name: _pending_stats[name] for name in CATALOG_STATS_KEYS}
+        _pending_stats.update(hits=0, misses=0, flushed_at=time.monotonic())
+    cache = catalog_cache()
+    for name, count in counts.items():
+        if not count:
+            continue
+        key = CATALOG_STATS_KEYS[name]
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            if not cache.add(key, count, timeout=None):
+                cache.incr(key, count)
+
+
+def _count(name):
+    # Batched so a cache hit does not also cost a shared counter write
+    with _stats_lock:
+        _pending_stats[name] += 1
+        due = time.monotonic() - _pending_stats['flushed_at'] >= CATALOG_STATS_FLUSH_EVERY
+    if due:
+        _flush_stats()
+
+
+def cached_catalog(name, compute):
+    """compute() for the current catalog version, run at most once at a time.
+
+    On a miss one caller takes a short-lived lock in the cache and
+    recomputes; the others wait up to CATALOG_LOCK_WAIT for its result
+    before falling back to computing it themselves. compute() always reads
+    the primary: a lagging replica's rows stored under a just-bumped
+    version would be served until the next edit.
+    """
+    def recompute():
+        with primary_reads():
+            return compute()
+
+    cache = catalog_cache()
+    key = f'catalog:{catalog_version()}:{name}'
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _count('hits')
+        return value
+    _count('misses')
+
+    with _recompute_locks[hash(key) % len(_recompute_locks)]:
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        lock_key = f'{key}:lock'
+        if cache.add(lock_key, 1, timeout=CATALOG_LOCK_TIMEOUT):
+            try:
+                value = recompute()
+                cache.set(key, value)
+            finally:
+                cache.delete(lock_key)
+            return value
+
+        deadline = time.monotonic() + CATALOG_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+        return recompute()
+
+
+def catalog_cache_stats():
+    """Totals across workers; others report up to CATALOG_STATS_FLUSH_EVERY late"""
+    _flush_stats()
+    cache = catalog_cache()
+    hits = cache.get(CATALOG_STATS_KEYS['hits'], 0)
+    misses = cache.get(CATALOG_STATS_KEYS['misses'], 0)
+    lookups = hits + misses
+    return {
+        'version': catalog_version(),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / lookups, 4) if lookups else None,
+    }
@@ -0,0 +1,157 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import CharField, Value
+
+from .models import ProductOrder, StockMovement, SubService, Wig, WigOrder
+from .utils import enqueue_email
+
+CART_SESSION_KEY = 'cart'
+CART_ITEM_MODELS = {'subservice': SubService, 'wig': Wig}
+
+
+class Cart:
+    """Products and wigs a visitor has picked, kept in the session as
+    {"<kind>:<id>": quantity}.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.items = session.get(CART_SESSION_KEY, {})
+
+    def __len__(self):
+        return sum(self.items.values())
+
+    def save(self):
+        self.session[CART_SESSION_KEY] = self.items
+        self.session.modified = True
+
+    def add(self, kind, item_id, quantity=1):
+        if kind not in CART_ITEM_MODELS:
+            raise ValidationError("Unknown item type.")
+        key = f"{kind}:{item_id}"
+        self.items[key] = self.items.get(key, 0) + quantity
+        self.save()
+
+    def remove(self, kind, item_id):
+        self.items.pop(f"{kind}:{item_id}", None)
+        self.save()
+
+    def clear(self):
+        self.items = {}
+        self.save()
+
+    def lines(self):
+        """The cart's items with their current name, price and stock.
+
+        Both item tables are read in one UNION query. Items that have
+        been removed or deactivated since they were added are dropped.
+        """
+        wanted = {}
+        for key, quantity in self.items.items():
+            kind, item_id = key.split(':')
+            wanted.setdefault(kind, {})[int(item_id)] = quantity
+
+        columns = ('id', 'name', 'price', 'stock', 'kind')
+        parts = []
+        for kind, quantities in wanted.items():
+            queryset = CART_ITEM_MODELS[kind].objects.filter(pk__in=quantities, is_active=True)
+            if kind == 'subservice':
+                queryset = queryset.filter(service__service_type='order')
+            parts.append(
+                queryset.annotate(kind=Value(kind, output_field=CharField()))
+                .order_by().values(*columns)
+            )
+        if not parts:
+            return []
+
+        rows = parts[0].union(*parts[1:], all=True) if len(parts) > 1 else parts[0]
+        lines = []
+        for row in rows:
+            row['quantity'] = wanted[row['kind']][row['id']]
+            row['line_total'] = row['price'] * row['quantity']
+            lines.append(row)
+        lines.sort(key=lambda line: (line['kind'], line['name']))
+        return lines
+
+
+def validate_customer(models, customer):
+    """Run the order models' own field validation over the customer details,
+    so a missing or malformed field is reported before stock is touched
+    """
+    for model in models:
+        order = model(**customer)
+        try:
+            order.clean_fields(exclude=[field.name for field in model._meta.fields if field.name not in customer])
+        except ValidationError as e:
+            name, errors = next(iter(e.message_dict.items()))
+            label = model._meta.get_field(name).verbose_name
+            raise ValidationError(f"{label.capitalize()}: {errors[0]}")
+
+
+def checkout_cart(cart, user, customer, payment_method, payment_status):
+    """Turn the cart into orders in a single transaction.
+
+    Stock for every line is checked and taken with one conditional UPDATE
+    per item table, the order rows and their ledger reservations are bulk
+    inserted, and one confirmation email lists the whole purchase. Raises
+    ValidationError, leaving stock untouched, if any line is short or the
+    customer details are incomplete.
+    """
+    lines = cart.lines()
+    if not lines:
+        raise ValidationError("Your cart is empty.")
+    validate_customer(
+        [model for kind, model in (('subservice', ProductOrder), ('wig', WigOrder))
+         if any(line['kind'] == kind for line in lines)],
+        customer,
+    )
+    short = [line for line in lines if line['quantity'] > line['stock']]
+    if short:
+        raise ValidationError(
+            f"Sorry, only {short[0]['stock']} units of {short[0]['name']} available in stock."
+        )
+
+    def order_fields(line):
+        return dict(
+            user=user, quantity=line['quantity'], total_price=line['line_total'],
+            payment_method=payment_method, payment_status=payment_status, **customer,
+        )
+
+    with transaction.atomic():
+        for kind, model in CART_ITEM_MODELS.items():
+            quantities = {line['id']: line['quantity'] for line in lines if line['kind'] == kind}
+            if quantities and not model.take_stock_many(quantities):
+                raise ValidationError("Some items in your cart just sold out. Please review your cart.")
+
+        products = ProductOrder.bulk_create_counted([
+            ProductOrder(subservice_id=line['id'], product_name=line['name'], **order_fields(line))
+            for line in lines if line['kind'] == 'subservice'
+        ])
+        wigs = WigOrder.bulk_create_counted([
+            WigOrder(wig_id=line['id'], status='pending', **order_fields(line))
+            for line in lines if line['kind'] == 'wig'
+        ])
+        orders = products + wigs
+
+        StockMovement.objects.bulk_create(
+            StockMovement(
+                item_kind=kind, item_id=getattr(order, item_field), kind='reserve',
+                quantity=order.quantity, reference=StockMovement.order_reference(order),
+            )
+            for kind, item_field, group in (('subservice', 'subservice_id', products), ('wig', 'wig_id', wigs))
+            for order in group
+        )
+
+        enqueue_email(customer.get('customer_email'), 'Order Received - Awinso Hair Care',
+                      'emails/cart_order_placed.html', {
+            'customer_name': customer.get('customer_name'),
+            'lines': [
+                {'name': line['name'], 'quantity': line['quantity'], 'total': str(line['line_total'])}
+                for line in lines
+            ],
+            'total': str(sum((line['line_total'] for line in lines), Decimal('0'))),
+        })
+    cart.clear()
+    return orders
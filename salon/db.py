@@ -0,0 +1,84 @@
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+REPLICA_ALIAS = 'replica'
+# Auth and sessions always read the primary so a fresh login is never lost
+REPLICA_APP_LABELS = {'salon'}
+
+# Per request: may reads use the replica, and has anything been written yet
+replica_reads_allowed = ContextVar('replica_reads_allowed', default=False)
+primary_written = ContextVar('primary_written', default=False)
+
+
+def pragma_statements(pragmas):
+    """PRAGMA statements for a {name: value} mapping; empty values are skipped"""
+    statements = []
+    for name, value in pragmas.items():
+        if value is None or value == '':
+            continue
+        if not PRAGMA_VALUE.match(str(name)) or not PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f"Invalid SQLite pragma {name}={value!r}")
+        statements.append(f"PRAGMA {name} = {value}")
+    return statements
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created hook applying settings.SQLITE_PRAGMAS"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(getattr(settings, 'SQLITE_PRAGMAS', {})):
+            cursor.execute(statement)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.settings
+
+
+def replica_reads(view):
+    """Mark a read-only view as safe to serve from the replica"""
+    view.replica_reads = True
+    return view
+
+
+@contextmanager
+def primary_reads():
+    """Send reads inside the block to the primary, for results that outlive
+    the request and must not capture a lagging replica
+    """
+    token = replica_reads_allowed.set(False)
+    try:
+        yield
+    finally:
+        replica_reads_allowed.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Reads from @replica_reads views go to the replica until the request
+    writes; everything else stays on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            replica_reads_allowed.get()
+            and not primary_written.get()
+            and model._meta.app_label in REPLICA_APP_LABELS
+            and replica_configured()
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        primary_written.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
@@ -0,0 +1,147 @@
+import base64
+import hashlib
+import io
+import logging
+import posixpath
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageFilter, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Card and modal widths the catalog templates need, smallest first
+IMAGE_WIDTHS = (320, 640, 960, 1280)
+# (extension, Pillow format, save options); WebP first, JPEG as the fallback
+IMAGE_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+# Part of every derivative name: changing the encoder settings gives the
+# derivatives new URLs, so their immutable cache headers stay truthful.
+# Run build_image_derivatives after changing them.
+DERIVATIVE_VERSION = hashlib.sha256(repr(IMAGE_FORMATS).encode()).hexdigest()[:8]
+CARD_SIZES = '(min-width: 992px) 33vw, (min-width: 768px) 50vw, 100vw'
+# Longest side of the inline blur placeholder; the browser scales it up
+PLACEHOLDER_SIZE = 16
+
+
+def derivative_name(name, width, extension):
+    """'wigs/bob.png' -> 'wigs/bob.w320.<DERIVATIVE_VERSION>.webp', next to
+    the original
+    """
+    root, _ = posixpath.splitext(name)
+    return f'{root}.w{width}.{DERIVATIVE_VERSION}.{extension}'
+
+
+def has_derivatives(field_file):
+    """Whether the smallest WebP derivative of this image is in storage"""
+    if not field_file:
+        return False
+    return field_file.storage.exists(derivative_name(field_file.name, IMAGE_WIDTHS[0], IMAGE_FORMATS[0][0]))
+
+
+def open_image(field_file):
+    """The stored image, upright and in RGB or RGBA"""
+    with field_file.storage.open(field_file.name, 'rb') as handle:
+        image = ImageOps.exif_transpose(Image.open(handle))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def flatten(image):
+    """The image on white, like the card background; JPEG has no alpha"""
+    if image.mode == 'RGB':
+        return image
+    frame = Image.new('RGB', image.size, 'white')
+    frame.paste(image, mask=image.getchannel('A'))
+    return frame
+
+
+def build_derivatives(field_file, image=None):
+    """Write a WebP and a JPEG of the image at every IMAGE_WIDTHS step.
+
+    Images are never upscaled: steps wider than the original get a copy at
+    its own width, so every name the template tag links to exists.
+    Existing derivatives are overwritten. Returns the names written.
+    """
+    storage = field_file.storage
+    if image is None:
+        image = open_image(field_file)
+
+    written = []
+    # Smallest WebP last: has_derivatives() treats it as the set being complete
+    for step in reversed(IMAGE_WIDTHS):
+        width = min(step, image.width)
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+        for extension, image_format, options in reversed(IMAGE_FORMATS):
+            frame = flatten(resized) if image_format == 'JPEG' else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, image_format, **options)
+            name = derivative_name(field_file.name, step, extension)
+            written.append(storage.replace(name, ContentFile(buffer.getvalue())))
+    return written
+
+
+def image_metadata(image):
+    """Field values describing an opened image, so templates never open it.
+
+    The placeholder is a tiny blurred WebP data URI. Images with
+    transparent pixels get none, as it would show through them.
+    """
+    flat = flatten(image)
+    sample = flat.copy()
+    sample.thumbnail((64, 64))
+    quantized = sample.quantize(colors=5)
+    _, index = max(quantized.getcolors())
+    red, green, blue = quantized.getpalette()[index * 3:index * 3 + 3]
+
+    placeholder = ''
+    if image.mode == 'RGB' or image.getchannel('A').getextrema()[0] == 255:
+        tiny = flat.copy()
+        tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        buffer = io.BytesIO()
+        tiny.filter(ImageFilter.GaussianBlur(1)).save(buffer, 'WEBP', quality=40)
+        placeholder = 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+    return {
+        'image_width': image.width,
+        'image_height': image.height,
+        'image_color': f'#{red:02x}{green:02x}{blue:02x}',
+        'image_placeholder': placeholder,
+    }
+
+
+def prepare_image(instance, derivatives=True, metadata=True):
+    """Build derivatives and/or store metadata for instance.image, reading
+    the file once. Metadata is saved with update(), so no signals are sent.
+    """
+    image = open_image(instance.image)
+    if derivatives:
+        build_derivatives(instance.image, image)
+    if metadata:
+        values = image_metadata(image)
+        type(instance)._base_manager.filter(pk=instance.pk).update(**values)
+        for name, value in values.items():
+            setattr(instance, name, value)
+        instance._image_loaded = instance.image.name
+
+
+def build_image_derivatives(sender, instance, **kwargs):
+    """post_save receiver generating derivatives and metadata for a new or
+    changed image.
+
+    A missing or unreadable file never fails the save; the template tag
+    keeps serving the original and build_image_derivatives can retry.
+    """
+    if not instance.image:
+        return
+    changed = instance.image.name != getattr(instance, '_image_loaded', None)
+    if not changed and instance.image_width is not None:
+        return
+    try:
+        prepare_image(instance, derivatives=not has_derivatives(instance.image))
+    except (OSError, ValueError) as e:
+        logger.warning("Could not build derivatives for %s: %s", instance.image.name, e)
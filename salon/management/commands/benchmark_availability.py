@@ -0,0 +1,90 @@
+import time as clock
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from salon.management.rollback import rolled_back
+from salon.models import Appointment, Service, SubService
+from salon.utils import calculate_duration, APPOINTMENT_BUFFER
+
+
+def legacy_available_slots(service, date, subservice=None):
+    """The previous per-step implementation, kept as the benchmark baseline."""
+    tz = timezone.get_current_timezone()
+    start_of_day = timezone.make_aware(datetime.combine(date, time(hour=8)), tz)
+    end_of_day = timezone.make_aware(datetime.combine(date, time(hour=20)), tz)
+
+    duration = calculate_duration(subservice)
+    buffer_time = timedelta(minutes=10)
+
+    slots = []
+    current = start_of_day
+    while current + duration <= end_of_day:
+        slot_end = current + duration + buffer_time
+
+        overlap = Appointment.objects.filter(
+            service=service,
+            status__in=["pending", "confirmed"],
+            appointment_date__lt=slot_end,
+        ).exclude(
+            appointment_date__gte=current + duration
+        ).exists()
+
+        if not overlap:
+            slots.append(current)
+
+        current += timedelta(minutes=15)
+
+    return slots
+
+
+class Command(BaseCommand):
+    help = "Compare query count and latency of the availability engine against the per-step baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Days of seeded history')
+        parser.add_argument('--per-day', type=int, default=8, help='Appointments seeded per day')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per implementation')
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self._run(options)
+
+    def _run(self, options):
+        service = Service.objects.create(name='Benchmark', description='', service_type='booking')
+        subservice = SubService.objects.create(
+            service=service, name='Benchmark cut', price=10, duration=timedelta(minutes=45)
+        )
+
+        tz = timezone.get_current_timezone()
+        target = timezone.localdate() + timedelta(days=1)
+        seeded = []
+        for offset in range(-options['days'], 1):
+            day = target + timedelta(days=offset)
+            for n in range(options['per_day']):
+                start = timezone.make_aware(datetime.combine(day, time(hour=8)), tz)
+                start += timedelta(minutes=85 * n)
+                seeded.append(Appointment(
+                    customer_name='Bench', customer_phone='0123456789',
+                    customer_email='bench@example.com', service=service,
+                    subservice=subservice, status='confirmed', appointment_date=start,
+                    blocked_until=start + subservice.duration + APPOINTMENT_BUFFER,
+                ))
+        Appointment.objects.bulk_create(seeded)
+
+        for label, func in (
+            ('per-step baseline', legacy_available_slots),
+            ('interval sweep', Appointment.objects.get_available_slots),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                slots = func(service, target, subservice)
+            started = clock.perf_counter()
+            for _ in range(options['repeat']):
+                func(service, target, subservice)
+            elapsed = (clock.perf_counter() - started) / options['repeat'] * 1000
+            self.stdout.write(
+                f"{label:<18} queries={len(queries):<4} latency={elapsed:.2f}ms slots={len(slots)}"
+            )
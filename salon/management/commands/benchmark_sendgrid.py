@@ -0,0 +1,107 @@
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.mail import EmailMessage
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from salon.models import Appointment, Service
+from salon.utils import SendGridEmailBackend, send_sendgrid_email
+
+# Outbox templates rendered for the benchmark, each with an appointment
+TEMPLATES = (
+    ('Appointment Confirmed', 'emails/appointment_confirmed.html'),
+    ('Appointment Request Received', 'emails/appointment_request_received.html'),
+    ('Payment Confirmed', 'emails/payment_confirmed.html'),
+)
+
+
+class MockSendGridHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    requests = 0
+    received = 0
+    connections = set()
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        self.rfile.read(length)
+        MockSendGridHandler.requests += 1
+        MockSendGridHandler.received += length
+        MockSendGridHandler.connections.add(self.client_address)
+        time.sleep(self.latency)
+        self.send_response(202)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-message SendGrid calls with the keep-alive backend, unbatched and "
+        "batched by template, on rendered outbox emails against a local mock"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=50)
+        parser.add_argument('--latency-ms', type=float, default=5.0, help='Simulated API latency per request')
+
+    def handle(self, *args, **options):
+        MockSendGridHandler.latency = options['latency_ms'] / 1000
+        server = ThreadingHTTPServer(('127.0.0.1', 0), MockSendGridHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        messages = self._outbox_messages(options['messages'])
+
+        try:
+            with override_settings(SENDGRID_API_HOST=f'http://127.0.0.1:{server.server_port}'):
+                self._measure('one call per message', lambda: [
+                    send_sendgrid_email(message.to[0], message.subject, message.body) for message in messages
+                ])
+                self._measure('keep-alive backend', lambda: SendGridEmailBackend().send_messages([
+                    EmailMessage(message.subject, message.body, None, message.to) for message in messages
+                ]))
+                self._measure('batched by template', lambda: SendGridEmailBackend().send_messages(messages))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def _outbox_messages(self, count):
+        """Messages as dispatch_outbox builds them: each rendered for its own
+        appointment, tagged with the template it came from
+        """
+        start = timezone.now() + timedelta(days=1)
+        messages = []
+        for n in range(count):
+            subject, template = TEMPLATES[n % len(TEMPLATES)]
+            appointment = Appointment(
+                customer_name=f'Client {n}', customer_email=f'client{n}@example.com',
+                service=Service(name=f'Service {n % 7}'), appointment_date=start + timedelta(minutes=30 * n),
+            )
+            message = EmailMessage(
+                f'{subject} - {appointment.service.name}',
+                render_to_string(template, {'appointment': appointment}),
+                None, [appointment.customer_email],
+            )
+            message.template = template
+            messages.append(message)
+        return messages
+
+    def _measure(self, label, send):
+        MockSendGridHandler.requests = 0
+        MockSendGridHandler.received = 0
+        MockSendGridHandler.connections = set()
+        started = time.perf_counter()
+        send()
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stdout.write(
+            f"{label:<22} requests={MockSendGridHandler.requests:<4} "
+            f"connections={len(MockSendGridHandler.connections):<4} bytes={MockSendGridHandler.received:<8} "
+            f"elapsed={elapsed:.1f}ms"
+        )
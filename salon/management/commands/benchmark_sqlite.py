@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time as clock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from salon.db import pragma_statements
+
+# What a fresh connection gets without the tuning layer
+BASELINE_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+def connect(path, pragmas, timeout):
+    connection = sqlite3.connect(path, timeout=timeout)
+    for statement in pragma_statements(pragmas):
+        connection.execute(statement)
+    return connection
+
+
+def worker(path, pragmas, timeout, seconds, write_ratio, results):
+    """Mixed reads and single-row write transactions until `seconds` pass"""
+    connection = connect(path, pragmas, timeout)
+    rng = random.Random(os.getpid())
+    reads = writes = locked = 0
+    deadline = clock.perf_counter() + seconds
+    while clock.perf_counter() < deadline:
+        key = rng.randrange(100)
+        try:
+            if rng.random() < write_ratio:
+                with connection:
+                    connection.execute('INSERT INTO bench (k, v) VALUES (?, ?)', (key, rng.random()))
+                writes += 1
+            else:
+                connection.execute('SELECT count(*), max(v) FROM bench WHERE k = ?', (key,)).fetchone()
+                reads += 1
+        except sqlite3.OperationalError:
+            locked += 1
+    connection.close()
+    results.put((reads, writes, locked))
+
+
+def run(pragmas, timeout, processes, seconds, write_ratio):
+    """Returns (reads/s, writes/s, lock errors) for one configuration"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.sqlite3')
+        connection = connect(path, pragmas, timeout)
+        connection.execute('CREATE TABLE bench (id INTEGER PRIMARY KEY, k INTEGER, v REAL)')
+        connection.execute('CREATE INDEX bench_k ON bench (k)')
+        with connection:
+            connection.executemany(
+                'INSERT INTO bench (k, v) VALUES (?, ?)', ((n % 100, n / 7) for n in range(20000))
+            )
+        connection.close()
+
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=worker, args=(path, pragmas, timeout, seconds, write_ratio, results))
+            for _ in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        totals = [sum(column) for column in zip(*(results.get() for _ in workers))]
+        for process in workers:
+            process.join()
+    reads, writes, locked = totals
+    return reads / seconds, writes / seconds, locked
+
+
+class Command(BaseCommand):
+    help = "Compare multi-process SQLite read/write throughput with and without SQLITE_PRAGMAS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=3)
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--timeout', type=float, default=5.0,
+                            help='Lock wait in seconds for the baseline (tuned runs use busy_timeout)')
+
+    def handle(self, *args, **options):
+        tuned = settings.SQLITE_PRAGMAS
+        for label, pragmas, timeout in (
+            ('default pragmas', BASELINE_PRAGMAS, options['timeout']),
+            ('SQLITE_PRAGMAS', tuned, tuned.get('busy_timeout', 5000) / 1000),
+        ):
+            reads, writes, locked = run(
+                pragmas, timeout, options['processes'], options['seconds'], options['write_ratio']
+            )
+            self.stdout.write(
+                f"{label:<16} reads={reads:9.0f}/s writes={writes:7.0f}/s lock_errors={locked}"
+            )
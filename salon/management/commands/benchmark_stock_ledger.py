@@ -0,0 +1,89 @@
+import threading
+import time as clock
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from salon.models import ProductOrder, Service, StockMovement, StockSnapshot, SubService
+from salon.utils import save_order_if_in_stock
+
+
+def run_concurrent_reservations(item, threads):
+    """Race `threads` single-unit product orders against one sub service.
+
+    Returns (reserved, elapsed seconds).
+    """
+    reserved = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def reserve():
+        try:
+            order = ProductOrder(
+                subservice=item, customer_name='Stress', customer_phone='0123456789',
+                product_name=item.name, quantity=1, total_price=item.price,
+            )
+            barrier.wait()
+            if save_order_if_in_stock(order, item, 1):
+                with lock:
+                    reserved.append(order.pk)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=reserve) for _ in range(threads)]
+    started = clock.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(reserved), clock.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Race concurrent reservations against the stock ledger and time balance reads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=50)
+        parser.add_argument('--threads', type=int, default=80, help='Concurrent single-unit orders')
+        parser.add_argument('--history', type=int, default=5000, help='Extra movements for the read benchmark')
+        parser.add_argument('--reads', type=int, default=200)
+
+    def handle(self, *args, **options):
+        service = Service.objects.create(name='Stress shop', description='', service_type='order')
+        item = SubService.objects.create(service=service, name='Stress oil', price=5, stock=options['stock'])
+        try:
+            reserved, elapsed = run_concurrent_reservations(item, options['threads'])
+            item.refresh_from_db(fields=['stock'])
+            balance = item.stock_balance()
+            self.stdout.write(
+                f"attempts={options['threads']} reserved={reserved} stock={item.stock} "
+                f"ledger_available={balance['available']} elapsed={elapsed:.2f}s "
+                f"throughput={options['threads'] / elapsed:.1f} req/s"
+            )
+
+            StockMovement.objects.bulk_create(
+                StockMovement(item_kind=item.stock_kind, item_id=item.pk, kind=kind, quantity=1)
+                for n in range(options['history'] // 2) for kind in ('restock', 'commit')
+            )
+            movements = StockMovement.objects.filter(item_kind=item.stock_kind, item_id=item.pk)
+
+            started = clock.perf_counter()
+            for _ in range(options['reads']):
+                StockMovement.totals(movements)
+            full = clock.perf_counter() - started
+
+            item.stock_balance()  # folds the history into a snapshot
+            started = clock.perf_counter()
+            for _ in range(options['reads']):
+                item.stock_balance()
+            snapshot = clock.perf_counter() - started
+
+            self.stdout.write(
+                f"balance over {movements.count()} movements: full scan {full / options['reads'] * 1000:.2f} ms, "
+                f"snapshot+tail {snapshot / options['reads'] * 1000:.2f} ms"
+            )
+        finally:
+            ProductOrder.objects.filter(subservice=item).delete()
+            StockMovement.objects.filter(item_kind=item.stock_kind, item_id=item.pk).delete()
+            StockSnapshot.objects.filter(item_kind=item.stock_kind, item_id=item.pk).delete()
+            service.delete()
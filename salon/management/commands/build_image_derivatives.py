@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from salon.cache import bump_catalog_version
+from salon.images import has_derivatives, prepare_image
+from salon.models import HairStyle, SubService, Wig
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate resized WebP/JPEG derivatives and stored dimensions/placeholders "
+        "for catalog images that do not have them yet"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Regenerate derivatives and metadata even where they already exist",
+        )
+
+    def handle(self, *args, **options):
+        built = described = skipped = failed = 0
+        for model in (SubService, HairStyle, Wig):
+            images = model.objects.exclude(image='').exclude(image__isnull=True).only('pk', 'image', 'image_width')
+            for item in images:
+                derivatives = options['force'] or not has_derivatives(item.image)
+                metadata = options['force'] or item.image_width is None
+                if not derivatives and not metadata:
+                    skipped += 1
+                    continue
+                try:
+                    prepare_image(item, derivatives=derivatives, metadata=metadata)
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f"{model.__name__} {item.pk} ({item.image.name}): {e}"))
+                    continue
+                built += derivatives
+                described += metadata
+        if described:
+            # Metadata is stored with update(), which sends no signals
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Built derivatives for {built} images and stored metadata for {described} "
+            f"({skipped} already done, {failed} failed)"
+        ))
@@ -0,0 +1,183 @@
+import re
+import time as clock
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from salon.management.rollback import rolled_back
+from salon.models import Appointment, OutboxEmail, ProductOrder, Service, SubService, Wig, WigOrder
+from salon.utils import APPOINTMENT_BUFFER, check_time_conflict, get_busy_intervals, opening_hours
+from salon.views import (
+    APPOINTMENT_STATUS_RANK, PRODUCT_ORDER_STATUS_RANK, WIG_ORDER_STATUS_RANK, dashboard_pages, order_feed,
+)
+
+STATUSES = ['pending', 'confirmed', 'completed', 'cancelled']
+
+
+def hot_queries(service, shop, user, day):
+    """(label, callable) pairs that run the app's hot read paths"""
+    start, end = opening_hours(day)
+    return [
+        ('availability window', lambda: get_busy_intervals(service, start, end)),
+        ('booking conflict check', lambda: check_time_conflict(service, start + timedelta(hours=2), timedelta(minutes=45))),
+        ('appointment list', lambda: list(Appointment.objects.filter(user=user).order_by('-appointment_date'))),
+        ('appointments by status', lambda: list(
+            Appointment.objects.filter(status='pending').order_by('-appointment_date')[:100]
+        )),
+        ('my orders feed', lambda: order_feed(user)),
+        ('wig orders newest first', lambda: list(WigOrder.objects.order_by('-order_date')[:100])),
+        ('product orders newest first', lambda: list(ProductOrder.objects.order_by('-order_date')[:100])),
+        ('product orders by status', lambda: list(
+            ProductOrder.objects.filter(payment_status='pending').order_by('-order_date')[:100]
+        )),
+        ('dashboard appointments', lambda: dashboard_pages(
+            Appointment.objects.all(), 'service', 'appointment_date', APPOINTMENT_STATUS_RANK,
+            Q(status='pending'), [service.id],
+        )),
+        ('dashboard wig orders', lambda: dashboard_pages(
+            WigOrder.objects.all(), 'wig__service', 'order_date', WIG_ORDER_STATUS_RANK, None, [shop.id],
+        )),
+        ('dashboard product orders', lambda: dashboard_pages(
+            ProductOrder.objects.all(), 'subservice__service', 'order_date', PRODUCT_ORDER_STATUS_RANK, None, [shop.id],
+        )),
+        ('user by email', lambda: get_user_model().objects.filter(email=user.email).first()),
+        ('outbox due batch', lambda: list(
+            OutboxEmail.objects.filter(status='pending', next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'pk')[:50]
+        )),
+    ]
+
+
+def full_scans(plan, tables):
+    """Tables the plan reads row by row without an index.
+
+    Scans of derived tables (subqueries, the window filter) are not counted.
+    """
+    if connection.vendor == 'postgresql':
+        scanned = re.findall(r'Seq Scan on (\w+)', plan)
+    else:
+        scanned = re.findall(r'\bSCAN (\w+)\s*$', plan, re.MULTILINE)
+    return {table for table in scanned if table in tables}
+
+
+def explain(sql):
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Small seeded tables are cheaper to scan; only fail if no index could be used
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(prefix + sql)
+        rows = cursor.fetchall()
+        if connection.vendor == 'postgresql':
+            cursor.execute('RESET enable_seqscan')
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN every hot query on a seeded dataset and fail if any of them does a full table scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--per-user', type=int, default=20, help='Appointments and orders seeded per user')
+        parser.add_argument('--catalog', type=int, default=30, help='Products and wigs seeded')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every query plan')
+
+    def handle(self, *args, **options):
+        failures = []
+        with rolled_back():
+            failures = self._run(options)
+        if failures:
+            raise CommandError("Full table scans in: " + ", ".join(failures))
+        self.stdout.write(self.style.SUCCESS("No full table scans"))
+
+    def _seed(self, options):
+        service = Service.objects.create(name='Plan check', description='', service_type='booking')
+        subservice = SubService.objects.create(
+            service=service, name='Plan cut', price=10, duration=timedelta(minutes=45)
+        )
+        shop = Service.objects.create(name='Plan shop', description='', service_type='order')
+        products = SubService.objects.bulk_create(
+            SubService(service=shop, name=f'Plan oil {n}', price=5, stock=10) for n in range(options['catalog'])
+        )
+        wigs = Wig.objects.bulk_create(
+            Wig(service=shop, name=f'Plan wig {n}', description='', price=80, stock=10)
+            for n in range(options['catalog'])
+        )
+
+        User = get_user_model()
+        users = User.objects.bulk_create(
+            User(username=f'plan-check-{n}', email=f'plan-check-{n}@example.com')
+            for n in range(options['users'])
+        )
+
+        tz = timezone.get_current_timezone()
+        first_day = timezone.localdate() - timedelta(days=180)
+        now = timezone.now()
+        appointments, wig_orders, product_orders, emails = [], [], [], []
+        for u, user in enumerate(users):
+            for n in range(options['per_user']):
+                serial = u * options['per_user'] + n
+                day = first_day + timedelta(days=serial % 240)
+                start = timezone.make_aware(datetime.combine(day, time(hour=8)), tz)
+                start += timedelta(minutes=15 * (serial % 40))
+                status = STATUSES[serial % len(STATUSES)]
+                appointments.append(Appointment(
+                    customer_name='Plan', customer_phone='0123456789', customer_email=user.email,
+                    service=service, subservice=subservice, user=user, status=status,
+                    appointment_date=start, blocked_until=start + subservice.duration + APPOINTMENT_BUFFER,
+                ))
+                customer = dict(
+                    customer_name='Plan', customer_phone='0123456789', customer_email=user.email,
+                    customer_address='Accra', user=user, quantity=1,
+                )
+                wig_orders.append(WigOrder(wig=wigs[serial % len(wigs)], total_price=80, status=STATUSES[serial % 2], **customer))
+                product_orders.append(ProductOrder(
+                    subservice=products[serial % len(products)], product_name='Plan oil', total_price=5,
+                    payment_status=['pending', 'paid'][serial % 2], **customer
+                ))
+                emails.append(OutboxEmail(
+                    to_email=user.email, subject='Plan', template='emails/payment_confirmed.html',
+                    status='sent' if serial % 10 else 'pending', next_attempt_at=now - timedelta(minutes=serial % 60),
+                ))
+        Appointment.objects.bulk_create(appointments)
+        WigOrder.objects.bulk_create(wig_orders)
+        ProductOrder.objects.bulk_create(product_orders)
+        OutboxEmail.objects.bulk_create(emails)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        busiest_day = timezone.localdate(appointments[0].appointment_date)
+        return service, shop, users[0], busiest_day
+
+    def _run(self, options):
+        service, shop, user, day = self._seed(options)
+        tables = set(connection.introspection.table_names())
+        failures = []
+        for label, run in hot_queries(service, shop, user, day):
+            with CaptureQueriesContext(connection) as queries:
+                run()
+            started = clock.perf_counter()
+            for _ in range(options['repeat']):
+                run()
+            elapsed = (clock.perf_counter() - started) / options['repeat'] * 1000
+
+            scans = set()
+            for query in queries:
+                plan = explain(query['sql'])
+                scans.update(full_scans(plan, tables))
+                if options['verbose_plans']:
+                    self.stdout.write(f"-- {label}\n{plan}")
+            if scans:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(
+                    f"{label:<28} {elapsed:7.2f}ms  FULL SCAN of {', '.join(sorted(scans))}"
+                ))
+            else:
+                self.stdout.write(f"{label:<28} {elapsed:7.2f}ms  ok")
+        return failures
@@ -0,0 +1,100 @@
+import posixpath
+import re
+from collections import defaultdict
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from salon.cache import bump_catalog_version
+from salon.models import HairStyle, MediaBlob, SubService, Wig
+from salon.storage import content_storage
+
+IMAGE_MODELS = (SubService, HairStyle, Wig)
+DERIVATIVE_NAME = re.compile(r'\.w\d+(\.[0-9a-f]+)?\.\w+$')
+
+
+class Command(BaseCommand):
+    help = (
+        "Move catalog images to content-hash names, point every row at the single "
+        "copy, delete the duplicates and rebuild the media reference counts. "
+        "Run it while no images are being uploaded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without touching anything")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = content_storage
+
+        references = defaultdict(list)  # stored name -> [(model, pk)]
+        directories = set()
+        for model in IMAGE_MODELS:
+            directories.add(model._meta.get_field('image').upload_to)
+            for pk, name in model.objects.exclude(image='').exclude(image__isnull=True).values_list('pk', 'image'):
+                references[name].append((model, pk))
+
+        groups = defaultdict(list)  # hashed name -> files with that content
+        for directory in sorted(directories):
+            if not storage.exists(directory):
+                continue
+            for filename in storage.listdir(directory)[1]:
+                if DERIVATIVE_NAME.search(filename):
+                    continue
+                name = posixpath.join(directory, filename)
+                with storage.open(name, 'rb') as handle:
+                    hashed = storage.hashed_name(name, handle)
+                groups[hashed].append(name)
+
+        rewritten = removed = reclaimed = 0
+        for hashed, names in sorted(groups.items()):
+            referenced = [name for name in names if name in references]
+            if not referenced and len(names) == 1:
+                continue  # a lone file nothing points at: not ours to judge
+
+            if not dry_run and not storage.exists(hashed):
+                with storage.open(names[0], 'rb') as handle:
+                    storage.replace(hashed, handle)
+            for name in referenced:
+                if name == hashed:
+                    continue
+                for model, pk in references[name]:
+                    if not dry_run:
+                        model.objects.filter(pk=pk).update(image=hashed)
+                    rewritten += 1
+            for name in names:
+                if name == hashed:
+                    continue
+                reclaimed += storage.size(name)
+                removed += 1
+                if not dry_run:
+                    storage.remove_with_derivatives(name)
+
+        if dry_run:
+            self.stdout.write(f"Would rewrite {rewritten} rows and delete {removed} files ({reclaimed} bytes)")
+            return
+
+        blobs = self.rebuild_counts(storage)
+        # Rows were rewritten with update(), which sends no signals
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rewrote {rewritten} rows, deleted {removed} duplicate files ({reclaimed} bytes), "
+            f"{blobs} files referenced"
+        ))
+        # Renamed originals need derivatives under their new names
+        call_command('build_image_derivatives', stdout=self.stdout)
+
+    def rebuild_counts(self, storage):
+        counts = defaultdict(int)
+        for model in IMAGE_MODELS:
+            for name in model.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True):
+                counts[name] += 1
+        blobs = [
+            MediaBlob(name=name, size=storage.size(name), refcount=count)
+            for name, count in counts.items() if storage.exists(name)
+        ]
+        with transaction.atomic():
+            MediaBlob.objects.all().delete()
+            MediaBlob.objects.bulk_create(blobs)
+        return len(blobs)
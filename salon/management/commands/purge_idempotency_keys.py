@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from salon.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete expired idempotency keys"
+
+    def handle(self, *args, **options):
+        purged = IdempotencyKey.purge()
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} idempotency keys"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from salon.cache import bump_catalog_version
+from salon.models import HairStyle, SearchEntry, Service, SubService, Wig
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the catalog search index from the catalog tables, e.g. after "
+        "bulk update() calls that sent no signals"
+    )
+
+    def handle(self, *args, **options):
+        entries = [
+            SearchEntry(kind=model._meta.model_name, object_id=item.pk, **SearchEntry.values_for(item))
+            for model in (Service, SubService, HairStyle, Wig)
+            for item in self.catalog_items(model)
+        ]
+        with transaction.atomic():
+            SearchEntry.objects.all().delete()
+            SearchEntry.objects.bulk_create(entries)
+        # Cached search results were computed from the old index
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {len(entries)} catalog items"))
+
+    def catalog_items(self, model):
+        items = model.objects.only('pk', 'name', 'description', 'is_active')
+        if model is Service:
+            return items
+        return items.select_related('service').only(
+            'pk', 'name', 'description', 'is_active', 'service__is_active',
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from salon.models import StatusCounter
+
+
+class Command(BaseCommand):
+    help = "Rebuild the dashboard status counters from the appointment and order tables"
+
+    def handle(self, *args, **options):
+        rebuilt = StatusCounter.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} status counters"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from salon.models import StockSnapshot, SubService, Wig
+
+
+class Command(BaseCommand):
+    help = "Rebuild stock snapshots from the movement ledger and report items whose stock has drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sync-stock', action='store_true',
+            help="Overwrite drifted stock columns with the ledger's available balance",
+        )
+
+    def handle(self, *args, **options):
+        rebuilt = StockSnapshot.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} stock snapshots"))
+
+        available = {
+            (snapshot.item_kind, snapshot.item_id): snapshot.on_hand - snapshot.reserved
+            for snapshot in StockSnapshot.objects.all()
+        }
+        for model in (SubService, Wig):
+            for pk, stock in model.objects.values_list('pk', 'stock'):
+                balance = available.get((model.stock_kind, pk), 0)
+                if stock == balance:
+                    continue
+                self.stdout.write(self.style.WARNING(
+                    f"{model.stock_kind} {pk}: stock column {stock}, ledger {balance}"
+                ))
+                if options['sync_stock']:
+                    with transaction.atomic():
+                        model.objects.filter(pk=pk).update(stock=max(balance, 0))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from salon.utils import dispatch_outbox
+
+
+class Command(BaseCommand):
+    help = "Render and send queued outbox emails"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of draining once')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            while dispatch_outbox(options['batch_size']) == options['batch_size']:
+                pass
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,83 @@
+import threading
+import time as clock
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from salon.models import Appointment, Service, SubService
+from salon.utils import save_appointment_if_free
+
+
+def run_concurrent_bookings(services, day, threads_per_slot, slots_per_service):
+    """Race `threads_per_slot` bookings for each slot of each service.
+
+    Returns (attempts, booked, elapsed seconds).
+    """
+    tz = timezone.get_current_timezone()
+    jobs = []
+    for service in services:
+        subservice = service.subservices.first()
+        for n in range(slots_per_service):
+            start = timezone.make_aware(datetime.combine(day, time(hour=8)), tz) + timedelta(hours=n)
+            jobs.extend([(service, subservice, start)] * threads_per_slot)
+
+    booked = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(jobs))
+
+    def book(service, subservice, start):
+        try:
+            appointment = Appointment(
+                customer_name='Stress', customer_phone='0123456789',
+                customer_email='stress@example.com', service=service,
+                subservice=subservice, appointment_date=start,
+            )
+            barrier.wait()
+            if not save_appointment_if_free(appointment, subservice.duration)['conflict']:
+                with lock:
+                    booked.append(appointment.pk)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=book, args=job) for job in jobs]
+    started = clock.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(jobs), len(booked), clock.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Race concurrent bookings against the booking lock and report throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', type=int, default=4)
+        parser.add_argument('--slots', type=int, default=4, help='Slots raced per service')
+        parser.add_argument('--threads', type=int, default=5, help='Concurrent requests per slot')
+
+    def handle(self, *args, **options):
+        services = []
+        for n in range(options['services']):
+            service = Service.objects.create(name=f'Stress {n}', description='', service_type='booking')
+            SubService.objects.create(service=service, name='Slot', price=10, duration=timedelta(minutes=45))
+            services.append(service)
+
+        try:
+            day = timezone.localdate() + timedelta(days=1)
+            attempts, booked, elapsed = run_concurrent_bookings(
+                services, day, options['threads'], options['slots']
+            )
+            double_booked = Appointment.objects.filter(service__in=services).values(
+                'service', 'appointment_date'
+            ).annotate(n=Count('id')).filter(n__gt=1).count()
+
+            self.stdout.write(
+                f"attempts={attempts} booked={booked} double_booked={double_booked} "
+                f"elapsed={elapsed:.2f}s throughput={attempts / elapsed:.1f} req/s"
+            )
+        finally:
+            Service.objects.filter(pk__in=[s.pk for s in services]).delete()
@@ -0,0 +1,20 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+class _Rollback(Exception):
+    """Raised to unwind transaction.atomic() without an error reaching the caller"""
+
+
+@contextmanager
+def rolled_back():
+    """Run the block, typically seeding benchmark data, in a transaction
+    that is always rolled back
+    """
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback()
+    except _Rollback:
+        pass
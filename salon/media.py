@@ -0,0 +1,162 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# Content-hash names from ContentAddressedStorage, and their derivatives,
+# which also carry a hash of the encoder settings (salon.images)
+VERSIONED_NAME = re.compile(r'(^|/)[0-9a-f]{64}(\.w\d+\.[0-9a-f]{8})?\.\w+$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+MUTABLE_CACHE = 'public, max-age=3600'
+# Only worth precompressing: images are already compressed
+COMPRESSIBLE_TYPES = {'image/svg+xml', 'application/json', 'text/plain', 'text/css', 'text/javascript'}
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Read at most length bytes of an open file from its current position.
+
+    fileno() is passed through so gunicorn's file wrapper can still hand
+    the range to sendfile(), which sends Content-Length bytes from there.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+        self.name = file.name
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def media_etag(path, stat):
+    """The content hash for versioned names, else size and mtime"""
+    if VERSIONED_NAME.search(path):
+        return '"%s"' % posixpath.basename(path)
+    return '"%x-%x"' % (stat.st_size, stat.st_mtime_ns)
+
+
+def requested_range(request, size, etag, last_modified):
+    """(start, end) of a single satisfiable byte range, None for the whole
+    file, or False when the range cannot be satisfied
+    """
+    header = request.META.get('HTTP_RANGE', '')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        return None
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # multiple or malformed ranges: send the whole file
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        return None  # an invalid range is ignored, not unsatisfiable
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve an uploaded file with validators, byte ranges and long caching.
+
+    Responses stream from an open file, so under gunicorn the body goes
+    out through sendfile() rather than Python reads.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Invalid media path")
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404("Media file not found")
+    if not os.path.isfile(full_path):
+        raise Http404("Media file not found")
+
+    etag = media_etag(path, stat)
+    last_modified = int(stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': IMMUTABLE_CACHE if VERSIONED_NAME.search(path) else MUTABLE_CACHE,
+        'Accept-Ranges': 'bytes',
+    }
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    # Negotiate before the validators: a precompressed sibling is a different
+    # representation, so it carries its own ETag under the same Vary.
+    encoding = None
+    if content_type in COMPRESSIBLE_TYPES:
+        headers['Vary'] = 'Accept-Encoding'
+        accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if 'HTTP_RANGE' not in request.META:
+            for name, suffix in PRECOMPRESSED:
+                if name in accepted and os.path.isfile(full_path + suffix):
+                    encoding, full_path = name, full_path + suffix
+                    headers['ETag'] = '"%s-%s"' % (etag.strip('"'), suffix.lstrip('.'))
+                    break
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        fresh = headers['ETag'] in parse_etags(if_none_match) or if_none_match.strip() == '*'
+    else:
+        since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        fresh = since is not None and last_modified <= since
+    if fresh:
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    byte_range = requested_range(request, stat.st_size, etag, last_modified)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(RangeFile(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    for name, value in headers.items():
+        response[name] = value
+    return response
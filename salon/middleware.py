@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+
+from .db import primary_written, replica_configured, replica_reads_allowed
+
+REPLICA_PIN_SESSION_KEY = '_primary_until'
+
+
+class ReplicaReadsMiddleware:
+    """Route @replica_reads views to the replica, except for sessions that
+    wrote in the last REPLICA_PIN_SECONDS, so users always see their own
+    bookings and orders while the replica catches up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        reads_token = replica_reads_allowed.set(False)
+        written_token = primary_written.set(False)
+        try:
+            response = self.get_response(request)
+            if primary_written.get() and hasattr(request, 'session'):
+                request.session[REPLICA_PIN_SESSION_KEY] = time.time() + settings.REPLICA_PIN_SECONDS
+        finally:
+            replica_reads_allowed.reset(reads_token)
+            primary_written.reset(written_token)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(view_func, 'replica_reads', False) or not replica_configured():
+            return None
+        session = getattr(request, 'session', None)
+        if session is not None and session.get(REPLICA_PIN_SESSION_KEY, 0) > time.time():
+            return None
+        replica_reads_allowed.set(True)
+        return None
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.23 on 2026-10-17 09:12
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_blocked_until(apps, schema_editor):
+    Appointment = apps.get_model('salon', 'Appointment')
+    batch = []
+    for appointment in Appointment.objects.select_related('subservice').iterator(chunk_size=500):
+        if appointment.subservice and appointment.subservice.duration:
+            duration = appointment.subservice.duration
+        elif appointment.estimated_duration:
+            duration = appointment.estimated_duration
+        else:
+            duration = timedelta(minutes=60)
+        appointment.blocked_until = appointment.appointment_date + duration + timedelta(minutes=10)
+        batch.append(appointment)
+        if len(batch) >= 500:
+            Appointment.objects.bulk_update(batch, ['blocked_until'])
+            batch = []
+    if batch:
+        Appointment.objects.bulk_update(batch, ['blocked_until'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0013_alter_productorder_options_productorder_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='blocked_until',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_blocked_until, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appointment',
+            name='blocked_until',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['service', 'status', 'appointment_date', 'blocked_until'], name='appointment_span_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.23 on 2026-10-17 02:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0014_appointment_blocked_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('acquired_at', models.DateTimeField(blank=True, null=True)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_locks', to='salon.service')),
+            ],
+            options={
+                'verbose_name': 'Booking Lock',
+                'verbose_name_plural': 'Booking Locks',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bookinglock',
+            constraint=models.UniqueConstraint(fields=('service', 'date'), name='unique_booking_lock'),
+        ),
+    ]
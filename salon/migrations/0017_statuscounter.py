@@ -0,0 +1,55 @@
+# Generated by Django 4.2.23 on 2026-10-17 02:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_status_counters(apps, schema_editor):
+    StatusCounter = apps.get_model('salon', 'StatusCounter')
+    sources = [
+        ('appointment', apps.get_model('salon', 'Appointment'), 'service', 'status'),
+        ('wig_order', apps.get_model('salon', 'WigOrder'), 'wig__service', 'status'),
+        ('product_order', apps.get_model('salon', 'ProductOrder'), 'subservice__service', 'payment_status'),
+    ]
+    counters = []
+    for kind, model, service_lookup, status_field in sources:
+        rows = (
+            model.objects.filter(**{f'{service_lookup}__isnull': False})
+            .order_by()
+            .values_list(service_lookup, status_field)
+            .annotate(n=models.Count('pk'))
+        )
+        counters.extend(
+            StatusCounter(service_id=service_id, kind=kind, status=status, count=n)
+            for service_id, status, n in rows
+        )
+    StatusCounter.objects.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0016_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('appointment', 'Appointment'), ('wig_order', 'Wig Order'), ('product_order', 'Product Order')], max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_counters', to='salon.service')),
+            ],
+            options={
+                'verbose_name': 'Status Counter',
+                'verbose_name_plural': 'Status Counters',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='statuscounter',
+            constraint=models.UniqueConstraint(fields=('service', 'kind', 'status'), name='unique_status_counter'),
+        ),
+        migrations.RunPython(backfill_status_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.23 on 2026-10-17 02:59
+
+from django.db import migrations, models
+
+
+def open_stock_ledger(apps, schema_editor):
+    StockMovement = apps.get_model('salon', 'StockMovement')
+    movements = [
+        StockMovement(item_kind=item_kind, item_id=pk, kind='restock', quantity=stock, reference='opening')
+        for item_kind, model in (('subservice', 'SubService'), ('wig', 'Wig'))
+        for pk, stock in apps.get_model('salon', model).objects.filter(stock__gt=0).values_list('pk', 'stock')
+    ]
+    StockMovement.objects.bulk_create(movements)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0017_statuscounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_kind', models.CharField(choices=[('subservice', 'Sub Service'), ('wig', 'Wig')], max_length=20)),
+                ('item_id', models.PositiveIntegerField()),
+                ('kind', models.CharField(choices=[('reserve', 'Reserve'), ('commit', 'Commit'), ('release', 'Release'), ('restock', 'Restock')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('reference', models.CharField(blank=True, max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Stock Movement',
+                'verbose_name_plural': 'Stock Movements',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_kind', models.CharField(choices=[('subservice', 'Sub Service'), ('wig', 'Wig')], max_length=20)),
+                ('item_id', models.PositiveIntegerField()),
+                ('on_hand', models.IntegerField(default=0)),
+                ('reserved', models.IntegerField(default=0)),
+                ('last_movement_id', models.BigIntegerField(default=0)),
+                ('taken_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Stock Snapshot',
+                'verbose_name_plural': 'Stock Snapshots',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('item_kind', 'item_id'), name='unique_stock_snapshot'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['item_kind', 'item_id', 'id'], name='stock_movement_item_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['reference'], name='stock_movement_ref_idx'),
+        ),
+        migrations.RunPython(open_stock_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.23 on 2026-10-17 03:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+USER_EMAIL_INDEX = models.Index(fields=['email'], name='salon_user_email_idx')
+
+
+def add_user_email_index(apps, schema_editor):
+    # confirm_appointment matches customers to accounts by email
+    schema_editor.add_index(apps.get_model(settings.AUTH_USER_MODEL), USER_EMAIL_INDEX)
+
+
+def remove_user_email_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model(settings.AUTH_USER_MODEL), USER_EMAIL_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('salon', '0019_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'confirmed'])), fields=['service', 'appointment_date', 'blocked_until'], name='appointment_active_span_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['user', '-appointment_date'], name='appointment_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', '-appointment_date'], name='appointment_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productorder',
+            index=models.Index(fields=['user', '-created_at'], name='productorder_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productorder',
+            index=models.Index(fields=['-order_date'], name='productorder_order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productorder',
+            index=models.Index(fields=['payment_status', '-order_date'], name='productorder_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productorder',
+            index=models.Index(fields=['subservice', 'payment_status', '-order_date'], name='productorder_item_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wigorder',
+            index=models.Index(fields=['user', '-created_at'], name='wigorder_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wigorder',
+            index=models.Index(fields=['-order_date'], name='wigorder_order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wigorder',
+            index=models.Index(fields=['wig', 'status', '-order_date'], name='wigorder_wig_status_idx'),
+        ),
+        migrations.RunPython(add_user_email_index, remove_user_email_index),
+    ]
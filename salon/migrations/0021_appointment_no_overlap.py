@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# Kept out of the model state: exclusion constraints only exist on
+# PostgreSQL, and the app's booking lock already prevents overlaps on SQLite.
+# service_id is compared as a one-point range so the plain gist range
+# operator class covers both columns and btree_gist is not needed.
+ADD_CONSTRAINT = """
+ALTER TABLE salon_appointment ADD CONSTRAINT appointment_no_overlap
+    EXCLUDE USING gist (
+        int8range(service_id, service_id, '[]') WITH &&,
+        tstzrange(appointment_date, blocked_until, '[)') WITH &&
+    )
+    WHERE (status IN ('pending', 'confirmed'));
+"""
+
+DROP_CONSTRAINT = "ALTER TABLE salon_appointment DROP CONSTRAINT IF EXISTS appointment_no_overlap;"
+
+
+def add_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(ADD_CONSTRAINT)
+
+
+def drop_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0020_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_exclusion_constraint, drop_exclusion_constraint),
+    ]
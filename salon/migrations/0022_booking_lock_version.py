@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-17 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0021_appointment_no_overlap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookinglock',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
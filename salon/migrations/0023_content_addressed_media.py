@@ -0,0 +1,43 @@
+# Generated by Django 4.2.23 on 2026-10-17 03:24
+
+from django.db import migrations, models
+import salon.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0022_booking_lock_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Media Blob',
+                'verbose_name_plural': 'Media Blobs',
+            },
+        ),
+        migrations.AlterField(
+            model_name='hairstyle',
+            name='image',
+            field=models.ImageField(storage=salon.storage.catalog_image_storage, upload_to='hairstyles/'),
+        ),
+        migrations.AlterField(
+            model_name='subservice',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=salon.storage.catalog_image_storage, upload_to='subservices/'),
+        ),
+        migrations.AlterField(
+            model_name='wig',
+            name='image',
+            field=models.ImageField(storage=salon.storage.catalog_image_storage, upload_to='wigs/'),
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 4.2.23 on 2026-10-17 03:32
+
+import unicodedata
+
+from django.db import migrations, models
+
+# The indexes live outside the model state because each backend needs its
+# own. SQLite: an external-content FTS5 table over salon_searchentry, kept
+# in sync by triggers, with prefix indexes for two- and three-letter
+# prefixes. PostgreSQL: a generated tsvector column, titles weighted A and
+# bodies B, under a GIN index.
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE salon_searchentry_fts USING fts5(
+        title, body, content='salon_searchentry', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER salon_searchentry_fts_insert AFTER INSERT ON salon_searchentry BEGIN
+        INSERT INTO salon_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER salon_searchentry_fts_delete AFTER DELETE ON salon_searchentry BEGIN
+        INSERT INTO salon_searchentry_fts(salon_searchentry_fts, rowid, title, body)
+            VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER salon_searchentry_fts_update AFTER UPDATE ON salon_searchentry BEGIN
+        INSERT INTO salon_searchentry_fts(salon_searchentry_fts, rowid, title, body)
+            VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO salon_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS salon_searchentry_fts_insert",
+    "DROP TRIGGER IF EXISTS salon_searchentry_fts_delete",
+    "DROP TRIGGER IF EXISTS salon_searchentry_fts_update",
+    "DROP TABLE IF EXISTS salon_searchentry_fts",
+]
+POSTGRES_CREATE = [
+    """
+    ALTER TABLE salon_searchentry ADD COLUMN document tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english'::regconfig, title), 'A') ||
+        setweight(to_tsvector('english'::regconfig, body), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX salon_searchentry_document ON salon_searchentry USING gin (document)",
+]
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS salon_searchentry_document",
+    "ALTER TABLE salon_searchentry DROP COLUMN IF EXISTS document",
+]
+CATALOG_MODELS = ('Service', 'SubService', 'HairStyle', 'Wig')
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+def fold(text):
+    # SearchEntry.fold: entries are stored without accents
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+
+
+def index_catalog(apps, schema_editor):
+    SearchEntry = apps.get_model('salon', 'SearchEntry')
+    db = schema_editor.connection.alias
+    entries = []
+    for name in CATALOG_MODELS:
+        model = apps.get_model('salon', name)
+        for pk, title, body, is_active in model.objects.using(db).values_list('pk', 'name', 'description', 'is_active'):
+            entries.append(SearchEntry(
+                kind=name.lower(), object_id=pk, title=fold(title), body=fold(body or ''), is_active=is_active,
+            ))
+    SearchEntry.objects.using(db).bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0024_image_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('service', 'Service'), ('subservice', 'Sub Service'), ('hairstyle', 'Hair Style'), ('wig', 'Wig')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('body', models.TextField(blank=True)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name': 'Search Entry',
+                'verbose_name_plural': 'Search Entries',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='search_entry_unique_item'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(index_catalog, migrations.RunPython.noop),
+    ]
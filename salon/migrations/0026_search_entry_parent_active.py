@@ -0,0 +1,24 @@
+from django.db import migrations
+
+CHILD_MODELS = ('SubService', 'HairStyle', 'Wig')
+
+
+def deactivate_children_of_inactive_services(apps, schema_editor):
+    # SearchEntry.values_for: items of an inactive service are indexed as inactive
+    SearchEntry = apps.get_model('salon', 'SearchEntry')
+    db = schema_editor.connection.alias
+    for name in CHILD_MODELS:
+        model = apps.get_model('salon', name)
+        hidden = model.objects.using(db).filter(service__is_active=False).values('pk')
+        SearchEntry.objects.using(db).filter(kind=name.lower(), object_id__in=hidden).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0025_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_children_of_inactive_services, migrations.RunPython.noop),
+    ]
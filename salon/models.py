@@ -1,11 +1,14 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.core.validators import RegexValidator
 from datetime import datetime, timedelta
+import unicodedata
 from django.contrib.auth import get_user_model
 from django.conf import settings
 
+from .storage import catalog_image_storage
+
 class Service(models.Model):
     SERVICE_TYPES = [
         ('booking', 'Booking Service (Appointments)'),
@@ -35,11 +38,302 @@ class Service(models.Model):
         return self.service_type == 'order'
 
 
-class SubService(models.Model):
+STOCK_SNAPSHOT_EVERY = 100
+
+
+class StockedModel(models.Model):
+    """Catalog item whose ``stock`` column is taken by orders.
+
+    Stock only moves through single conditional UPDATEs so concurrent
+    checkouts can never oversell or overwrite each other's rows. Every
+    change is also appended to the StockMovement ledger. Saves of existing
+    rows never write ``stock``: an edited value (the admin) is applied as
+    a delta from the stock the instance was loaded with, and recorded as a
+    restock.
+    """
+    stock_kind = None
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stock_loaded = instance.__dict__.get('stock')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or kwargs.get('force_insert'):
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                if self.stock:
+                    StockMovement.record(self, 'restock', self.stock)
+                self._stock_loaded = self.stock
+            return
+
+        loaded = getattr(self, '_stock_loaded', None)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.get_deferred_fields()
+            ]
+        kwargs['update_fields'] = [name for name in update_fields if name != 'stock']
+        delta = self.stock - loaded if loaded is not None and self.stock is not None else 0
+        with transaction.atomic():
+            if kwargs['update_fields']:
+                super().save(*args, **kwargs)
+            if delta:
+                self.restock(delta)
+
+    def restock(self, delta):
+        """Add delta units (negative for a write-off) on top of whatever
+        concurrent orders have left, and record it in the ledger
+        """
+        with transaction.atomic():
+            items = type(self).objects.filter(pk=self.pk)
+            if delta < 0:
+                items = items.filter(stock__gte=-delta)
+            if not items.update(stock=models.F('stock') + delta):
+                raise ValidationError(f"Cannot remove {-delta} units: not that many are in stock.")
+            StockMovement.record(self, 'restock', delta)
+        self.stock = type(self).objects.filter(pk=self.pk).values_list('stock', flat=True).get()
+        self._stock_loaded = self.stock
+
+    @classmethod
+    def take_stock(cls, pk, quantity):
+        """Decrement stock unless fewer than quantity units remain"""
+        return cls.objects.filter(pk=pk, stock__gte=quantity).update(
+            stock=models.F('stock') - quantity
+        ) == 1
+
+    @classmethod
+    def take_stock_many(cls, quantities):
+        """Take several {pk: quantity} lines in one UPDATE, all or nothing"""
+        with transaction.atomic():
+            taken = cls.objects.filter(
+                models.Q(*[models.Q(pk=pk, stock__gte=quantity) for pk, quantity in quantities.items()],
+                         _connector=models.Q.OR)
+            ).update(stock=models.F('stock') - models.Case(
+                *[models.When(pk=pk, then=models.Value(quantity)) for pk, quantity in quantities.items()],
+                output_field=models.IntegerField(),
+            ))
+            if taken != len(quantities):
+                transaction.set_rollback(True)
+                return False
+        return True
+
+    @classmethod
+    def return_stock(cls, pk, quantity):
+        """Put quantity units back on the shelf"""
+        cls.objects.filter(pk=pk).update(stock=models.F('stock') + quantity)
+
+    def stock_balance(self):
+        """On-hand, reserved and available units according to the ledger"""
+        return StockSnapshot.balance(self.stock_kind, self.pk)
+
+
+class StockMovement(models.Model):
+    """Append-only ledger of stock changes for sub services and wigs.
+
+    reserve holds units for an order, commit turns a reservation into a
+    sale, release hands a reservation back and restock changes what is on
+    the shelf (negative for write-offs).
+    """
+    ITEM_CHOICES = [
+        ('subservice', 'Sub Service'),
+        ('wig', 'Wig'),
+    ]
+    KIND_CHOICES = [
+        ('reserve', 'Reserve'),
+        ('commit', 'Commit'),
+        ('release', 'Release'),
+        ('restock', 'Restock'),
+    ]
+    ON_HAND_EFFECT = {'restock': 1, 'commit': -1}
+    RESERVED_EFFECT = {'reserve': 1, 'commit': -1, 'release': -1}
+
+    item_kind = models.CharField(max_length=20, choices=ITEM_CHOICES)
+    item_id = models.PositiveIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quantity = models.IntegerField()
+    reference = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Stock Movement"
+        verbose_name_plural = "Stock Movements"
+        indexes = [
+            models.Index(fields=['item_kind', 'item_id', 'id'], name='stock_movement_item_idx'),
+            models.Index(fields=['reference'], name='stock_movement_ref_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_kind} {self.item_id} {self.kind} {self.quantity}"
+
+    @staticmethod
+    def order_reference(order):
+        return f"{order._meta.model_name}:{order.pk}"
+
+    @classmethod
+    def record(cls, item, kind, quantity, order=None):
+        return cls.objects.create(
+            item_kind=item.stock_kind, item_id=item.pk, kind=kind, quantity=quantity,
+            reference=cls.order_reference(order) if order is not None else '',
+        )
+
+    @classmethod
+    def fold(cls, rows):
+        """(on_hand, reserved) from (kind, quantity) sums"""
+        on_hand = reserved = 0
+        for kind, quantity in rows:
+            on_hand += cls.ON_HAND_EFFECT.get(kind, 0) * quantity
+            reserved += cls.RESERVED_EFFECT.get(kind, 0) * quantity
+        return on_hand, reserved
+
+    @classmethod
+    def totals(cls, movements):
+        """(on_hand, reserved, count, last_id) of a movement queryset in one query"""
+        rows = list(
+            movements.order_by().values_list('kind')
+            .annotate(quantity=models.Sum('quantity'), n=models.Count('id'), last_id=models.Max('id'))
+        )
+        on_hand, reserved = cls.fold((kind, quantity) for kind, quantity, _, _ in rows)
+        count = sum(n for _, _, n, _ in rows)
+        last_id = max((last_id for _, _, _, last_id in rows), default=None)
+        return on_hand, reserved, count, last_id
+
+    @classmethod
+    def settle(cls, order, kind):
+        """Commit or release whatever the order still has reserved.
+
+        Releasing also puts back, as a restock, units the order already
+        committed (a confirmed order being cancelled) and, for orders whose
+        model took stock before the ledger existed, the quantity of an
+        order with no ledger rows. Callers release an order at most once.
+        Returns the units committed or put back.
+        """
+        item = order.stock_item
+        if item is None:
+            return 0
+        with transaction.atomic():
+            on_hand, outstanding, count, _ = cls.totals(cls.objects.filter(reference=cls.order_reference(order)))
+            if outstanding > 0:
+                cls.record(item, kind, outstanding, order)
+            if kind != 'release':
+                return outstanding
+            sold = -on_hand
+            if not count and order.stock_taken_before_ledger:
+                sold = order.quantity
+            if sold > 0:
+                cls.record(item, 'restock', sold, order)
+            returned = max(outstanding, 0) + max(sold, 0)
+            if returned:
+                type(item).return_stock(item.pk, returned)
+        return returned
+
+
+class StockSnapshot(models.Model):
+    """Ledger balance of one item up to and including last_movement_id"""
+    item_kind = models.CharField(max_length=20, choices=StockMovement.ITEM_CHOICES)
+    item_id = models.PositiveIntegerField()
+    on_hand = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0)
+    last_movement_id = models.BigIntegerField(default=0)
+    taken_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Stock Snapshot"
+        verbose_name_plural = "Stock Snapshots"
+        constraints = [
+            models.UniqueConstraint(fields=['item_kind', 'item_id'], name='unique_stock_snapshot'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_kind} {self.item_id}: {self.on_hand} on hand, {self.reserved} reserved"
+
+    @classmethod
+    def balance(cls, item_kind, item_id):
+        """Snapshot plus the movements after it.
+
+        Once the tail grows past STOCK_SNAPSHOT_EVERY movements it is
+        folded into a fresh snapshot so later reads stay short.
+        """
+        snapshot = cls.objects.filter(item_kind=item_kind, item_id=item_id).first()
+        if snapshot is None:
+            snapshot = cls(item_kind=item_kind, item_id=item_id)
+        on_hand, reserved, count, last_id = StockMovement.totals(StockMovement.objects.filter(
+            item_kind=item_kind, item_id=item_id, id__gt=snapshot.last_movement_id,
+        ))
+        snapshot.on_hand += on_hand
+        snapshot.reserved += reserved
+        if count >= STOCK_SNAPSHOT_EVERY:
+            snapshot.last_movement_id = last_id
+            cls.objects.update_or_create(
+                item_kind=item_kind, item_id=item_id,
+                defaults={'on_hand': snapshot.on_hand, 'reserved': snapshot.reserved, 'last_movement_id': last_id},
+            )
+        return {
+            'on_hand': snapshot.on_hand,
+            'reserved': snapshot.reserved,
+            'available': snapshot.on_hand - snapshot.reserved,
+        }
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every snapshot from the full ledger"""
+        rows = (
+            StockMovement.objects.order_by().values_list('item_kind', 'item_id', 'kind')
+            .annotate(quantity=models.Sum('quantity'), last_id=models.Max('id'))
+        )
+        items = {}
+        for item_kind, item_id, kind, quantity, last_id in rows:
+            item = items.setdefault((item_kind, item_id), ([], []))
+            item[0].append((kind, quantity))
+            item[1].append(last_id)
+        snapshots = []
+        for (item_kind, item_id), (sums, last_ids) in items.items():
+            on_hand, reserved = StockMovement.fold(sums)
+            snapshots.append(cls(
+                item_kind=item_kind, item_id=item_id, on_hand=on_hand, reserved=reserved,
+                last_movement_id=max(last_ids),
+            ))
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(snapshots)
+        return len(snapshots)
+
+
+class CatalogImageModel(models.Model):
+    """Catalog item whose ``image`` is described by stored fields.
+
+    Dimensions, dominant colour and a blur placeholder are computed once
+    when the image is saved (salon.images), so rendering never opens it.
+    """
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_color = models.CharField(max_length=7, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The name the stored metadata describes, to spot a replaced image
+        instance._image_loaded = instance.__dict__.get('image')
+        return instance
+
+
+class SubService(StockedModel, CatalogImageModel):
+    stock_kind = 'subservice'
+
     service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='subservices')
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    image = models.ImageField(upload_to='subservices/', null=True, blank=True)
+    image = models.ImageField(upload_to='subservices/', storage=catalog_image_storage, null=True, blank=True)
     price = models.DecimalField(max_digits=8, decimal_places=2)
 
     # For appointment services
@@ -75,11 +369,11 @@ class SubService(models.Model):
             raise ValidationError("Duration is required for booking services")
 
 
-class HairStyle(models.Model):
+class HairStyle(CatalogImageModel):
     service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name="hairstyles", limit_choices_to={'service_type': 'booking'})                            
     name = models.CharField(max_length=100)
     description = models.TextField()
-    image = models.ImageField(upload_to='hairstyles/')
+    image = models.ImageField(upload_to='hairstyles/', storage=catalog_image_storage)
     is_active = models.BooleanField(default=True)
 
     class Meta:
@@ -90,7 +384,9 @@ class HairStyle(models.Model):
         return self.name
 
 
-class Wig(models.Model):
+class Wig(StockedModel, CatalogImageModel):
+    stock_kind = 'wig'
+
     service = models.ForeignKey(
         Service,
         on_delete=models.CASCADE,
@@ -100,7 +396,7 @@ class Wig(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     price = models.DecimalField(max_digits=8, decimal_places=2)
-    image = models.ImageField(upload_to='wigs/')
+    image = models.ImageField(upload_to='wigs/', storage=catalog_image_storage)
     stock = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
 
@@ -117,44 +413,266 @@ class Wig(models.Model):
 
     def reduce_stock(self, quantity):
         """Reduce stock by given quantity"""
-        if quantity > self.stock:
+        with transaction.atomic():
+            taken = Wig.take_stock(self.pk, quantity)
+            if taken:
+                StockMovement.record(self, 'restock', -quantity)
+        self.refresh_from_db(fields=['stock'])
+        self._stock_loaded = self.stock
+        if not taken:
             raise ValidationError(f"Not enough stock. Only {self.stock} available.")
-        self.stock -= quantity
-        self.save()
 
 
 class AppointmentManager(models.Manager):
     def get_available_slots(self, service, date, subservice=None):
-        from .utils import calculate_duration  # Import here to avoid circular imports
-        
-        start_of_day = datetime.combine(date, datetime.min.time()).replace(hour=8)
-        end_of_day = datetime.combine(date, datetime.min.time()).replace(hour=20)
-
-        duration = calculate_duration(subservice)
-        buffer_time = timedelta(minutes=10)
+        """Return the free slot starts for one service on one day.
 
-        slots = []
-        current = start_of_day
-        while current + duration <= end_of_day:
-            slot_end = current + duration + buffer_time
+        The day's active appointments are loaded once and swept as sorted
+        intervals instead of probing the database for every 15-minute step.
+        """
+        from .utils import (  # Import here to avoid circular imports
+            calculate_duration, get_busy_intervals, sweep_free_slots, opening_hours,
+        )
 
-            overlap = Appointment.objects.filter(
-                service=service,
-                status__in=["pending", "confirmed"],
-                appointment_date__lt=slot_end,
-            ).exclude(
-                appointment_date__gte=current + duration
-            ).exists()
+        start_of_day, end_of_day = opening_hours(date)
+        duration = calculate_duration(subservice)
+        intervals = get_busy_intervals(service, start_of_day, end_of_day)
+        return sweep_free_slots(start_of_day, end_of_day, duration, intervals)
+
+    def get_availability_calendar(self, service, start_date, days, subservices):
+        """Return {date: {subservice: slots}} for a window of days.
+
+        Appointments for the whole window are loaded in one query and reused
+        for every day and subservice.
+        """
+        from .utils import (
+            calculate_duration, get_busy_intervals, sweep_free_slots, opening_hours,
+            APPOINTMENT_BUFFER,
+        )
+
+        dates = [start_date + timedelta(days=offset) for offset in range(days)]
+        window_start = opening_hours(dates[0])[0]
+        window_end = opening_hours(dates[-1])[1]
+        intervals = get_busy_intervals(service, window_start, window_end)
+
+        calendar = {}
+        for day in dates:
+            start_of_day, end_of_day = opening_hours(day)
+            day_intervals = [
+                (start, end) for start, end in intervals
+                if end > start_of_day and start < end_of_day + APPOINTMENT_BUFFER
+            ]
+            calendar[day] = {
+                sub: sweep_free_slots(start_of_day, end_of_day, calculate_duration(sub), day_intervals)
+                for sub in subservices
+            }
+        return calendar
+
+
+class StatusCounter(models.Model):
+    """Running count of rows per (service, kind, status) for the dashboard"""
+    KIND_CHOICES = [
+        ('appointment', 'Appointment'),
+        ('wig_order', 'Wig Order'),
+        ('product_order', 'Product Order'),
+    ]
 
-            if not overlap:
-                slots.append(current)
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='status_counters')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
 
-            current += timedelta(minutes=15)
+    class Meta:
+        verbose_name = "Status Counter"
+        verbose_name_plural = "Status Counters"
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'kind', 'status'], name='unique_status_counter'),
+        ]
 
-        return slots
+    def __str__(self):
+        return f"{self.service_id} {self.kind} {self.status}: {self.count}"
+
+    @classmethod
+    def adjust(cls, service_id, kind, status, delta):
+        """Atomically add `delta` to one counter, creating it if needed"""
+        counters = cls.objects.filter(service_id=service_id, kind=kind, status=status)
+        if counters.update(count=models.F('count') + delta):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(service_id=service_id, kind=kind, status=status, count=delta)
+        except IntegrityError:
+            counters.update(count=models.F('count') + delta)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every counter from the source tables"""
+        counters = []
+        for model in (Appointment, WigOrder, ProductOrder):
+            rows = (
+                model.objects.filter(**{f'{model.counter_service_lookup}__isnull': False})
+                .order_by()
+                .values_list(model.counter_service_lookup, model.counter_status_field)
+                .annotate(n=models.Count('pk'))
+            )
+            counters.extend(
+                cls(service_id=service_id, kind=model.counter_kind, status=status, count=n)
+                for service_id, status, n in rows
+            )
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(counters)
+        return len(counters)
+
+    @classmethod
+    def for_services(cls, services):
+        """Return {service_id: {kind: {status: count}}} in one query"""
+        summary = {}
+        for service_id, kind, status, count in cls.objects.filter(
+            service__in=services
+        ).values_list('service_id', 'kind', 'status', 'count'):
+            summary.setdefault(service_id, {}).setdefault(kind, {})[status] = count
+        return summary
+
+
+class StatusCountedModel(models.Model):
+    """Keeps StatusCounter rows in step with the row's service and status.
+
+    Subclasses set counter_kind, counter_owner_field (the FK attname leading
+    to the service), counter_service_lookup (the ORM path to the service) and
+    counter_status_field.
+    """
+    counter_kind = None
+    counter_owner_field = 'service_id'
+    counter_service_lookup = 'service'
+    counter_status_field = 'status'
 
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counter_loaded = instance._counter_values()
+        return instance
+
+    def _counter_values(self):
+        # Read from __dict__ so deferred fields are never loaded here
+        return (self.__dict__.get(self.counter_owner_field), self.__dict__.get(self.counter_status_field))
+
+    def counter_service_id(self, owner_id):
+        """Map the owner FK value to a service id"""
+        return owner_id
+
+    def _shift_counter(self, values, delta):
+        owner_id, status = values
+        if owner_id is None or status is None:
+            return
+        service_id = self.counter_service_id(owner_id)
+        if service_id is not None:
+            StatusCounter.adjust(service_id, self.counter_kind, status, delta)
 
-class Appointment(models.Model):
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            loaded = getattr(self, '_counter_loaded', (None, None))
+            current = self._counter_values()
+            if loaded != current:
+                self._shift_counter(loaded, -1)
+                self._shift_counter(current, 1)
+            self._counter_loaded = current
+
+    def transition(self, from_statuses, status):
+        """Move this row to status if it is still in one of from_statuses.
+
+        The UPDATE is conditional on the status this instance read, so when
+        two requests race for the same transition only one of them makes
+        it. Returns whether this one did.
+        """
+        field = self.counter_status_field
+        current = getattr(self, field)
+        if current not in from_statuses:
+            return False
+        with transaction.atomic():
+            if not type(self).objects.filter(pk=self.pk, **{field: current}).update(**{field: status}):
+                return False
+            setattr(self, field, status)
+            owner_id, _ = getattr(self, '_counter_loaded', self._counter_values())
+            self._shift_counter((owner_id, current), -1)
+            self._shift_counter((owner_id, status), 1)
+            self._counter_loaded = self._counter_values()
+        return True
+
+    @classmethod
+    def before_status_update(cls, queryset, status):
+        """Called by update_status() with the rows about to change"""
+
+    @classmethod
+    def bulk_create_counted(cls, objs):
+        """bulk_create() that also adds the new rows to the counters"""
+        with transaction.atomic():
+            objs = cls.objects.bulk_create(objs)
+            groups = {}
+            for obj in objs:
+                obj._counter_loaded = obj._counter_values()
+                groups.setdefault(obj._counter_loaded, []).append(obj)
+            for values, group in groups.items():
+                group[0]._shift_counter(values, len(group))
+        return objs
+
+
+def uncount_deleted_row(sender, instance, **kwargs):
+    """pre_delete receiver for StatusCountedModel subclasses.
+
+    A receiver rather than delete(): once one is connected Django sends it
+    for every row, so queryset.delete(), the admin's bulk delete and
+    cascades are all counted.
+    """
+    instance._shift_counter(getattr(instance, '_counter_loaded', instance._counter_values()), -1)
+
+
+def uncount_detached_product_orders(sender, instance, **kwargs):
+    """pre_delete receiver for SubService: its product orders are kept with
+    subservice set to NULL, which leaves them out of every counter
+    """
+    rows = (
+        ProductOrder.objects.filter(subservice=instance).order_by()
+        .values_list(ProductOrder.counter_status_field).annotate(n=models.Count('pk'))
+    )
+    for status, n in rows:
+        StatusCounter.adjust(instance.service_id, ProductOrder.counter_kind, status, -n)
+
+
+def touch_deleted_appointment(sender, instance, **kwargs):
+    """pre_delete receiver for Appointment: frees the slot's days, whichever
+    path (delete(), queryset.delete(), a cascade) removes the row
+    """
+    values = getattr(instance, '_availability_loaded', instance._availability_values())
+    BookingLock.touch(Appointment._availability_days(values))
+
+
+def update_status(queryset, status):
+    """queryset.update() of the status field that also moves the counters"""
+    model = queryset.model
+    status_field = model.counter_status_field
+
+    with transaction.atomic():
+        model.before_status_update(queryset, status)
+        moving = (
+            queryset.exclude(**{status_field: status})
+            .order_by()
+            .values_list(model.counter_service_lookup, status_field)
+            .annotate(n=models.Count('pk'))
+        )
+        for service_id, old_status, n in moving:
+            if service_id is None:
+                continue
+            StatusCounter.adjust(service_id, model.counter_kind, old_status, -n)
+            StatusCounter.adjust(service_id, model.counter_kind, status, n)
+        return queryset.update(**{status_field: status})
+
+
+class Appointment(StatusCountedModel):
     PAYMENT_METHOD_CHOICES = [
         ('cash', 'Cash on Delivery'),
         ('momo', 'Mobile Money'),
@@ -225,12 +743,31 @@ class Appointment(models.Model):
     cancellation_reason = models.TextField(blank=True, null=True)
     cancelled_at = models.DateTimeField(blank=True, null=True)
 
+    # Denormalized end of the slot (start + duration + buffer) for range queries
+    blocked_until = models.DateTimeField(editable=False)
+
     objects = AppointmentManager()
 
+    counter_kind = 'appointment'
+
     class Meta:
         ordering = ['-appointment_date']
         verbose_name = "Appointment"
         verbose_name_plural = "Appointments"
+        indexes = [
+            models.Index(
+                fields=['service', 'status', 'appointment_date', 'blocked_until'],
+                name='appointment_span_idx',
+            ),
+            # Availability and conflict checks only look at slots still taken
+            models.Index(
+                fields=['service', 'appointment_date', 'blocked_until'],
+                condition=models.Q(status__in=['pending', 'confirmed']),
+                name='appointment_active_span_idx',
+            ),
+            models.Index(fields=['user', '-appointment_date'], name='appointment_user_date_idx'),
+            models.Index(fields=['status', '-appointment_date'], name='appointment_status_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.customer_name} - {self.service.name} - {self.appointment_date}"
@@ -256,6 +793,42 @@ class Appointment(models.Model):
         from .utils import calculate_duration
         return calculate_duration(self.subservice, self.estimated_duration)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._availability_loaded = instance._availability_values()
+        return instance
+
+    def _availability_values(self):
+        return tuple(self.__dict__.get(name) for name in ('service_id', 'status', 'appointment_date', 'blocked_until'))
+
+    @staticmethod
+    def _availability_days(values):
+        service_id, _, start, end = values
+        if service_id is None or start is None:
+            return set()
+        return {(service_id, timezone.localdate(moment)) for moment in (start, end) if moment is not None}
+
+    def save(self, *args, **kwargs):
+        from .utils import APPOINTMENT_BUFFER
+        if self.appointment_date:
+            self.blocked_until = self.appointment_date + self.get_duration() + APPOINTMENT_BUFFER
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'blocked_until' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['blocked_until']
+        loaded = getattr(self, '_availability_loaded', (None, None, None, None))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            current = self._availability_values()
+            if loaded != current:
+                BookingLock.touch(self._availability_days(loaded) | self._availability_days(current))
+            self._availability_loaded = current
+
+    @classmethod
+    def before_status_update(cls, queryset, status):
+        changing = queryset.exclude(status=status).values_list('service_id', 'status', 'appointment_date', 'blocked_until')
+        BookingLock.touch(set().union(*(cls._availability_days(values) for values in changing)))
+
     def clean(self):
         """Validate appointment data"""
         from .utils import validate_appointment_time, check_time_conflict        
@@ -310,7 +883,64 @@ class Appointment(models.Model):
         self.save()
 
 
-class WigOrder(models.Model):
+class BookingLock(models.Model):
+    """Lock row serializing bookings for one service on one day.
+
+    version is bumped whenever an appointment on that day changes, and
+    serves as the day's availability ETag.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='booking_locks')
+    date = models.DateField()
+    acquired_at = models.DateTimeField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Booking Lock"
+        verbose_name_plural = "Booking Locks"
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'date'], name='unique_booking_lock'),
+        ]
+
+    def __str__(self):
+        return f"{self.service} - {self.date}"
+
+    @classmethod
+    def acquire(cls, service, date):
+        """Lock the (service, date) row until the current transaction ends.
+
+        The lock is taken by writing to the row: on PostgreSQL this is a row
+        lock like select_for_update(), and on SQLite (where select_for_update
+        is a no-op) the write takes the database write lock up front so the
+        following conflict check cannot read stale data.
+        """
+        if cls.objects.filter(service=service, date=date).update(acquired_at=timezone.now()):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(service=service, date=date)
+        except IntegrityError:
+            pass
+        cls.objects.filter(service=service, date=date).update(acquired_at=timezone.now())
+
+    @classmethod
+    def touch(cls, days):
+        """Bump the version of every (service_id, date) in days"""
+        by_service = {}
+        for service_id, day in days:
+            by_service.setdefault(service_id, set()).add(day)
+        for service_id, dates in by_service.items():
+            bumped = cls.objects.filter(service_id=service_id, date__in=dates).update(
+                version=models.F('version') + 1
+            )
+            if bumped < len(dates):
+                # Rows that already existed were bumped above and are skipped here
+                cls.objects.bulk_create(
+                    [cls(service_id=service_id, date=day, version=1) for day in dates],
+                    ignore_conflicts=True,
+                )
+
+
+class WigOrder(StatusCountedModel):
     PAYMENT_METHOD_CHOICES = [
         ('cash', 'Cash on Delivery'),
         ('momo', 'Mobile Money'),
@@ -370,10 +1000,23 @@ class WigOrder(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    CANCELLABLE_STATUSES = ('pending', 'confirmed')
+
+    counter_kind = 'wig_order'
+    counter_owner_field = 'wig_id'
+    counter_service_lookup = 'wig__service'
+    # Wig orders only took stock once the ledger existed
+    stock_taken_before_ledger = False
+
     class Meta:
         ordering = ['-order_date']
         verbose_name = "Wig Order"
         verbose_name_plural = "Wig Orders"
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='wigorder_user_created_idx'),
+            models.Index(fields=['-order_date'], name='wigorder_order_date_idx'),
+            models.Index(fields=['wig', 'status', '-order_date'], name='wigorder_wig_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.customer_name} - {self.wig.name} - {self.quantity}"
@@ -382,27 +1025,37 @@ class WigOrder(models.Model):
         self.total_price = self.wig.price * self.quantity
         super().save(*args, **kwargs)
 
+    def counter_service_id(self, owner_id):
+        if owner_id == self.wig_id:
+            return self.wig.service_id
+        return Wig.objects.filter(pk=owner_id).values_list('service_id', flat=True).first()
+
+    @property
+    def stock_item(self):
+        return self.wig
+
     @property
     def can_be_cancelled(self):
         """Check if order can be cancelled"""
-        return self.status in ['pending', 'confirmed']
+        return self.status in self.CANCELLABLE_STATUSES
 
     def cancel(self):
-        """Cancel the order"""
-        if self.can_be_cancelled:
-            self.status = 'cancelled'
-            self.save()
-        else:
-            raise ValidationError("Order cannot be cancelled in its current status")
+        """Cancel the order and put its wig back in stock, confirmed or not"""
+        with transaction.atomic():
+            if not self.transition(self.CANCELLABLE_STATUSES, 'cancelled'):
+                raise ValidationError("Order cannot be cancelled in its current status")
+            StockMovement.settle(self, 'release')
 
     def confirm(self):
         """Confirm the order"""
-        self.status = 'confirmed'
-        self.payment_confirmed = True
-        self.save()
+        with transaction.atomic():
+            self.status = 'confirmed'
+            self.payment_confirmed = True
+            self.save()
+            StockMovement.settle(self, 'commit')
 
 
-class ProductOrder(models.Model):
+class ProductOrder(StatusCountedModel):
     PAYMENT_METHOD_CHOICES = [
         ('cash', 'Cash on Delivery'),
         ('momo', 'Mobile Money'),
@@ -443,14 +1096,38 @@ class ProductOrder(models.Model):
     order_date = models.DateTimeField(auto_now_add=True)
     subservice = models.ForeignKey(SubService, on_delete=models.SET_NULL, null=True, blank=True)
 
+    counter_kind = 'product_order'
+    counter_owner_field = 'subservice_id'
+    counter_service_lookup = 'subservice__service'
+    counter_status_field = 'payment_status'
+    # Product orders decremented stock when placed, before the ledger
+    stock_taken_before_ledger = True
+
     class Meta:
         ordering = ['-order_date']
         verbose_name = "Product Order"
         verbose_name_plural = "Product Orders"
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='productorder_user_created_idx'),
+            models.Index(fields=['-order_date'], name='productorder_order_date_idx'),
+            models.Index(fields=['payment_status', '-order_date'], name='productorder_status_date_idx'),
+            models.Index(
+                fields=['subservice', 'payment_status', '-order_date'], name='productorder_item_status_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.customer_name} - {self.product_name} ({self.quantity})"
 
+    def counter_service_id(self, owner_id):
+        if owner_id == self.subservice_id and self.subservice is not None:
+            return self.subservice.service_id
+        return SubService.objects.filter(pk=owner_id).values_list('service_id', flat=True).first()
+
+    @property
+    def stock_item(self):
+        return self.subservice
+
     @property
     def can_be_cancelled(self):
         """Check if order can be cancelled"""
@@ -458,11 +1135,212 @@ class ProductOrder(models.Model):
 
     def cancel(self):
         """Cancel the order and restore stock"""
-        if self.can_be_cancelled:
-            self.payment_status = 'cancelled'
-            if self.subservice:
-                self.subservice.stock += self.quantity
-                self.subservice.save()
-            self.save()
-        else:
-            raise ValidationError("Order cannot be cancelled after payment is confirmed")
\ No newline at end of file
+        with transaction.atomic():
+            if not self.transition(['pending'], 'cancelled'):
+                raise ValidationError("Order cannot be cancelled after payment is confirmed")
+            StockMovement.settle(self, 'release')
+
+class OutboxEmail(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    template = models.CharField(max_length=200)
+    context = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Outbox Email"
+        verbose_name_plural = "Outbox Emails"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} - {self.subject} ({self.status})"
+
+
+IDEMPOTENCY_TTL = timedelta(hours=24)
+IDEMPOTENCY_STALE_AFTER = timedelta(minutes=5)
+
+
+class IdempotencyKey(models.Model):
+    """First response to a POST sent with an idempotency key.
+
+    A row without a status_code is a claim for a request still being
+    processed; claims older than IDEMPOTENCY_STALE_AFTER are treated as
+    abandoned and may be taken over.
+    """
+    scope = models.CharField(max_length=100)
+    key = models.CharField(max_length=100)
+    path = models.CharField(max_length=255)
+
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=500, blank=True)
+    body = models.BinaryField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Idempotency Key"
+        verbose_name_plural = "Idempotency Keys"
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.status_code or 'in flight'})"
+
+    @classmethod
+    def claim(cls, scope, key, path):
+        """Return (record, claimed); claimed is False if the key is already taken"""
+        now = timezone.now()
+        cls.objects.filter(scope=scope, key=key).filter(
+            models.Q(expires_at__lte=now)
+            | models.Q(status_code__isnull=True, created_at__lte=now - IDEMPOTENCY_STALE_AFTER)
+        ).delete()
+        try:
+            with transaction.atomic():
+                return cls.objects.create(
+                    scope=scope, key=key, path=path, expires_at=now + IDEMPOTENCY_TTL
+                ), True
+        except IntegrityError:
+            return cls.objects.get(scope=scope, key=key), False
+
+    @classmethod
+    def purge(cls):
+        """Delete expired keys"""
+        return cls.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+    def store(self, response):
+        self.status_code = response.status_code
+        self.content_type = response.get('Content-Type', '')
+        self.location = response.get('Location', '')
+        self.body = response.content
+        self.save(update_fields=['status_code', 'content_type', 'location', 'body'])
+
+
+class MediaBlob(models.Model):
+    """One stored file under its content-hash name, with how many image
+    fields point at it. ContentAddressedStorage only removes the file once
+    the count reaches zero.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Media Blob"
+        verbose_name_plural = "Media Blobs"
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+    @classmethod
+    def add_reference(cls, name, size):
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).update(refcount=models.F('refcount') + 1):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(name=name, size=size, refcount=1)
+                except IntegrityError:
+                    cls.objects.filter(name=name).update(refcount=models.F('refcount') + 1)
+
+    @classmethod
+    def drop_reference(cls, name):
+        """Release one reference; True when nothing refers to the file anymore.
+
+        False for names with no row: files this table never counted are
+        left alone.
+        """
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return False
+            if blob.refcount > 1:
+                cls.objects.filter(pk=blob.pk).update(refcount=models.F('refcount') - 1)
+                return False
+            blob.delete()
+            return True
+
+
+class SearchEntry(models.Model):
+    """Searchable text of one catalog item, written by signals (salon.search).
+
+    The database indexes it outside the model state: an FTS5 table kept in
+    sync by triggers on SQLite, a weighted tsvector column on PostgreSQL.
+    """
+    KINDS = [
+        ('service', 'Service'),
+        ('subservice', 'Sub Service'),
+        ('hairstyle', 'Hair Style'),
+        ('wig', 'Wig'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=200)
+    body = models.TextField(blank=True)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = "Search Entry"
+        verbose_name_plural = "Search Entries"
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='search_entry_unique_item'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.title}"
+
+    @staticmethod
+    def fold(text):
+        """Text without accents, as it is indexed and searched; PostgreSQL's
+        text search configurations keep them
+        """
+        return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+
+    # Catalog items that belong to a service
+    CHILD_KINDS = ('subservice', 'hairstyle', 'wig')
+
+    @classmethod
+    def values_for(cls, item):
+        """Entry fields for item; items of an inactive service are indexed
+        as inactive, so searches filter them before ranking and LIMIT
+        """
+        is_active = item.is_active
+        if is_active and item._meta.model_name in cls.CHILD_KINDS:
+            is_active = item.service.is_active
+        return {'title': cls.fold(item.name), 'body': cls.fold(item.description or ''), 'is_active': is_active}
+
+    @classmethod
+    def index(cls, item):
+        cls.objects.update_or_create(
+            kind=item._meta.model_name, object_id=item.pk, defaults=cls.values_for(item),
+        )
+        if item._meta.model_name == 'service':
+            for kind in cls.CHILD_KINDS:
+                model = item._meta.apps.get_model(item._meta.app_label, kind)
+                active_children = model.objects.filter(service=item, is_active=True).values('pk')
+                cls.objects.filter(kind=kind, object_id__in=active_children).update(is_active=item.is_active)
+
+    @classmethod
+    def unindex(cls, item):
+        cls.objects.filter(kind=item._meta.model_name, object_id=item.pk).delete()
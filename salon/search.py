@@ -0,0 +1,89 @@
+import re
+
+from django.db import connections, router
+from django.db.models.expressions import RawSQL
+
+from .models import SearchEntry
+
+SEARCH_LIMIT = 50  # results on the public search page
+SEARCH_MAX_TERMS = 8
+# Title matches outrank body matches by this factor
+TITLE_WEIGHT = 10.0
+WORD = re.compile(r'\w+')
+
+
+def search_terms(query):
+    """Lower-cased words of a query; everything else is dropped, so the
+    terms are always safe inside an FTS5 or tsquery expression
+    """
+    return WORD.findall(SearchEntry.fold(query).lower())[:SEARCH_MAX_TERMS]
+
+
+def match_query(terms, vendor, kind=None, active_only=True, columns='e.kind, e.object_id'):
+    """(sql, params, order) selecting columns of the entries matching every term"""
+    if vendor == 'postgresql':
+        sql = (
+            f"SELECT {columns} FROM salon_searchentry e, to_tsquery('english', %s) query"
+            " WHERE e.document @@ query"
+        )
+        params = [' & '.join(f'{term}:*' for term in terms)]
+        # Weights for D, C, B (body) and A (title)
+        order = f"ts_rank('{{0, 0, {1 / TITLE_WEIGHT}, 1}}', e.document, query) DESC, e.id"
+    else:
+        sql = (
+            f"SELECT {columns} FROM salon_searchentry_fts"
+            " JOIN salon_searchentry e ON e.id = salon_searchentry_fts.rowid"
+            " WHERE salon_searchentry_fts MATCH %s"
+        )
+        params = [' '.join(f'"{term}"*' for term in terms)]
+        order = f"bm25(salon_searchentry_fts, {TITLE_WEIGHT}, 1.0), e.id"
+
+    if kind:
+        sql += " AND e.kind = %s"
+        params.append(kind)
+    if active_only:
+        sql += " AND e.is_active"
+    return sql, params, order
+
+
+def search_catalog(query, kind=None, active_only=True, limit=SEARCH_LIMIT):
+    """[(kind, object_id)] of entries matching every word of query, best first.
+
+    Every word also matches as a prefix, so 'knot brai' finds
+    'Knotless braids'. limit=None returns every match.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    connection = connections[router.db_for_read(SearchEntry)]
+    sql, params, order = match_query(terms, connection.vendor, kind, active_only)
+    sql += f" ORDER BY {order}"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(kind, object_id) for kind, object_id in cursor.fetchall()]
+
+
+def matching_ids(query, kind, using, active_only=True):
+    """Subquery of the ids of kind's entries matching query, for
+    filter(pk__in=...) on the database alias using; None if the query
+    has no words
+    """
+    terms = search_terms(query)
+    if not terms:
+        return None
+    sql, params, _ = match_query(terms, connections[using].vendor, kind, active_only, columns='e.object_id')
+    return RawSQL(sql, params)
+
+
+def index_catalog_item(sender, instance, **kwargs):
+    """post_save receiver for catalog models"""
+    SearchEntry.index(instance)
+
+
+def unindex_catalog_item(sender, instance, **kwargs):
+    """post_delete receiver for catalog models"""
+    SearchEntry.unindex(instance)
@@ -0,0 +1,111 @@
+import hashlib
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+from .images import IMAGE_FORMATS, IMAGE_WIDTHS, derivative_name
+
+
+def content_hash(content):
+    """sha256 hex digest of a file, read in chunks and rewound afterwards"""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Media storage that names files after their content.
+
+    An upload is stored as <upload dir>/<sha256>.<ext>, so identical
+    uploads share one file and a name never changes content, which is what
+    lets media be cached as immutable. MediaBlob counts the references to
+    each file; delete() only removes it, and its derivatives, when the last
+    one is released. Files with no MediaBlob row are never deleted.
+    """
+
+    def hashed_name(self, name, content):
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, content_hash(content) + extension)
+
+    def save(self, name, content, max_length=None):
+        from .models import MediaBlob
+
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(self.generate_filename(name), content)
+        if not self.exists(name):
+            name = self._save(name, content)
+        MediaBlob.add_reference(name, self.size(name))
+        return name
+
+    def delete(self, name):
+        from .models import MediaBlob
+
+        if MediaBlob.drop_reference(name):
+            self.remove_with_derivatives(name)
+
+    def remove(self, name):
+        """Delete the file itself, ignoring reference counts"""
+        super().delete(name)
+
+    def remove_with_derivatives(self, name):
+        self.remove(name)
+        for width in IMAGE_WIDTHS:
+            for extension, _, _ in IMAGE_FORMATS:
+                self.remove(derivative_name(name, width, extension))
+
+    def replace(self, name, content):
+        """Write content under exactly name, replacing any existing file.
+
+        For files derived from an original and named after it, which must
+        not be renamed or reference counted like uploads.
+        """
+        self.remove(name)
+        return self._save(name, content)
+
+
+content_storage = ContentAddressedStorage()
+
+
+def catalog_image_storage():
+    return content_storage
+
+
+def release_on_commit(field_file, name, using):
+    transaction.on_commit(lambda: field_file.storage.delete(name), using=using)
+
+
+def release_replaced_image(sender, instance, using, update_fields=None, **kwargs):
+    """pre_save receiver for catalog image models.
+
+    Once the save commits, the reference to a replaced image is released.
+    Its stored metadata is cleared, and the new name (only final once the
+    field commits the upload) is recorded by build_image_derivatives, so
+    a later save can never release the old image twice.
+    """
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    previous = getattr(instance, '_image_loaded', None)
+    if instance.image.name == previous:
+        return
+    if previous:
+        release_on_commit(instance.image, previous, using)
+    instance.image_width = instance.image_height = None
+    instance.image_color = instance.image_placeholder = ''
+    instance._image_loaded = None
+
+
+def release_deleted_image(sender, instance, using, **kwargs):
+    """post_delete receiver for catalog image models"""
+    if instance.image:
+        release_on_commit(instance.image, instance.image.name, using)
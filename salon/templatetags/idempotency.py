@@ -0,0 +1,14 @@
+import uuid
+
+from django import template
+from django.utils.html import format_html
+
+from salon.utils import IDEMPOTENCY_FIELD
+
+register = template.Library()
+
+
+@register.simple_tag
+def idempotency_field():
+    """Hidden input with a fresh key, so a resubmitted form is only processed once"""
+    return format_html('<input type="hidden" name="{}" value="{}">', IDEMPOTENCY_FIELD, uuid.uuid4().hex)
@@ -0,0 +1,49 @@
+from django import template
+from django.utils.html import format_html
+
+from salon.images import CARD_SIZES, IMAGE_FORMATS, IMAGE_WIDTHS, derivative_name, has_derivatives
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes=CARD_SIZES, css_class='', style='', loading='lazy'):
+    """<picture> offering the image's WebP and JPEG derivatives by width.
+
+    Stored metadata supplies width/height, so the box is sized before the
+    image arrives, and a blurred placeholder painted behind it. Metadata
+    is only stored once derivatives are built, so rows that have it need
+    no storage check. Falls back to a plain <img> of the original until
+    derivatives exist.
+    """
+    if not image:
+        return ''
+    width = getattr(image.instance, 'image_width', None)
+    height = getattr(image.instance, 'image_height', None)
+    dimensions = format_html(' width="{}" height="{}"', width, height) if width and height else ''
+    placeholder = getattr(image.instance, 'image_placeholder', '')
+    if placeholder:
+        background = f'background: {image.instance.image_color} url({placeholder}) center / cover no-repeat;'
+        style = f'{style.rstrip().rstrip(";")}; {background}' if style else background
+
+    if width is None and not has_derivatives(image):
+        return format_html(
+            '<img src="{}" class="{}" style="{}" alt="{}" loading="{}">',
+            image.url, css_class, style, alt, loading,
+        )
+
+    def srcset(extension):
+        return ', '.join(
+            f'{image.storage.url(derivative_name(image.name, width, extension))} {width}w'
+            for width in IMAGE_WIDTHS
+        )
+
+    (webp, _, _), (jpeg, _, _) = IMAGE_FORMATS
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{} class="{}" style="{}" alt="{}" loading="{}" decoding="async">'
+        '</picture>',
+        srcset(webp), sizes,
+        image.storage.url(derivative_name(image.name, IMAGE_WIDTHS[1], jpeg)), srcset(jpeg), sizes, dimensions,
+        css_class, style, alt, loading,
+    )
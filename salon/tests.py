@@ -1,3 +1,1674 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from datetime import datetime, time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import IntegrityError, close_old_connections, connection, connections, transaction
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import (
+    CATALOG_LOCK_TIMEOUT, CatalogFileCache, bump_catalog_version, cached_catalog, catalog_cache_stats, catalog_version,
+)
+from .cart import Cart
+from .search import SEARCH_LIMIT, search_catalog
+from .images import DERIVATIVE_VERSION, IMAGE_WIDTHS, derivative_name, has_derivatives
+from .db import PrimaryReplicaRouter, REPLICA_ALIAS, pragma_statements, primary_written, replica_reads_allowed
+from .management.commands.stress_booking import run_concurrent_bookings
+from .admin import AppointmentAdmin, ServiceAdmin
+from .models import (
+    Service, SubService, HairStyle, Appointment, OutboxEmail, Wig, WigOrder, ProductOrder, StatusCounter,
+    StockMovement, StockSnapshot, IdempotencyKey, MediaBlob, SearchEntry, update_status,
+)
+from .utils import (
+    sweep_free_slots, check_time_conflict, dispatch_outbox,
+    send_appointment_confirmation_to_customer, OUTBOX_MAX_ATTEMPTS, SendGridEmailBackend,
+    save_order_if_in_stock, save_appointment_if_free, enqueue_email,
+    SENDGRID_BODY_TAG, SENDGRID_MAX_SUBSTITUTION_BYTES,
+)
+from .views import DASHBOARD_PAGE_SIZE, MY_ORDERS_PAGE_SIZE, order_feed, decode_feed_cursor
+
+
+def aware(day, hour, minute=0):
+    return timezone.make_aware(datetime.combine(day, time(hour=hour, minute=minute)))
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.service = Service.objects.create(name='Braids', description='', service_type='booking')
+        self.subservice = SubService.objects.create(
+            service=self.service, name='Box braids', price=50, duration=timedelta(minutes=60)
+        )
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def book(self, hour, minute=0, status='confirmed', **kwargs):
+        return Appointment.objects.create(
+            customer_name='Ama', customer_phone='0123456789', customer_email='ama@example.com',
+            service=self.service, subservice=self.subservice, status=status,
+            appointment_date=aware(self.day, hour, minute), **kwargs
+        )
+
+    def test_empty_day_returns_every_step(self):
+        slots = Appointment.objects.get_available_slots(self.service, self.day, self.subservice)
+        self.assertEqual(slots[0], aware(self.day, 8))
+        self.assertEqual(slots[-1], aware(self.day, 19))
+        self.assertEqual(len(slots), 45)
+
+    def test_appointment_blocks_duration_and_buffer(self):
+        self.book(12)
+        slots = Appointment.objects.get_available_slots(self.service, self.day, self.subservice)
+        # 60 min + 10 min buffer on both sides of the 12:00-13:00 booking
+        self.assertIn(aware(self.day, 10, 45), slots)
+        self.assertNotIn(aware(self.day, 11), slots)
+        self.assertNotIn(aware(self.day, 13), slots)
+        self.assertIn(aware(self.day, 13, 15), slots)
+
+    def test_cancelled_and_other_days_are_ignored(self):
+        self.book(12, status='cancelled')
+        Appointment.objects.create(
+            customer_name='Esi', customer_phone='0123456789', customer_email='esi@example.com',
+            service=self.service, subservice=self.subservice, status='confirmed',
+            appointment_date=aware(self.day - timedelta(days=3), 12),
+        )
+        slots = Appointment.objects.get_available_slots(self.service, self.day, self.subservice)
+        self.assertEqual(len(slots), 45)
+
+    def test_single_query(self):
+        for hour in (9, 11, 14, 17):
+            self.book(hour)
+        with self.assertNumQueries(1):
+            Appointment.objects.get_available_slots(self.service, self.day, self.subservice)
+
+    def test_sweep_matches_pairwise_check(self):
+        start = aware(self.day, 8)
+        end = aware(self.day, 20)
+        duration = timedelta(minutes=45)
+        buffer = timedelta(minutes=10)
+        intervals = [
+            (aware(self.day, 9), aware(self.day, 10, 10)),
+            (aware(self.day, 9, 30), aware(self.day, 11, 40)),
+            (aware(self.day, 15), aware(self.day, 15, 40)),
+        ]
+        expected = []
+        current = start
+        while current + duration <= end:
+            if not any(current < e and s < current + duration + buffer for s, e in intervals):
+                expected.append(current)
+            current += timedelta(minutes=15)
+        self.assertEqual(sweep_free_slots(start, end, duration, intervals), expected)
+
+    def test_calendar_endpoint_batches_days_and_subservices(self):
+        SubService.objects.create(
+            service=self.service, name='Cornrows', price=30, duration=timedelta(minutes=30)
+        )
+        self.book(12)
+        url = reverse('salon:check_availability', args=[self.service.id])
+        # ETag versions, service, subservices, one appointment window load
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'from': self.day.isoformat(), 'days': 7})
+        data = response.json()
+        self.assertEqual(data['days'], 7)
+        self.assertEqual(len(data['available_slots']), 7)
+        first = data['available_slots'][self.day.isoformat()]
+        self.assertEqual(set(first), {'Box braids', 'Cornrows'})
+        self.assertNotIn(aware(self.day, 12).strftime('%Y-%m-%d %H:%M'), first['Box braids'])
+        second = data['available_slots'][(self.day + timedelta(days=1)).isoformat()]
+        self.assertEqual(len(second['Box braids']), 45)
+
+    def test_calendar_endpoint_rejects_bad_dates(self):
+        url = reverse('salon:check_availability', args=[self.service.id])
+        self.assertEqual(self.client.get(url, {'from': '2025-13-40'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'days': 'week'}).status_code, 400)
+
+
+class TimeConflictTests(TestCase):
+    def setUp(self):
+        self.service = Service.objects.create(name='Braids', description='', service_type='booking')
+        self.subservice = SubService.objects.create(
+            service=self.service, name='Box braids', price=50, duration=timedelta(minutes=90)
+        )
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def book(self, start, **kwargs):
+        return Appointment.objects.create(
+            customer_name='Ama', customer_phone='0123456789', customer_email='ama@example.com',
+            service=self.service, appointment_date=start, status='confirmed', **kwargs
+        )
+
+    def test_blocked_until_includes_duration_and_buffer(self):
+        appointment = self.book(aware(self.day, 10), subservice=self.subservice)
+        self.assertEqual(appointment.blocked_until, aware(self.day, 11, 40))
+        appointment = self.book(aware(self.day, 14), estimated_duration=timedelta(minutes=20))
+        self.assertEqual(appointment.blocked_until, aware(self.day, 14, 30))
+
+    def test_overlap_detection(self):
+        existing = self.book(aware(self.day, 10), subservice=self.subservice)
+        hour = timedelta(hours=1)
+        result = check_time_conflict(self.service, aware(self.day, 11, 30), hour)
+        self.assertTrue(result['conflict'])
+        self.assertEqual(result['conflict_start'], existing.appointment_date)
+        self.assertEqual(result['conflict_end'], aware(self.day, 11, 40))
+        # Ending at 08:50 plus the 10 minute buffer touches 10:00 exactly
+        self.assertFalse(check_time_conflict(self.service, aware(self.day, 8, 50), hour)['conflict'])
+        self.assertFalse(check_time_conflict(self.service, aware(self.day, 11, 40), hour)['conflict'])
+        self.assertFalse(
+            check_time_conflict(self.service, aware(self.day, 10), hour, existing)['conflict']
+        )
+
+    def test_only_overlap_errors_count_as_conflicts(self):
+        appointment = Appointment(
+            customer_name=None, customer_phone='0123456789', customer_email='ama@example.com',
+            service=self.service, appointment_date=aware(self.day, 10), status='pending',
+        )
+        with self.assertRaises(IntegrityError):
+            save_appointment_if_free(appointment, timedelta(hours=1))
+
+    def test_query_count_independent_of_history(self):
+        for offset in range(1, 60):
+            self.book(aware(self.day - timedelta(days=offset), 10), subservice=self.subservice)
+        with self.assertNumQueries(1):
+            check_time_conflict(self.service, aware(self.day, 10), timedelta(hours=1))
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    def test_no_double_bookings_under_contention(self):
+        services = []
+        for n in range(3):
+            service = Service.objects.create(name=f'Chair {n}', description='', service_type='booking')
+            SubService.objects.create(service=service, name='Cut', price=10, duration=timedelta(minutes=45))
+            services.append(service)
+        day = timezone.localdate() + timedelta(days=1)
+
+        attempts, booked, elapsed = run_concurrent_bookings(services, day, threads_per_slot=4, slots_per_service=2)
+
+        self.assertEqual(attempts, 24)
+        self.assertEqual(booked, 6)
+        self.assertEqual(Appointment.objects.count(), 6)
+        self.assertFalse(
+            Appointment.objects.values('service', 'appointment_date')
+            .annotate(n=Count('id')).filter(n__gt=1).exists()
+        )
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class StockTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ama', 'ama@example.com', 'pw')
+        self.shop = Service.objects.create(name='Shop', description='', service_type='order')
+        self.oil = SubService.objects.create(service=self.shop, name='Oil', price=5, stock=3)
+        self.wig = Wig.objects.create(service=self.shop, name='Bob', description='', price=80, stock=2)
+        self.client.force_login(self.user)
+
+    def order_wig(self, quantity):
+        return self.client.post(reverse('salon:order_wig', args=[self.wig.id]), {
+            'customer_name': 'Ama', 'customer_phone': '0123456789',
+            'customer_email': 'ama@example.com', 'customer_address': 'Accra', 'quantity': quantity,
+        })
+
+    def test_order_wig_takes_stock(self):
+        self.order_wig(2)
+        self.order_wig(1)
+        self.wig.refresh_from_db()
+        self.assertEqual(self.wig.stock, 0)
+        self.assertEqual(WigOrder.objects.count(), 1)
+
+    def test_cancel_returns_stock_without_rewriting_subservice(self):
+        order = ProductOrder(
+            subservice=self.oil, customer_name='Kofi', customer_phone='0123456789',
+            product_name='Oil', quantity=2, total_price=10,
+        )
+        self.assertTrue(save_order_if_in_stock(order, self.oil, 2))
+        SubService.objects.filter(pk=self.oil.pk).update(price=7)
+
+        order.cancel()
+        self.oil.refresh_from_db()
+        self.assertEqual((self.oil.stock, self.oil.price), (3, 7))
+        self.assertEqual(ProductOrder.objects.get().payment_status, 'cancelled')
+
+    def test_reduce_stock_refuses_oversell(self):
+        self.wig.reduce_stock(2)
+        self.assertEqual(self.wig.stock, 0)
+        with self.assertRaises(ValidationError):
+            self.wig.reduce_stock(1)
+
+
+class ConcurrentStockTests(TransactionTestCase):
+    def test_hammered_product_never_oversells(self):
+        shop = Service.objects.create(name='Shop', description='', service_type='order')
+        oil = SubService.objects.create(service=shop, name='Oil', price=5, stock=10)
+        start = threading.Barrier(24)
+        results = []
+
+        def buy():
+            try:
+                start.wait()
+                order = ProductOrder(
+                    subservice=oil, customer_name='Kofi', customer_phone='0123456789',
+                    product_name='Oil', quantity=1, total_price=5,
+                )
+                results.append(save_order_if_in_stock(order, oil, 1))
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(24)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        oil.refresh_from_db()
+        self.assertEqual(results.count(True), 10)
+        self.assertEqual(oil.stock, 0)
+        self.assertEqual(ProductOrder.objects.count(), 10)
+        self.assertEqual(oil.stock_balance(), {'on_hand': 10, 'reserved': 10, 'available': 0})
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.shop = Service.objects.create(name='Shop', description='', service_type='order')
+        self.oil = SubService.objects.create(service=self.shop, name='Oil', price=5, stock=5)
+        self.wig = Wig.objects.create(service=self.shop, name='Bob', description='', price=80, stock=2)
+
+    def place(self, quantity):
+        order = ProductOrder(
+            subservice=self.oil, customer_name='Kofi', customer_phone='0123456789',
+            product_name='Oil', quantity=quantity, total_price=5 * quantity,
+        )
+        self.assertTrue(save_order_if_in_stock(order, self.oil, quantity))
+        return order
+
+    def test_reserve_release_commit(self):
+        kept, cancelled = self.place(2), self.place(1)
+        self.assertEqual(self.oil.stock_balance(), {'on_hand': 5, 'reserved': 3, 'available': 2})
+
+        cancelled.cancel()
+        StockMovement.settle(kept, 'commit')
+        StockMovement.settle(kept, 'commit')
+        self.oil.refresh_from_db()
+        self.assertEqual(self.oil.stock, 3)
+        self.assertEqual(self.oil.stock_balance(), {'on_hand': 3, 'reserved': 0, 'available': 3})
+        self.assertEqual(
+            list(StockMovement.objects.filter(item_kind='subservice').values_list('kind', 'quantity')),
+            [('restock', 5), ('reserve', 2), ('reserve', 1), ('release', 1), ('commit', 2)],
+        )
+
+    def test_admin_edits_are_restocks(self):
+        wig = Wig.objects.get(pk=self.wig.pk)
+        wig.stock = 7
+        wig.save()
+        self.assertEqual(wig.stock_balance()['on_hand'], 7)
+        self.assertEqual(StockMovement.objects.filter(item_kind='wig').count(), 2)
+
+    def test_stale_saves_keep_concurrent_takes(self):
+        editor = Wig.objects.get(pk=self.wig.pk)
+        self.assertTrue(Wig.take_stock(self.wig.pk, 1))
+        editor.price = 95
+        editor.save()
+        self.wig.refresh_from_db()
+        self.assertEqual((self.wig.stock, self.wig.price), (1, 95))
+        self.assertEqual(StockMovement.objects.filter(item_kind='wig').count(), 1)
+
+        # An edit applies only the difference the editor typed
+        editor.stock = 2 + 3
+        editor.save()
+        self.assertEqual(editor.stock, 4)
+        with self.assertRaises(ValidationError):
+            editor.stock = -10 + editor.stock
+            editor.save()
+
+    def test_admin_form_applies_the_stock_change_typed(self):
+        from .admin import StockEditForm
+
+        class WigForm(StockEditForm):
+            class Meta:
+                model = Wig
+                fields = ['name', 'price', 'stock']
+
+        form = WigForm(instance=self.wig)
+        self.assertTrue(Wig.take_stock(self.wig.pk, 2))  # ordered while the form is open
+        data = {'name': 'Bob', 'price': '85.00', 'stock': form.initial['stock'] + 1,
+                'stock_shown': form['stock_shown'].value()}
+        form = WigForm(data, instance=Wig.objects.get(pk=self.wig.pk))
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.wig.refresh_from_db()
+        self.assertEqual((self.wig.stock, str(self.wig.price)), (1, '85.00'))
+
+    def test_cancelling_releases_once_and_returns_committed_units(self):
+        order = WigOrder.objects.create(
+            wig=self.wig, customer_name='Esi', customer_phone='0123456789',
+            customer_email='esi@example.com', customer_address='Accra',
+        )
+        self.assertTrue(Wig.take_stock(self.wig.pk, 1))
+        StockMovement.record(self.wig, 'reserve', 1, order)
+        order.confirm()
+        stale = WigOrder.objects.get(pk=order.pk)
+
+        order.cancel()
+        with self.assertRaises(ValidationError):
+            stale.cancel()  # lost the race: nothing is released twice
+        self.wig.refresh_from_db()
+        self.assertEqual(self.wig.stock, 2)
+        self.assertEqual(self.wig.stock_balance(), {'on_hand': 2, 'reserved': 0, 'available': 2})
+
+    def test_only_product_orders_from_before_the_ledger_are_restocked(self):
+        legacy_wig = WigOrder.objects.create(
+            wig=self.wig, customer_name='Esi', customer_phone='0123456789',
+            customer_email='esi@example.com', customer_address='Accra',
+        )
+        legacy_product = ProductOrder.objects.create(
+            subservice=self.oil, customer_name='Kofi', customer_phone='0123456789',
+            product_name='Oil', quantity=2, total_price=10,
+        )
+        legacy_wig.cancel()
+        legacy_product.cancel()
+        self.wig.refresh_from_db()
+        self.oil.refresh_from_db()
+        self.assertEqual((self.wig.stock, self.oil.stock), (2, 7))
+
+    def test_long_tail_is_folded_into_snapshot(self):
+        with mock.patch('salon.models.STOCK_SNAPSHOT_EVERY', 3):
+            for _ in range(4):
+                self.place(1)
+            self.assertEqual(self.oil.stock_balance()['available'], 1)
+        snapshot = StockSnapshot.objects.get(item_kind='subservice', item_id=self.oil.pk)
+        self.assertEqual((snapshot.on_hand, snapshot.reserved), (5, 4))
+
+        self.place(1)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.oil.stock_balance(), {'on_hand': 5, 'reserved': 5, 'available': 0})
+
+    def test_rebuild_repairs_drifted_stock(self):
+        self.place(2)
+        SubService.objects.filter(pk=self.oil.pk).update(stock=40)
+        out = StringIO()
+        call_command('rebuild_stock_ledger', '--sync-stock', stdout=out)
+        self.oil.refresh_from_db()
+        self.assertEqual(self.oil.stock, 3)
+        self.assertIn('ledger 3', out.getvalue())
+        self.assertEqual(StockSnapshot.objects.count(), 2)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ama', 'ama@example.com', 'pw')
+        self.shop = Service.objects.create(name='Shop', description='', service_type='order')
+        self.oil = SubService.objects.create(service=self.shop, name='Oil', price=5, stock=10)
+        self.comb = SubService.objects.create(service=self.shop, name='Comb', price=2, stock=4)
+        self.wig = Wig.objects.create(service=self.shop, name='Bob', description='', price=80, stock=1)
+        self.client.force_login(self.user)
+        for kind, item, quantity in (('subservice', self.oil, 3), ('subservice', self.comb, 4), ('wig', self.wig, 1)):
+            self.client.post(reverse('salon:cart_add'), {'kind': kind, 'item_id': item.id, 'quantity': quantity})
+
+    def checkout(self):
+        return self.client.post(reverse('salon:checkout'), {
+            'customer_name': 'Ama', 'customer_phone': '0123456789',
+            'customer_email': 'ama@example.com', 'customer_address': 'Accra',
+        })
+
+    def test_cart_lines_come_from_one_query(self):
+        response = self.client.get(reverse('salon:view_cart'))
+        self.assertEqual(response.context['total'], 3 * 5 + 4 * 2 + 80)
+        cart = Cart(self.client.session)
+        with self.assertNumQueries(1):
+            self.assertEqual([line['name'] for line in cart.lines()], ['Comb', 'Oil', 'Bob'])
+
+    def test_checkout_reports_missing_details_without_taking_stock(self):
+        response = self.client.post(reverse('salon:checkout'), {
+            'customer_name': 'Ama', 'customer_phone': '0123456789', 'customer_address': 'Accra',
+        }, follow=True)
+        self.assertRedirects(response, reverse('salon:view_cart'))
+        self.assertEqual(list(response.context['messages'])[-1].message, 'Customer email: This field cannot be blank.')
+        self.assertEqual(SubService.objects.get(name='Oil').stock, 10)
+        self.assertFalse(WigOrder.objects.exists())
+        self.assertEqual(len(Cart(self.client.session)), 8)
+
+    def test_checkout_places_every_line_at_once(self):
+        self.checkout()
+
+        stock = dict(SubService.objects.values_list('name', 'stock'))
+        self.assertEqual(stock, {'Oil': 7, 'Comb': 0})
+        self.assertEqual(Wig.objects.get().stock, 0)
+        self.assertEqual(
+            sorted(ProductOrder.objects.values_list('product_name', 'quantity', 'total_price')),
+            [('Comb', 4, 8), ('Oil', 3, 15)],
+        )
+        self.assertEqual(WigOrder.objects.get().total_price, 80)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+        self.assertEqual(StockMovement.objects.filter(kind='reserve').count(), 3)
+        self.assertEqual(StatusCounter.for_services([self.shop])[self.shop.id], {
+            'product_order': {'pending': 2}, 'wig_order': {'pending': 1},
+        })
+        self.assertEqual(self.client.session['cart'], {})
+
+    def test_short_line_rolls_back_the_whole_cart(self):
+        Wig.objects.filter(pk=self.wig.pk).update(stock=0)
+        self.checkout()
+        self.assertFalse(ProductOrder.objects.exists())
+        self.assertEqual(SubService.objects.get(pk=self.oil.pk).stock, 10)
+        self.assertEqual(len(Cart(self.client.session)), 8)
+
+    def test_lost_race_takes_nothing(self):
+        self.assertFalse(SubService.take_stock_many({self.oil.pk: 3, self.comb.pk: 5}))
+        self.assertEqual(dict(SubService.objects.values_list('name', 'stock')), {'Oil': 10, 'Comb': 4})
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ama', 'ama@example.com', 'pw')
+        self.shop = Service.objects.create(name='Shop', description='', service_type='order')
+        self.wig = Wig.objects.create(service=self.shop, name='Bob', description='', price=80, stock=5)
+        self.client.force_login(self.user)
+
+    def order_wig(self, **extra):
+        return self.client.post(reverse('salon:order_wig', args=[self.wig.id]), {
+            'customer_name': 'Ama', 'customer_phone': '0123456789',
+            'customer_email': 'ama@example.com', 'customer_address': 'Accra', 'quantity': 1,
+        }, **extra)
+
+    def test_retried_order_is_replayed(self):
+        first = self.order_wig(HTTP_IDEMPOTENCY_KEY='k1')
+        second = self.order_wig(HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual((second.status_code, second['Location']), (first.status_code, first['Location']))
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(WigOrder.objects.count(), 1)
+        self.assertEqual(Wig.objects.get().stock, 4)
+
+        self.order_wig(HTTP_IDEMPOTENCY_KEY='k2')
+        self.order_wig()
+        self.assertEqual(WigOrder.objects.count(), 3)
+
+    def test_form_token_covers_booking(self):
+        booking = Service.objects.create(name='Braids', description='', service_type='booking')
+        form = self.client.get(reverse('salon:book_appointment', args=[booking.id]))
+        self.assertContains(form, 'name="idempotency_key"')
+
+        data = {
+            'customer_name': 'Ama', 'customer_phone': '0123456789', 'customer_email': 'ama@example.com',
+            'appointment_date': datetime.combine(timezone.localdate() + timedelta(days=1), time(hour=10)).isoformat(),
+            'idempotency_key': 'form-token',
+        }
+        for _ in range(2):
+            self.client.post(reverse('salon:book_appointment', args=[booking.id]), data)
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(OutboxEmail.objects.count(), 2)
+
+    def test_in_flight_and_reused_keys(self):
+        IdempotencyKey.claim(f'user:{self.user.pk}', 'busy', reverse('salon:order_wig', args=[self.wig.id]))
+        self.assertEqual(self.order_wig(HTTP_IDEMPOTENCY_KEY='busy').status_code, 409)
+
+        self.order_wig(HTTP_IDEMPOTENCY_KEY='k3')
+        response = self.client.post(reverse('salon:checkout'), HTTP_IDEMPOTENCY_KEY='k3')
+        self.assertEqual(response.status_code, 422)
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command('check_query_plans', users=20, per_user=5, catalog=10, repeat=1, stdout=out)
+        self.assertIn('No full table scans', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='plan-check').exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+class SQLitePragmaTests(TestCase):
+    def test_new_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            # Persistent modes are left to the database file unless configured
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'delete')
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL'})
+    def test_wal_is_opt_in(self):
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(lambda: [os.remove(name) for name in (path, f'{path}-wal', f'{path}-shm') if os.path.exists(name)])
+        scratch = connections['default'].__class__({**connection.settings_dict, 'NAME': path}, alias='scratch')
+        try:
+            with scratch.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'wal')
+                cursor.execute('PRAGMA synchronous')
+                self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        finally:
+            scratch.close()
+
+    def test_pragma_values_are_validated(self):
+        self.assertEqual(pragma_statements({'synchronous': 'NORMAL', 'mmap_size': ''}), ['PRAGMA synchronous = NORMAL'])
+        with self.assertRaises(ValueError):
+            pragma_statements({'cache_size': '1; DROP TABLE salon_service'})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class PostgresConstraintTests(TestCase):
+    def test_overlapping_active_appointments_are_rejected(self):
+        service = Service.objects.create(name='Braids', description='', service_type='booking')
+        day = timezone.localdate() + timedelta(days=1)
+
+        def booking(hour, minute=0, status='pending'):
+            start = aware(day, hour, minute)
+            return Appointment(
+                customer_name='Ama', customer_phone='0123456789', customer_email='ama@example.com',
+                service=service, status=status, appointment_date=start, blocked_until=start + timedelta(hours=1),
+            )
+
+        Appointment.objects.bulk_create([booking(9), booking(10), booking(9, 30, status='cancelled')])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Appointment.objects.bulk_create([booking(9, 30)])
+
+        # save_appointment_if_free reports the clash instead of raising
+        clash = booking(10, 30)
+        with mock.patch('salon.utils.check_time_conflict', return_value={'conflict': False}):
+            self.assertTrue(save_appointment_if_free(clash, timedelta(minutes=50))['conflict'])
+        self.assertIsNone(clash.pk)
+
+        # Any other integrity error is not mistaken for a clash
+        broken = booking(12)
+        broken.customer_name = None
+        with self.assertRaises(IntegrityError):
+            save_appointment_if_free(broken, timedelta(minutes=50))
+
+
+NO_CATALOG_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage', CACHES=NO_CATALOG_CACHE)
+class ReplicaRouterTests(TestCase):
+    """Two SQLite files: the test database as primary and a scratch replica"""
+
+    def setUp(self):
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connections.settings[REPLICA_ALIAS] = {
+            **connections.settings['default'], 'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, 'OPTIONS': {},
+        }
+        self.addCleanup(self.drop_replica, path)
+        with connections[REPLICA_ALIAS].schema_editor() as editor:
+            editor.create_model(Service)
+        Service.objects.using(REPLICA_ALIAS).create(name='Replica Braids', description='', service_type='booking')
+
+        self.shop = Service.objects.create(name='Primary Shop', description='', service_type='order')
+        self.wig = Wig.objects.create(service=self.shop, name='Bob', description='', price=80, stock=5)
+        self.client.force_login(User.objects.create_user('ama', 'ama@example.com', 'pw'))
+
+    def drop_replica(self, path):
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del connections.settings[REPLICA_ALIAS]
+        os.remove(path)
+
+    def test_router_sticks_to_primary_after_a_write(self):
+        router = PrimaryReplicaRouter()
+        reads, written = replica_reads_allowed.set(True), primary_written.set(False)
+        try:
+            self.assertEqual(router.db_for_read(Service), 'default')  # inside the test transaction
+            with mock.patch.object(connections['default'], 'in_atomic_block', False):
+                self.assertEqual(router.db_for_read(Service), REPLICA_ALIAS)
+                self.assertEqual(router.db_for_read(User), 'default')
+                self.assertEqual(router.db_for_write(Service), 'default')
+                self.assertEqual(router.db_for_read(Service), 'default')
+        finally:
+            replica_reads_allowed.reset(reads)
+            primary_written.reset(written)
+
+    def test_catalog_recomputes_read_the_primary(self):
+        def catalog():
+            with mock.patch.object(connections['default'], 'in_atomic_block', False):
+                return self.client.get(reverse('salon:service_list')).content.decode()
+
+        # A lagging replica must not fill a freshly bumped version
+        with override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'replica'},
+        }):
+            bump_catalog_version()
+            page = catalog()
+            self.assertIn('Primary Shop', page)
+            self.assertNotIn('Replica Braids', page)
+            self.assertEqual(
+                [service.name for service in caches['catalog'].get(f'catalog:{catalog_version()}:services')],
+                ['Primary Shop'],
+            )
+
+        # Live reads outside the cache still use the replica
+        reads, written = replica_reads_allowed.set(True), primary_written.set(False)
+        try:
+            with mock.patch.object(connections['default'], 'in_atomic_block', False):
+                self.assertEqual(list(Service.objects.values_list('name', flat=True)), ['Replica Braids'])
+        finally:
+            replica_reads_allowed.reset(reads)
+            primary_written.reset(written)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        override = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'catalog': {
+                'BACKEND': 'salon.cache.CatalogFileCache', 'LOCATION': location, 'OPTIONS': {'MAX_ENTRIES': 10},
+            },
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        self.service = Service.objects.create(name='Braids', description='', service_type='booking')
+        self.wigs = Service.objects.create(name='Wigs', description='', service_type='booking')
+        self.wig = Wig.objects.create(service=self.wigs, name='Bob', description='', price=80, stock=5)
+
+    def test_pages_are_cached_until_the_catalog_changes(self):
+        before = catalog_cache_stats()
+        url = reverse('salon:service_list')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'Braids')
+
+        version = catalog_version()
+        self.service.name = 'Box Braids'
+        self.service.save()
+        self.assertNotEqual(catalog_version(), version)
+        self.assertContains(self.client.get(url), 'Box Braids')
+
+        # Wig details are cached but stock is read live
+        wigs_url = reverse('salon:service_detail', args=[self.wigs.id])
+        self.client.get(wigs_url)
+        Wig.take_stock(self.wig.id, 2)
+        with self.assertNumQueries(1):
+            self.assertContains(self.client.get(wigs_url), 'In Stock: 3')
+
+        staff = User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        self.client.force_login(staff)
+        stats = self.client.get(reverse('salon:catalog_cache_status')).json()
+        # The wigs page's ETag reads the cached page too
+        self.assertEqual((stats['hits'] - before['hits'], stats['misses'] - before['misses']), (4, 3))
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(1)
+            return ['Braids']
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cached_catalog('slow', compute))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, [['Braids']] * 8))
+
+        # Another worker holds the recompute lock: wait for its result
+        key = f'catalog:{catalog_version()}:other'
+        caches['catalog'].add(f'{key}:lock', 1, CATALOG_LOCK_TIMEOUT)
+        threading.Timer(0.2, caches['catalog'].set, (key, ['Wigs'])).start()
+        self.assertEqual(cached_catalog('other', lambda: calls.append(1)), ['Wigs'])
+        self.assertEqual(len(calls), 1)
+
+    def run_together(self, target, count=8):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_add_and_incr_are_atomic(self):
+        cache = caches['catalog']
+        self.assertEqual(self.run_together(lambda: cache.add('lock', 1, 30)).count(True), 1)
+
+        cache.add('counter', 0, timeout=None)
+        self.run_together(lambda: [cache.incr('counter') for _ in range(25)])
+        self.assertEqual(cache.get('counter'), 200)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+        # Expired entries can be added again
+        cache.set('stale', 1, timeout=-1)
+        self.assertTrue(cache.add('stale', 2))
+        self.assertEqual(cache.get('stale'), 2)
+
+    def test_culling_keeps_the_version_and_counters(self):
+        version = catalog_version()
+        catalog_cache_stats()
+        cached_catalog('services', lambda: [])  # counted as a miss, flushed below
+        for page in range(40):
+            cached_catalog(f'search:{page}', lambda: [])
+        entries = [name for name in os.listdir(caches['catalog']._dir) if name.endswith('.djcache')]
+        self.assertLessEqual(len(entries), 10 + len(CatalogFileCache.pinned_keys))
+        self.assertEqual(catalog_version(), version)
+        self.assertGreaterEqual(catalog_cache_stats()['misses'], 41)
+
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'conditional-get'},
+    },
+)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.service = Service.objects.create(name='Braids', description='', service_type='booking')
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def revalidate(self, url, etag, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+    def test_catalog_pages_answer_304_until_the_catalog_changes(self):
+        for url in (reverse('salon:index'), reverse('salon:service_list'),
+                    reverse('salon:service_detail', args=[self.service.id])):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                self.assertEqual(self.revalidate(url, etag).status_code, 304)
+
+        url = reverse('salon:service_list')
+        etag = self.client.get(url)['ETag']
+        self.service.name = 'Box Braids'
+        self.service.save()
+        self.assertContains(self.revalidate(url, etag), 'Box Braids')
+
+        self.client.force_login(User.objects.create_user('ama', 'ama@example.com', 'pw'))
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_availability_answers_304_until_the_day_changes(self):
+        url = reverse('salon:check_availability', args=[self.service.id])
+        params = {'from': self.day.isoformat(), 'days': 2}
+        etag = self.client.get(url, params)['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate(url, etag, **params).status_code, 304)
+
+        start = aware(self.day, 10)
+        appointment = Appointment.objects.create(
+            customer_name='Ama', customer_phone='0123456789', customer_email='ama@example.com',
+            service=self.service, status='pending', appointment_date=start,
+        )
+        response = self.revalidate(url, etag, **params)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # Other days keep their tag; bulk status changes move it
+        later = {'from': (self.day + timedelta(days=3)).isoformat()}
+        later_etag = self.client.get(url, later)['ETag']
+        update_status(Appointment.objects.filter(pk=appointment.pk), 'cancelled')
+        self.assertEqual(self.revalidate(url, etag, **params).status_code, 200)
+        self.assertEqual(self.revalidate(url, later_etag, **later).status_code, 304)
+
+    def test_bulk_and_cascade_deletes_move_the_availability_tag(self):
+        url = reverse('salon:check_availability', args=[self.service.id])
+        params = {'from': self.day.isoformat(), 'days': 1}
+        cut = SubService.objects.create(service=self.service, name='Cut', price=10, duration=timedelta(minutes=30))
+        user = User.objects.create_user('ama', 'ama@example.com', 'pw')
+        for hour in (10, 12):
+            Appointment.objects.create(
+                customer_name='Ama', customer_phone='0123456789', customer_email='ama@example.com',
+                service=self.service, subservice=cut, user=user, appointment_date=aware(self.day, hour),
+            )
+
+        etag = self.client.get(url, params)['ETag']
+        AppointmentAdmin(Appointment, admin.site).delete_queryset(
+            None, Appointment.objects.filter(appointment_date=aware(self.day, 10)),
+        )
+        response = self.revalidate(url, etag, **params)
+        self.assertEqual(response.status_code, 200)
+
+        user.delete()  # cascades to the remaining appointment
+        self.assertEqual(self.revalidate(url, response['ETag'], **params).status_code, 200)
+
+
+def temporary_media(test):
+    """Point MEDIA_ROOT at a scratch directory for the rest of test"""
+    media = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media, ignore_errors=True)
+    override = override_settings(MEDIA_ROOT=media)
+    override.enable()
+    test.addCleanup(override.disable)
+    return media
+
+
+def image_upload(name, size, mode='RGB', color='purple', image_format='PNG'):
+    buffer = BytesIO()
+    Image.new(mode, size, color).save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        temporary_media(self)
+        self.shop = Service.objects.create(name='Shop', description='', service_type='order')
+
+    def test_upload_builds_every_width_without_upscaling(self):
+        wig = Wig.objects.create(service=self.shop, name='Bob', description='', price=80,
+                                 image=image_upload('bob.png', (1000, 500), mode='RGBA'))
+        storage = wig.image.storage
+        for width in IMAGE_WIDTHS:
+            for extension in ('webp', 'jpg'):
+                with storage.open(derivative_name(wig.image.name, width, extension)) as handle:
+                    self.assertEqual(Image.open(handle).size, (min(width, 1000), min(width, 1000) // 2))
+
+        html = Template('{% load images %}{% responsive_image wig.image alt=wig.name %}').render(Context({'wig': wig}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(f"{derivative_name(wig.image.name, 320, 'webp')} 320w", html)
+        self.assertIn(f"{derivative_name(wig.image.name, 1280, 'jpg')} 1280w", html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_backfill_command_fills_in_missing_derivatives(self):
+        style = HairStyle.objects.create(service=self.shop, name='Knotless', description='',
+                                         image=image_upload('knotless.jpg', (200, 300), image_format='JPEG'))
+        for name in style.image.storage.listdir('hairstyles')[1]:
+            if '.w' in name:
+                style.image.storage.remove(f'hairstyles/{name}')
+        # As rows saved before metadata was stored
+        HairStyle.objects.update(image_width=None, image_height=None, image_color='', image_placeholder='')
+        style = HairStyle.objects.get(pk=style.pk)
+        self.assertFalse(has_derivatives(style.image))
+        html = Template('{% load images %}{% responsive_image image %}').render(Context({'image': style.image}))
+        self.assertNotIn('srcset', html)
+
+        out = StringIO()
+        call_command('build_image_derivatives', stdout=out)
+        self.assertIn('Built derivatives for 1 images and stored metadata for 1', out.getvalue())
+        self.assertTrue(has_derivatives(style.image))
+        self.assertEqual(HairStyle.objects.get(pk=style.pk).image_width, 200)
+
+    def test_metadata_is_stored_once_and_rendered_without_file_access(self):
+        wig = Wig.objects.create(service=self.shop, name='Bob', description='', price=80,
+                                 image=image_upload('bob.png', (400, 200), color='#804020'))
+        wig = Wig.objects.get(pk=wig.pk)
+        self.assertEqual((wig.image_width, wig.image_height), (400, 200))
+        self.assertEqual(wig.image_color, '#804020')
+        self.assertTrue(wig.image_placeholder.startswith('data:image/webp;base64,'))
+        self.assertLess(len(wig.image_placeholder), 400)
+
+        storage = type(wig.image.storage)
+        with mock.patch.object(storage, 'exists', side_effect=AssertionError("exists()")), \
+                mock.patch.object(storage, 'open', side_effect=AssertionError("open()")):
+            html = Template(
+                '{% load images %}{% responsive_image wig.image style="height: 250px;" %}'
+            ).render(Context({'wig': wig}))
+            wig.save()  # an unchanged image is not read again
+        self.assertIn('width="400" height="200"', html)
+        self.assertIn(f'style="height: 250px; background: #804020 url({wig.image_placeholder})', html)
+
+        wig.image = image_upload('tall.png', (100, 300), mode='RGBA', color=(0, 0, 0, 0))
+        wig.save()
+        wig = Wig.objects.get(pk=wig.pk)
+        self.assertEqual((wig.image_width, wig.image_height), (100, 300))
+        # Transparent images get no placeholder to show through them
+        self.assertEqual(wig.image_placeholder, '')
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media = temporary_media(self)
+        self.shop = Service.objects.create(name='Shop', description='', service_type='order')
+
+    def wig(self, upload):
+        return Wig.objects.create(service=self.shop, name='Bob', description='', price=80, image=upload)
+
+    def test_identical_uploads_share_one_counted_file(self):
+        first = self.wig(image_upload('bob.png', (40, 40)))
+        second = self.wig(image_upload('bob-again.png', (40, 40)))
+        other = self.wig(image_upload('bob.png', (40, 40), color='gold'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertRegex(first.image.name, r'^wigs/[0-9a-f]{64}\.png$')
+        name = first.image.name
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 2)
+
+        first.image.delete(save=False)
+        self.assertTrue(os.path.exists(os.path.join(self.media, name)))
+        second.image.delete(save=False)
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media, name)))
+
+    def test_replacing_and_deleting_rows_release_their_files(self):
+        first = self.wig(image_upload('bob.png', (40, 40)))
+        second = self.wig(image_upload('bob-again.png', (40, 40)))
+        name = first.image.name
+        path = os.path.join(self.media, name)
+        derivative = os.path.join(self.media, derivative_name(name, IMAGE_WIDTHS[0], 'webp'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Wig.objects.get(pk=first.pk)
+            first.image = image_upload('gold.png', (40, 40), color='gold')
+            first.save()
+            first.price = 90
+            first.save()  # the old image is released only once
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+        self.assertEqual(Wig.objects.get(pk=first.pk).image_color, '#ffd700')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Wig.objects.filter(pk=second.pk).delete()
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertFalse(os.path.exists(path) or os.path.exists(derivative))
+
+        # Deleting the service cascades to its wigs
+        gold = os.path.join(self.media, first.image.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.delete()
+        self.assertFalse(MediaBlob.objects.exists() or os.path.exists(gold))
+
+    def test_files_that_were_never_counted_are_kept(self):
+        os.makedirs(os.path.join(self.media, 'wigs'))
+        path = os.path.join(self.media, 'wigs', 'legacy.png')
+        with open(path, 'wb') as handle:
+            handle.write(image_upload('legacy.png', (40, 40)).read())
+        wig = self.wig('wigs/legacy.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            wig.delete()
+        self.assertTrue(os.path.exists(path))
+
+    def test_dedupe_command_collapses_copies_and_rewrites_rows(self):
+        payload = image_upload('x.jpg', (40, 40), image_format='JPEG').read()
+        os.makedirs(os.path.join(self.media, 'subservices'))
+        for name in ('LI_2.jpg', 'LI_2_abc.jpg', 'LI_2_def.jpg'):
+            with open(os.path.join(self.media, 'subservices', name), 'wb') as handle:
+                handle.write(payload)
+        products = [
+            SubService.objects.create(service=self.shop, name=name, price=10, image=f'subservices/{name}')
+            for name in ('LI_2.jpg', 'LI_2_abc.jpg')
+        ]
+
+        out = StringIO()
+        call_command('dedupe_media', stdout=out)
+        self.assertIn('Rewrote 2 rows, deleted 3 duplicate files', out.getvalue())
+        names = {SubService.objects.get(pk=product.pk).image.name for product in products}
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertEqual(os.listdir(os.path.join(self.media, 'subservices')).count(os.path.basename(name)), 1)
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 2)
+        self.assertTrue(has_derivatives(SubService.objects.get(pk=products[0].pk).image))
+
+
+class MediaServingTests(TestCase):
+    digest = 'ab' * 32
+
+    def setUp(self):
+        self.media = temporary_media(self)
+        os.makedirs(os.path.join(self.media, 'wigs'))
+        self.write(f'wigs/{self.digest}.jpg', b'0123456789')
+
+    def write(self, name, payload):
+        with open(os.path.join(self.media, name), 'wb') as handle:
+            handle.write(payload)
+
+    def test_hashed_names_are_cached_for_good(self):
+        response = self.client.get(f'/media/wigs/{self.digest}.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['ETag'], f'"{self.digest}.jpg"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        again = self.client.get(f'/media/wigs/{self.digest}.jpg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_derivatives_are_immutable_only_under_versioned_names(self):
+        current = derivative_name(f'wigs/{self.digest}.jpg', 320, 'webp')
+        self.assertIn(f'.w320.{DERIVATIVE_VERSION}.webp', current)
+        self.write(current, b'webp')
+        self.write(f'wigs/{self.digest}.w320.webp', b'webp')  # named before versioning
+        self.assertEqual(self.client.get(f'/media/{current}')['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(
+            self.client.get(f'/media/wigs/{self.digest}.w320.webp')['Cache-Control'], 'public, max-age=3600',
+        )
+
+    def test_other_names_revalidate_hourly(self):
+        self.write('wigs/bob.jpg', b'bob')
+        response = self.client.get('/media/wigs/bob.jpg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        again = self.client.get('/media/wigs/bob.jpg', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_byte_ranges(self):
+        url = f'/media/wigs/{self.digest}.jpg'
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=20-').status_code, 416)
+        response = self.client.get(url, HTTP_RANGE='bytes=5-3')
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (200, b'0123456789'))
+        # A stale If-Range gets the whole, current file
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_precompressed_sibling_is_preferred(self):
+        self.write('wigs/logo.svg', b'<svg/>')
+        self.write('wigs/logo.svg.gz', b'gzipped')
+        response = self.client.get('/media/wigs/logo.svg', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(b''.join(response.streaming_content), b'gzipped')
+
+        plain = self.client.get('/media/wigs/logo.svg')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(plain['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['ETag'], plain['ETag'][:-1] + '-gz"')
+
+        # Each representation only revalidates against its own tag
+        cached = self.client.get('/media/wigs/logo.svg', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        stale = self.client.get('/media/wigs/logo.svg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(stale.status_code, 200)
+        self.assertFalse(stale.has_header('Content-Encoding'))
+
+    def test_paths_outside_media_root_are_not_served(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/wigs/missing.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/wigs').status_code, 404)
+        self.assertEqual(self.client.post(f'/media/wigs/{self.digest}.jpg').status_code, 405)
+
+
+class FakeSendGrid:
+    """Local HTTP server standing in for the SendGrid v3 API"""
+
+    def __init__(self, fail_first=0):
+        self.requests = []
+        self.fail_first = fail_first
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                fake.requests.append((self.path, json.loads(body)))
+                status = 500 if len(fake.requests) <= fake.fail_first else 202
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.host = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.sendgrid = FakeSendGrid()
+        self.addCleanup(self.sendgrid.close)
+        override = override_settings(SENDGRID_API_HOST=self.sendgrid.host)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user('ama', 'ama@example.com', 'pw')
+        self.service = Service.objects.create(name='Braids', description='', service_type='booking')
+        self.subservice = SubService.objects.create(
+            service=self.service, name='Box braids', price=50, duration=timedelta(minutes=60)
+        )
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def test_booking_only_enqueues(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('salon:book_appointment', args=[self.service.id]), {
+            'customer_name': 'Ama', 'customer_phone': '0123456789',
+            'customer_email': 'ama@example.com', 'subservice': self.subservice.id,
+            'appointment_date': datetime.combine(self.day, time(hour=10)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(OutboxEmail.objects.filter(status='pending').count(), 2)
+        self.assertEqual(self.sendgrid.requests, [])
+
+        call_command('send_outbox')
+
+        self.assertEqual(OutboxEmail.objects.filter(status='sent').count(), 2)
+        recipients = {body['personalizations'][0]['to'][0]['email'] for _, body in self.sendgrid.requests}
+        self.assertEqual(recipients, {'ama@example.com', 'admin@awinsohaircare.com'})
+        path, body = self.sendgrid.requests[0]
+        self.assertEqual(path, '/v3/mail/send')
+        self.assertIn('Box braids', body['content'][0]['value'])
+
+    def test_rolled_back_change_leaves_no_email(self):
+        appointment = Appointment.objects.create(
+            customer_name='Ama', customer_phone='0123456789', customer_email='ama@example.com',
+            service=self.service, appointment_date=aware(self.day, 10),
+        )
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                send_appointment_confirmation_to_customer(appointment)
+                raise RuntimeError()
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_failed_sends_back_off_and_retry(self):
+        self.sendgrid.fail_first = 1
+        appointment = Appointment.objects.create(
+            customer_name='Ama', customer_phone='0123456789', customer_email='ama@example.com',
+            service=self.service, appointment_date=aware(self.day, 10),
+        )
+        send_appointment_confirmation_to_customer(appointment)
+
+        dispatch_outbox()
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(dispatch_outbox(), 0)
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        dispatch_outbox()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('sent', 2))
+
+    def test_gives_up_after_max_attempts(self):
+        self.sendgrid.fail_first = OUTBOX_MAX_ATTEMPTS
+        appointment = Appointment.objects.create(
+            customer_name='Ama', customer_phone='0123456789', customer_email='ama@example.com',
+            service=self.service, appointment_date=aware(self.day, 10),
+        )
+        send_appointment_confirmation_to_customer(appointment)
+        for _ in range(OUTBOX_MAX_ATTEMPTS):
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+            dispatch_outbox()
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('failed', OUTBOX_MAX_ATTEMPTS))
+
+    def test_emails_from_one_template_share_a_request(self):
+        for n, name in enumerate(['Ama', 'Esi', 'Kofi']):
+            appointment = Appointment.objects.create(
+                customer_name=name, customer_phone='0123456789', customer_email=f'{name.lower()}@example.com',
+                service=self.service, subservice=self.subservice, appointment_date=aware(self.day, 9 + 2 * n),
+            )
+            send_appointment_confirmation_to_customer(appointment)
+        rendered = {
+            email.to_email: render_to_string(email.template, {'appointment': Appointment.objects.get(
+                customer_email=email.to_email)})
+            for email in OutboxEmail.objects.all()
+        }
+
+        dispatch_outbox()
+
+        self.assertEqual(OutboxEmail.objects.filter(status='sent').count(), 3)
+        self.assertEqual(len(self.sendgrid.requests), 1)
+        body = self.sendgrid.requests[0][1]
+        content = body['content'][0]['value']
+        self.assertIn(SENDGRID_BODY_TAG, content)
+        for personalization in body['personalizations']:
+            recipient = personalization['to'][0]['email']
+            self.assertEqual(content.replace(SENDGRID_BODY_TAG, personalization['substitutions'][SENDGRID_BODY_TAG]),
+                             rendered[recipient])
+            self.assertLess(len(personalization['substitutions'][SENDGRID_BODY_TAG]), len(content))
+
+    def test_concurrent_workers_get_disjoint_batches(self):
+        for n in range(4):
+            enqueue_email(f'c{n}@example.com', 'Hi', 'emails/cart_order_placed.html', {'lines': []})
+        batches = []
+        send_messages = SendGridEmailBackend.send_messages
+
+        def another_worker_runs_meanwhile(backend, messages):
+            batches.append(sorted(m.to[0] for m in messages))
+            if len(batches) == 1:
+                dispatch_outbox(batch_size=2)
+            return send_messages(backend, messages)
+
+        with mock.patch.object(SendGridEmailBackend, 'send_messages', another_worker_runs_meanwhile):
+            dispatch_outbox(batch_size=2)
+        self.assertEqual(batches, [['c0@example.com', 'c1@example.com'], ['c2@example.com', 'c3@example.com']])
+        self.assertEqual(OutboxEmail.objects.filter(status='sent').count(), 4)
+
+
+class SendGridBackendTests(TestCase):
+    def setUp(self):
+        self.sendgrid = FakeSendGrid()
+        self.addCleanup(self.sendgrid.close)
+        override = override_settings(SENDGRID_API_HOST=self.sendgrid.host)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_groups_shared_content_into_personalizations(self):
+        messages = [
+            EmailMessage('Reminder', '<p>See you soon</p>', None, ['a@example.com']),
+            EmailMessage('Reminder', '<p>See you soon</p>', None, ['b@example.com'], cc=['c@example.com']),
+            EmailMessage('Receipt', '<p>Thanks</p>', None, ['a@example.com']),
+        ]
+        sent = SendGridEmailBackend().send_messages(messages)
+
+        self.assertEqual(sent, 3)
+        self.assertEqual(len(self.sendgrid.requests), 2)
+        personalizations = self.sendgrid.requests[0][1]['personalizations']
+        self.assertCountEqual(personalizations, [
+            {'to': [{'email': 'a@example.com'}]},
+            {'to': [{'email': 'b@example.com'}], 'cc': [{'email': 'c@example.com'}]},
+        ])
+        self.assertEqual(messages[1].sendgrid_status, {'b@example.com': True, 'c@example.com': True})
+
+    def test_parts_too_big_to_substitute_go_alone(self):
+        messages = [
+            EmailMessage('Receipt', f'<p>Hi {name}</p>', None, [f'{name}@example.com']) for name in ('a', 'b')
+        ] + [EmailMessage('Receipt', f'<p>Hi {"c" * (SENDGRID_MAX_SUBSTITUTION_BYTES + 1)}</p>', None, ['c@example.com'])]
+        for message in messages:
+            message.template = 'emails/receipt.html'
+        self.assertEqual(SendGridEmailBackend().send_messages(messages), 3)
+
+        self.assertEqual(len(self.sendgrid.requests), 2)
+        alone, shared = sorted((body for _, body in self.sendgrid.requests), key=lambda body: len(body['personalizations']))
+        self.assertNotIn(SENDGRID_BODY_TAG, alone['content'][0]['value'])
+        self.assertEqual(shared['content'][0]['value'], f'<p>Hi {SENDGRID_BODY_TAG}</p>')
+        self.assertCountEqual([p['substitutions'] for p in shared['personalizations']],
+                              [{SENDGRID_BODY_TAG: 'a'}, {SENDGRID_BODY_TAG: 'b'}])
+
+    def test_reports_failed_recipients(self):
+        self.sendgrid.fail_first = 1
+        messages = [
+            EmailMessage('Reminder', '<p>See you soon</p>', None, ['a@example.com']),
+            EmailMessage('Receipt', '<p>Thanks</p>', None, ['b@example.com']),
+        ]
+        sent = SendGridEmailBackend(fail_silently=True).send_messages(messages)
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(messages[0].sendgrid_status, {'a@example.com': False})
+        self.assertEqual(messages[1].sendgrid_status, {'b@example.com': True})
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AdminDashboardTests(TestCase):
+    def setUp(self):
+        temporary_media(self)
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        self.client.force_login(self.staff)
+        self.url = reverse('salon:admin_dashboard')
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def add_services(self, rows):
+        booking = Service.objects.create(name='Braids', description='', service_type='booking')
+        cut = SubService.objects.create(service=booking, name='Cut', price=10, duration=timedelta(minutes=15))
+        shop = Service.objects.create(name='Shop', description='', service_type='order')
+        oil = SubService.objects.create(service=shop, name='Oil', price=5, stock=100)
+        wig = Wig.objects.create(service=shop, name='Bob', description='', price=80, stock=10,
+                                 image=image_upload('bob.jpg', (8, 8), image_format='JPEG'))
+        for n in range(rows):
+            Appointment.objects.create(
+                customer_name='Ama', customer_phone='0123456789', customer_email='ama@example.com',
+                service=booking, subservice=cut, appointment_date=aware(self.day, 8) + timedelta(minutes=30 * n),
+                status='pending' if n % 2 else 'confirmed',
+            )
+            WigOrder.objects.create(
+                wig=wig, customer_name='Esi', customer_phone='0123456789',
+                customer_email='esi@example.com', customer_address='Accra',
+            )
+            ProductOrder.objects.create(
+                subservice=oil, customer_name='Kofi', customer_phone='0123456789',
+                product_name='Oil', total_price=5,
+            )
+        return booking
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_is_constant(self):
+        self.add_services(rows=2)
+        baseline = self.count_queries()
+        for _ in range(3):
+            self.add_services(rows=5)
+        self.assertEqual(self.count_queries(), baseline)
+
+    def test_keyset_pagination_and_status_filter(self):
+        booking = self.add_services(rows=DASHBOARD_PAGE_SIZE + 5)
+        response = self.client.get(self.url)
+        entry = next(e for e in response.context['service_data'] if e['service'] == booking)
+        first_page = entry['items']
+        self.assertEqual(len(first_page), DASHBOARD_PAGE_SIZE)
+        self.assertEqual(first_page[0].status, 'pending')
+
+        response = self.client.get(self.url, {
+            'service': booking.id, 'after_appointments': entry['next_cursors']['appointments'],
+        })
+        entry = next(e for e in response.context['service_data'] if e['service'] == booking)
+        self.assertEqual(len(entry['items']), 5)
+        self.assertFalse({a.pk for a in entry['items']} & {a.pk for a in first_page})
+        self.assertEqual(entry['next_cursors'], {})
+
+        response = self.client.get(self.url, {'status': 'confirmed'})
+        entry = next(e for e in response.context['service_data'] if e['service'] == booking)
+        self.assertTrue(all(a.status == 'confirmed' for a in entry['items']))
+
+    def test_paging_one_list_keeps_the_others_in_place(self):
+        self.add_services(rows=DASHBOARD_PAGE_SIZE + 5)
+        shop = Service.objects.get(name='Shop')
+        entry = next(e for e in self.client.get(self.url).context['service_data'] if e['service'] == shop)
+        self.assertEqual(set(entry['more_links']), {'wigs', 'products'})
+
+        # Next page of products, then next page of wigs from there
+        response = self.client.get(f"{self.url}?{entry['more_links']['products']}")
+        entry = next(e for e in response.context['service_data'] if e['service'] == shop)
+        self.assertEqual(set(entry['more_links']), {'wigs'})
+        response = self.client.get(f"{self.url}?{entry['more_links']['wigs']}")
+        entry = next(e for e in response.context['service_data'] if e['service'] == shop)
+        self.assertEqual(len(entry['items']), 10)  # the second page of both lists
+        self.assertEqual(entry['more_links'], {})
+
+
+class StatusCounterTests(TestCase):
+    def setUp(self):
+        temporary_media(self)
+        self.service = Service.objects.create(name='Braids', description='', service_type='booking')
+        self.shop = Service.objects.create(name='Shop', description='', service_type='order')
+        self.oil = SubService.objects.create(service=self.shop, name='Oil', price=5, stock=10)
+        self.wig = Wig.objects.create(service=self.shop, name='Bob', description='', price=80, stock=5,
+                                      image=image_upload('bob.jpg', (8, 8), image_format='JPEG'))
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def counts(self, service, kind):
+        return StatusCounter.for_services([service]).get(service.id, {}).get(kind, {})
+
+    def book(self, hour):
+        return Appointment.objects.create(
+            customer_name='Ama', customer_phone='0123456789', customer_email='ama@example.com',
+            service=self.service, appointment_date=aware(self.day, hour),
+        )
+
+    def test_transitions_move_counters(self):
+        first, second, third = self.book(9), self.book(11), self.book(13)
+        self.assertEqual(self.counts(self.service, 'appointment'), {'pending': 3})
+
+        Appointment.objects.get(pk=first.pk).confirm_appointment()
+        second.cancel('client', 'busy')
+        third.complete()
+        self.assertEqual(
+            self.counts(self.service, 'appointment'),
+            {'pending': 0, 'confirmed': 1, 'cancelled': 1, 'completed': 1},
+        )
+
+        order = WigOrder.objects.create(
+            wig=self.wig, customer_name='Esi', customer_phone='0123456789',
+            customer_email='esi@example.com', customer_address='Accra',
+        )
+        order.confirm()
+        product = ProductOrder.objects.create(
+            subservice=self.oil, customer_name='Kofi', customer_phone='0123456789',
+            product_name='Oil', total_price=5,
+        )
+        product.cancel()
+        self.assertEqual(self.counts(self.shop, 'wig_order'), {'pending': 0, 'confirmed': 1})
+        self.assertEqual(self.counts(self.shop, 'product_order'), {'pending': 0, 'cancelled': 1})
+
+    def test_admin_bulk_actions_and_rebuild(self):
+        for hour in (9, 11, 13):
+            self.book(hour)
+        AppointmentAdmin(Appointment, admin.site).confirm_selected(None, Appointment.objects.filter(
+            appointment_date__lt=aware(self.day, 12)
+        ))
+        self.assertEqual(self.counts(self.service, 'appointment'), {'pending': 1, 'confirmed': 2})
+
+        incremental = self.counts(self.service, 'appointment')
+        StatusCounter.objects.all().delete()
+        call_command('rebuild_status_counters', stdout=StringIO())
+        self.assertEqual(self.counts(self.service, 'appointment'), {
+            status: n for status, n in incremental.items() if n
+        })
+
+    def test_every_delete_path_moves_counters(self):
+        for hour in (9, 11, 13):
+            self.book(hour)
+        Appointment.objects.filter(appointment_date__lt=aware(self.day, 12)).delete()
+        self.assertEqual(self.counts(self.service, 'appointment'), {'pending': 1})
+        AppointmentAdmin(Appointment, admin.site).delete_queryset(None, Appointment.objects.all())
+        self.assertEqual(self.counts(self.service, 'appointment'), {'pending': 0})
+
+        for _ in range(2):
+            WigOrder.objects.create(
+                wig=self.wig, customer_name='Esi', customer_phone='0123456789',
+                customer_email='esi@example.com', customer_address='Accra',
+            )
+            ProductOrder.objects.create(
+                subservice=self.oil, customer_name='Kofi', customer_phone='0123456789',
+                product_name='Oil', total_price=5,
+            )
+        # Orders cascade with the wig; product orders lose their subservice
+        self.wig.delete()
+        self.oil.delete()
+        self.assertEqual(self.counts(self.shop, 'wig_order'), {'pending': 0})
+        self.assertEqual(self.counts(self.shop, 'product_order'), {'pending': 0})
+        self.assertEqual(ProductOrder.objects.filter(subservice__isnull=True).count(), 2)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AdminChangelistQueryTests(TestCase):
+    def setUp(self):
+        temporary_media(self)
+        self.admin_user = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(self.admin_user)
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def add_rows(self, n):
+        for i in range(n):
+            service = Service.objects.create(name=f'Service {i}', description='', service_type='booking')
+            sub = SubService.objects.create(service=service, name='Cut', price=10 + i, duration=timedelta(minutes=30))
+            SubService.objects.create(service=service, name='Wash', price=5, duration=timedelta(minutes=15))
+            Appointment.objects.create(
+                customer_name='Ama', customer_phone='0123456789', customer_email='ama@example.com',
+                service=service, subservice=sub, appointment_date=aware(self.day, 9),
+            )
+            shop = Service.objects.create(name=f'Shop {i}', description='', service_type='order')
+            wig = Wig.objects.create(service=shop, name=f'Wig {i}', description='', price=50, stock=3,
+                                     image=image_upload('x.jpg', (8, 8), image_format='JPEG'))
+            WigOrder.objects.create(
+                wig=wig, customer_name='Esi', customer_phone='0123456789',
+                customer_email='esi@example.com', customer_address='Accra',
+            )
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:salon_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelists_run_constant_queries(self):
+        models = ['service', 'subservice', 'appointment', 'wigorder']
+        self.add_rows(2)
+        baseline = {model: self.changelist_queries(model) for model in models}
+        self.add_rows(8)
+        self.assertEqual({model: self.changelist_queries(model) for model in models}, baseline)
+
+    def test_service_ranges_come_from_annotations(self):
+        self.add_rows(1)
+        service = ServiceAdmin(Service, admin.site).get_queryset(None).get(name='Service 0')
+        self.assertEqual((service.min_price, service.max_price), (5, 10))
+        response = self.client.get(reverse('admin:salon_service_changelist'))
+        self.assertContains(response, '0:15:00 - 0:30:00')
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class MyOrdersFeedTests(TestCase):
+    def setUp(self):
+        temporary_media(self)
+        self.user = User.objects.create_user('ama', 'ama@example.com', 'pw')
+        shop = Service.objects.create(name='Shop', description='', service_type='order')
+        oil = SubService.objects.create(service=shop, name='Oil', price=5, stock=100)
+        wig = Wig.objects.create(service=shop, name='Bob', description='', price=80, stock=50,
+                                 image=image_upload('bob.jpg', (8, 8), image_format='JPEG'))
+        for n in range(15):
+            ProductOrder.objects.create(
+                user=self.user, subservice=oil, customer_name='Ama', customer_phone='0123456789',
+                product_name='Oil', total_price=5,
+            )
+            WigOrder.objects.create(
+                user=self.user, wig=wig, customer_name='Ama', customer_phone='0123456789',
+                customer_email='ama@example.com', customer_address='Accra',
+            )
+        # Give some rows identical timestamps to exercise the tie-breakers
+        same = timezone.now()
+        ProductOrder.objects.filter(pk__lte=ProductOrder.objects.order_by('pk')[4].pk).update(created_at=same)
+        WigOrder.objects.filter(pk__lte=WigOrder.objects.order_by('pk')[4].pk).update(created_at=same)
+        self.client.force_login(self.user)
+
+    def test_keyset_pages_cover_every_order_once(self):
+        seen = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                rows, next_cursor = order_feed(self.user, decode_feed_cursor(cursor), limit=7)
+            seen.extend((row['kind'], row['id']) for row in rows)
+            if not next_cursor:
+                break
+            cursor = next_cursor
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(len(set(seen)), 30)
+        created = {('product', o.pk): o.created_at for o in ProductOrder.objects.all()}
+        created.update({('wig', o.pk): o.created_at for o in WigOrder.objects.all()})
+        keys = [(created[item], *item) for item in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_page_renders_projected_columns(self):
+        response = self.client.get(reverse('salon:my_orders'))
+        self.assertContains(response, 'Bob (Wig)')
+        self.assertContains(response, 'Oil (Product)')
+        self.assertEqual(len(response.context['orders']), MY_ORDERS_PAGE_SIZE)
+        self.assertIsNotNone(response.context['next_cursor'])
+
+    def test_order_pages_are_only_shown_to_their_customer_and_staff(self):
+        wig_order = WigOrder.objects.first()
+        product_order = ProductOrder.objects.first()
+        for url in (reverse('salon:view_wig_order', args=[wig_order.pk]),
+                    reverse('salon:view_order', args=[product_order.pk])):
+            self.assertContains(self.client.get(url), 'Accra' if 'wig' in url else 'Oil')
+
+            self.client.force_login(User.objects.get_or_create(username='kofi')[0])
+            self.assertEqual(self.client.get(url).status_code, 404)
+            self.client.force_login(User.objects.get_or_create(username='staff', is_staff=True)[0])
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.client.logout()
+            self.assertEqual(self.client.get(url).status_code, 302)
+            self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('salon:view_wig_order', args=[wig_order.pk])), 'Bob (Wig)')
+
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'search'},
+    },
+)
+class SearchTests(TestCase):
+    def setUp(self):
+        temporary_media(self)
+        self.braiding = Service.objects.create(
+            name='Braiding', description='Protective styles by the hour', service_type='booking',
+        )
+        self.knotless = SubService.objects.create(
+            service=self.braiding, name='Knotless braids', description='Long-lasting, lightweight',
+            price=120, duration=timedelta(hours=4),
+        )
+        self.shop = Service.objects.create(name='Wig shop', description='Lace fronts and closures', service_type='order')
+        self.lace = Wig.objects.create(service=self.shop, name='Lace front bob', description='Café au lait',
+                                       price=90, image=image_upload('bob.jpg', (8, 8), image_format='JPEG'))
+
+    def test_index_follows_saves_and_deletes(self):
+        self.assertEqual(search_catalog('knot BRAI'), [('subservice', self.knotless.pk)])
+        # Stemmed, accent-insensitive, and title matches rank first
+        self.assertIn(('subservice', self.knotless.pk), search_catalog('braided'))
+        self.assertEqual(search_catalog('cafe'), [('wig', self.lace.pk)])
+        self.assertEqual(search_catalog('lace'), [('wig', self.lace.pk), ('service', self.shop.pk)])
+        self.assertEqual(search_catalog('!!'), [])
+
+        self.knotless.name = 'Cornrows'
+        self.knotless.save()
+        self.assertEqual(search_catalog('knotless'), [])
+        self.assertEqual(search_catalog('cornrow'), [('subservice', self.knotless.pk)])
+
+        self.braiding.delete()
+        self.assertEqual(search_catalog('cornrow'), [])
+        self.assertFalse(SearchEntry.objects.filter(kind='subservice').exists())
+
+    def test_search_page_lists_active_items_and_refreshes_on_save(self):
+        hidden = Service.objects.create(name='Braiding (old)', description='', service_type='booking', is_active=False)
+        SubService.objects.create(service=hidden, name='Box braids', description='', price=80)
+
+        response = self.client.get(reverse('salon:search'), {'q': 'braid'})
+        self.assertEqual(response.status_code, 200)
+        self.assertCountEqual([result['item'] for result in response.context['results']], [self.knotless, self.braiding])
+        self.assertContains(response, reverse('salon:service_detail', args=[self.braiding.pk]))
+        self.assertEqual(
+            self.client.get(reverse('salon:search'), {'q': 'braid'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            304,
+        )
+
+        self.knotless.is_active = False
+        self.knotless.save()
+        response = self.client.get(reverse('salon:search'), {'q': 'Braid!'})
+        self.assertEqual([result['item'] for result in response.context['results']], [self.braiding])
+        self.assertEqual(self.client.get(reverse('salon:search')).context['results'], [])
+
+    def test_items_of_inactive_services_are_filtered_before_the_limit(self):
+        hidden = Service.objects.create(name='Archive', description='', service_type='booking', is_active=False)
+        SubService.objects.bulk_create([
+            SubService(service=hidden, name=f'Braids {n}', description='', price=10) for n in range(SEARCH_LIMIT)
+        ])
+        for item in SubService.objects.filter(service=hidden):
+            SearchEntry.index(item)
+        self.assertIn(('subservice', self.knotless.pk), search_catalog('braids'))
+
+        self.braiding.is_active = False
+        self.braiding.save()
+        self.assertEqual(search_catalog('knotless'), [])
+        self.braiding.is_active = True
+        self.braiding.save()
+        self.assertEqual(search_catalog('knotless'), [('subservice', self.knotless.pk)])
+
+    def test_admin_search_uses_the_index(self):
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pw'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:salon_wig_changelist'), {'q': 'au lait'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.lace])
+        self.assertFalse([query for query in queries if 'LIKE' in query['sql']])
+        # The matches are a subquery, never fetched as an id list first
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT e.')])
+
+        # Terms without words fall back to icontains over the same fields the index covers
+        Wig.objects.filter(pk=self.lace.pk).update(description='Café au lait & honey')
+        response = self.client.get(reverse('admin:salon_wig_changelist'), {'q': '&'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.lace])
+
+    def test_rebuild_command_restores_the_index(self):
+        SearchEntry.objects.all().delete()
+        self.assertEqual(search_catalog('knotless'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 4 catalog items', out.getvalue())
+        self.assertEqual(search_catalog('knotless'), [('subservice', self.knotless.pk)])
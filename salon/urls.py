@@ -15,6 +15,7 @@ urlpatterns = [
     # Main pages
     path('', views.index, name='index'),
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('admin-dashboard/catalog-cache/', views.catalog_cache_status, name='catalog_cache_status'),
     path("availability/<int:service_id>/", views.check_availability, name="check_availability"),
 
      # Product Order URLs
@@ -26,10 +27,18 @@ urlpatterns = [
     path('services/<int:service_id>/', views.service_detail, name='service_detail'),
     path('services/<int:service_id>/delete/', views.delete_service, name='delete_service'),
     path('services/', views.service_list, name='service_list'),
+    path('search/', views.search, name='search'),
 
 
     path('order/product/<int:service_id>/<int:subservice_id>/', views.order_product, name='order_product'),
     path('order/<int:order_id>/', views.view_order, name='view_order'),
+    path('order/wig/<int:order_id>/', views.view_wig_order, name='view_wig_order'),
+
+    # Cart URLs
+    path('cart/', views.view_cart, name='view_cart'),
+    path('cart/add/', views.cart_add, name='cart_add'),
+    path('cart/remove/<str:kind>/<int:item_id>/', views.cart_remove, name='cart_remove'),
+    path('cart/checkout/', views.checkout, name='checkout'),
     # Appointment URLs
     path('book/<int:service_id>/', views.book_appointment, name='book_appointment'),
     path('appointments/', views.appointment_list, name='appointment_list'),
@@ -3,17 +3,27 @@ from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from datetime import timedelta
+from django.db import transaction, IntegrityError
+from datetime import datetime, time, timedelta
 import logging
+import os
+from django.core.mail import EmailMessage
 from django.core.mail.backends.base import BaseEmailBackend
 from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Content, To, From, Subject, TrackingSettings, ClickTracking, OpenTracking
+from sendgrid.helpers.mail import (
+    Mail, Content, To, Cc, Bcc, From, Subject, Personalization, Substitution,
+    TrackingSettings, ClickTracking, OpenTracking,
+)
+import requests
 import json
+from functools import wraps
+from django.http import HttpResponse, JsonResponse
 
 logger = logging.getLogger(__name__)
 
-# Create a SendGrid client instance
-sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
+def get_sendgrid_client():
+    """Create a SendGrid client for the configured key and API host"""
+    return SendGridAPIClient(settings.SENDGRID_API_KEY, host=settings.SENDGRID_API_HOST)
 
 # Email Functions using SendGrid directly
 def send_sendgrid_email(to_email, subject, html_content, from_email=None):
@@ -43,7 +53,7 @@ def send_sendgrid_email(to_email, subject, html_content, from_email=None):
             mail.tracking_settings = tracking_settings
         
         # Send email
-        response = sg.send(mail)
+        response = get_sendgrid_client().send(mail)
         
         if response.status_code in [200, 202]:
             logger.info(f"Email sent successfully to {to_email}")
@@ -56,138 +66,216 @@ def send_sendgrid_email(to_email, subject, html_content, from_email=None):
         logger.error(f"Error sending email via SendGrid: {e}")
         return False
 
+# Email outbox: views enqueue inside their transaction, send_outbox delivers
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF = timedelta(seconds=30)
+OUTBOX_LEASE = timedelta(minutes=5)
+
+def enqueue_email(to_email, subject, template, context):
+    """Queue a templated email for the outbox worker.
+
+    Model instances in ``context`` are stored as references and re-loaded
+    when the email is rendered, so the row commits or rolls back together
+    with the change that triggered it.
+    """
+    from .models import OutboxEmail
+
+    if not to_email:
+        logger.warning(f"Not queueing '{subject}': no recipient address")
+        return False
+
+    stored_context = {}
+    for key, value in context.items():
+        if hasattr(value, '_meta') and hasattr(value, 'pk'):
+            stored_context[key] = {'__model__': value._meta.label_lower, 'pk': value.pk}
+        else:
+            stored_context[key] = value
+
+    OutboxEmail.objects.create(
+        to_email=to_email,
+        subject=subject,
+        template=template,
+        context=stored_context,
+    )
+    return True
+
+def _load_outbox_contexts(emails):
+    """Resolve stored model references for a batch with one query per model.
+
+    Emails whose referenced objects have been deleted map to None.
+    """
+    from django.apps import apps
+
+    wanted = {}
+    for email in emails:
+        for value in email.context.values():
+            if isinstance(value, dict) and '__model__' in value:
+                wanted.setdefault(value['__model__'], set()).add(value['pk'])
+
+    instances = {
+        label: apps.get_model(label).objects.in_bulk(list(pks))
+        for label, pks in wanted.items()
+    }
+
+    contexts = {}
+    for email in emails:
+        context = {}
+        for key, value in email.context.items():
+            if isinstance(value, dict) and '__model__' in value:
+                value = instances[value['__model__']].get(value['pk'])
+                if value is None:
+                    context = None
+                    break
+            context[key] = value
+        contexts[email.pk] = context
+    return contexts
+
+def dispatch_outbox(batch_size=50):
+    """Render and send one batch of due outbox emails.
+
+    Several workers can run at once: each claims its batch with
+    SELECT ... FOR UPDATE SKIP LOCKED (on PostgreSQL) and a lease. Failures
+    are retried with exponential backoff until OUTBOX_MAX_ATTEMPTS, after
+    which the email is marked failed. Returns the batch size so
+    callers can keep draining while full batches come back.
+    """
+    from .models import OutboxEmail
+
+    now = timezone.now()
+    # Claim the batch: rows another worker has locked are skipped, and the
+    # lease keeps them out of other batches until this one is done
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'pk')[:batch_size]
+        )
+        if not batch:
+            return 0
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+            next_attempt_at=now + OUTBOX_LEASE
+        )
+
+    contexts = _load_outbox_contexts(batch)
+
+    messages = {}
+    for email in batch:
+        email.attempts += 1
+        context = contexts[email.pk]
+        try:
+            if context is None:
+                raise LookupError("A referenced object no longer exists")
+            html_message = render_to_string(email.template, context)
+        except Exception as e:
+            logger.error(f"Error rendering outbox email {email.pk}: {e}", exc_info=True)
+            email.last_error = str(e)
+            continue
+        message = EmailMessage(email.subject, html_message, settings.DEFAULT_FROM_EMAIL, [email.to_email])
+        # Emails from one template share a request (SendGridEmailBackend)
+        message.template = email.template
+        messages[email.pk] = message
+
+    # One keep-alive session for the whole batch
+    SendGridEmailBackend(fail_silently=True).send_messages(list(messages.values()))
+
+    for email in batch:
+        message = messages.get(email.pk)
+        delivered = message is not None and all(getattr(message, 'sendgrid_status', {None: False}).values())
+        if message is not None:
+            email.last_error = '' if delivered else 'SendGrid did not accept the message'
+
+        if delivered:
+            email.status = 'sent'
+            email.sent_at = timezone.now()
+        elif email.attempts >= OUTBOX_MAX_ATTEMPTS:
+            email.status = 'failed'
+        else:
+            email.next_attempt_at = now + OUTBOX_BACKOFF * 2 ** (email.attempts - 1)
+
+    OutboxEmail.objects.bulk_update(
+        batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+    )
+    return len(batch)
+
 def send_appointment_request_notification(appointment):
-    """Send email to admin about NEW appointment request (pending)"""
+    """Queue email to admin about NEW appointment request (pending)"""
     subject = f'New Appointment Request: {appointment.service.name}'
-    
-    html_message = render_to_string('emails/appointment_request_notification.html', {
+    return enqueue_email(settings.ADMIN_EMAIL, subject, 'emails/appointment_request_notification.html', {
         'appointment': appointment,
     })
-    
-    return send_sendgrid_email(settings.ADMIN_EMAIL, subject, html_message)
 
 def send_appointment_request_acknowledgement(appointment):
-    """Send acknowledgement to customer that request was received (not confirmed yet)"""
+    """Queue acknowledgement to customer that request was received (not confirmed yet)"""
     subject = f'Appointment Request Received - {appointment.service.name}'
-    
-    html_message = render_to_string('emails/appointment_request_received.html', {
+    return enqueue_email(appointment.customer_email, subject, 'emails/appointment_request_received.html', {
         'appointment': appointment,
     })
-    
-    return send_sendgrid_email(appointment.customer_email, subject, html_message)
 
 def send_appointment_confirmation_to_customer(appointment):
-    """Send confirmation email to customer AFTER admin confirms"""
+    """Queue confirmation email to customer AFTER admin confirms"""
     subject = f'Appointment Confirmed - {appointment.service.name}'
-    
-    try:
-        html_message = render_to_string('emails/appointment_confirmed.html', {
-            'appointment': appointment,
-        })
-        
-        return send_sendgrid_email(appointment.customer_email, subject, html_message)
-    except Exception as e:
-        logger.error(f"Error sending appointment confirmation email: {e}", exc_info=True)
-        return False
+    return enqueue_email(appointment.customer_email, subject, 'emails/appointment_confirmed.html', {
+        'appointment': appointment,
+    })
 
 def send_order_confirmation_to_customer(order, order_type):
-    """Send confirmation email to customer after order is confirmed"""
+    """Queue confirmation email to customer after order is confirmed"""
     if order_type == 'wig':
         subject = f'Order Confirmed - Wig Purchase'
         template = 'emails/wig_order_confirmed.html'
     else:  # product order
         subject = f'Order Confirmed - Product Purchase'
         template = 'emails/product_order_confirmed.html'
-    
-    try:
-        html_message = render_to_string(template, {
-            'order': order,
-            'order_type': order_type,
-        })
-        
-        return send_sendgrid_email(order.customer_email, subject, html_message)
-    except Exception as e:
-        logger.error(f"Error sending order confirmation email: {e}", exc_info=True)
-        return False
+
+    return enqueue_email(order.customer_email, subject, template, {
+        'order': order,
+        'order_type': order_type,
+    })
 
 def send_order_cancellation_email(order, order_type):
-    """Send cancellation email to customer when order is cancelled"""
+    """Queue cancellation email to customer when order is cancelled"""
     if order_type == 'wig':
         subject = f'Order Cancelled - Wig Purchase'
         template = 'emails/wig_order_cancelled.html'
     else:  # product order
         subject = f'Order Cancelled - Product Purchase'
         template = 'emails/product_order_cancelled.html'
-    
-    try:
-        html_message = render_to_string(template, {
-            'order': order,
-            'order_type': order_type,
-        })
-        
-        return send_sendgrid_email(order.customer_email, subject, html_message)
-    except Exception as e:
-        logger.error(f"Error sending order cancellation email: {e}", exc_info=True)
-        return False
+
+    return enqueue_email(order.customer_email, subject, template, {
+        'order': order,
+        'order_type': order_type,
+    })
 
 def send_appointment_cancellation_email(appointment, reason):
-    """Send cancellation email to customer with reason"""
+    """Queue cancellation email to customer with reason"""
     subject = f'Appointment Cancelled - {appointment.service.name}'
-    
-    try:
-        html_message = render_to_string('emails/appointment_cancelled.html', {
-            'appointment': appointment,
-            'reason': reason,
-        })
-        
-        return send_sendgrid_email(appointment.customer_email, subject, html_message)
-    except Exception as e:
-        logger.error(f"Error sending appointment cancellation email: {e}", exc_info=True)
-        return False
+    return enqueue_email(appointment.customer_email, subject, 'emails/appointment_cancelled.html', {
+        'appointment': appointment,
+        'reason': reason,
+    })
 
 def send_appointment_cancellation_notification_to_admin(appointment, reason):
-    """Send notification to admin when client cancels"""
+    """Queue notification to admin when client cancels"""
     subject = f'Client Cancellation: {appointment.service.name} - {appointment.customer_name}'
-    
-    try:
-        html_message = render_to_string('emails/appointment_cancelled_admin.html', {
-            'appointment': appointment,
-            'reason': reason,
-        })
-        
-        return send_sendgrid_email(settings.ADMIN_EMAIL, subject, html_message)
-    except Exception as e:
-        logger.error(f"Error sending admin cancellation notification: {e}", exc_info=True)
-        return False
+    return enqueue_email(settings.ADMIN_EMAIL, subject, 'emails/appointment_cancelled_admin.html', {
+        'appointment': appointment,
+        'reason': reason,
+    })
 
 def send_appointment_cancellation_confirmation(appointment, reason):
-    """Send confirmation email to client when they cancel"""
+    """Queue confirmation email to client when they cancel"""
     subject = f'Appointment Cancellation Confirmation - {appointment.service.name}'
-    
-    try:
-        html_message = render_to_string('emails/appointment_cancelled_client.html', {
-            'appointment': appointment,
-            'reason': reason,
-        })
-        
-        return send_sendgrid_email(appointment.customer_email, subject, html_message)
-    except Exception as e:
-        logger.error(f"Error sending client cancellation confirmation: {e}", exc_info=True)
-        return False
+    return enqueue_email(appointment.customer_email, subject, 'emails/appointment_cancelled_client.html', {
+        'appointment': appointment,
+        'reason': reason,
+    })
 
 def send_payment_confirmation_to_customer(appointment):
-    """Send payment confirmation email to customer"""
+    """Queue payment confirmation email to customer"""
     subject = f'Payment Confirmed - {appointment.service.name}'
-    
-    try:
-        html_message = render_to_string('emails/payment_confirmed.html', {
-            'appointment': appointment,
-        })
-        
-        return send_sendgrid_email(appointment.customer_email, subject, html_message)
-    except Exception as e:
-        logger.error(f"Error sending payment confirmation email: {e}", exc_info=True)
-        return False
+    return enqueue_email(appointment.customer_email, subject, 'emails/payment_confirmed.html', {
+        'appointment': appointment,
+    })
 
 # Utility Functions (unchanged)
 def process_payment_method(request):
@@ -211,80 +299,361 @@ def calculate_duration(subservice=None, estimated_duration=None):
         return estimated_duration
     return timedelta(minutes=60)
 
+APPOINTMENT_BUFFER = timedelta(minutes=10)
+SLOT_STEP = timedelta(minutes=15)
+OPENING_HOUR = 8
+CLOSING_HOUR = 20
+
+
+def opening_hours(day):
+    """Return the aware (open, close) datetimes for a calendar day"""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(day, time(hour=OPENING_HOUR)), tz),
+        timezone.make_aware(datetime.combine(day, time(hour=CLOSING_HOUR)), tz),
+    )
+
+
+def get_busy_intervals(service, window_start, window_end):
+    """Load the service's active appointments overlapping a window in one query.
+
+    Returns a sorted list of (start, blocked_until) tuples.
+    """
+    from .models import Appointment
+
+    return list(Appointment.objects.filter(
+        service=service,
+        status__in=["pending", "confirmed"],
+        appointment_date__lt=window_end + APPOINTMENT_BUFFER,
+        blocked_until__gt=window_start,
+    ).order_by('appointment_date').values_list('appointment_date', 'blocked_until'))
+
+
+def sweep_free_slots(day_start, day_end, duration, intervals, step=SLOT_STEP):
+    """Return every slot start in [day_start, day_end) that fits `duration`.
+
+    A candidate conflicts with a busy (start, end) interval when
+    candidate < end and start < candidate + duration + buffer, which is the
+    same rule check_time_conflict applies. Each busy interval therefore
+    blocks candidates in (start - duration - buffer, end); the blocked
+    ranges are walked once alongside the candidates.
+    """
+    lead = duration + APPOINTMENT_BUFFER
+    blocked = []
+    for start, end in sorted((start - lead, end) for start, end in intervals):
+        if blocked and start < blocked[-1][1]:
+            blocked[-1][1] = max(blocked[-1][1], end)
+        else:
+            blocked.append([start, end])
+
+    slots = []
+    index = 0
+    current = day_start
+    while current + duration <= day_end:
+        while index < len(blocked) and blocked[index][1] <= current:
+            index += 1
+        if index == len(blocked) or not blocked[index][0] < current:
+            slots.append(current)
+        current += step
+
+    return slots
+
+
 def check_time_conflict(service, start_time, duration, exclude_appointment=None):
-    """Check for time conflicts - reusable function"""
+    """Check for time conflicts - reusable function
+
+    Uses the stored blocked_until span, so this is a single bounded overlap
+    query on the (service, status, appointment_date, blocked_until) index.
+    """
     from .models import Appointment
-    
-    end_time = start_time + duration
-    end_with_buffer = end_time + timedelta(minutes=10)
-    
+
+    end_with_buffer = start_time + duration + APPOINTMENT_BUFFER
+
     existing = Appointment.objects.filter(
         service=service,
-        status__in=["pending", "confirmed"]
+        status__in=["pending", "confirmed"],
+        appointment_date__lt=end_with_buffer,
+        blocked_until__gt=start_time,
     )
-    
+
     if exclude_appointment:
         existing = existing.exclude(pk=exclude_appointment.pk)
-    
-    for other in existing:
-        other_duration = calculate_duration(other.subservice, other.estimated_duration)
-        other_start = other.appointment_date
-        other_end = other_start + other_duration
-        other_end_with_buffer = other_end + timedelta(minutes=10)
-        
-        if start_time < other_end_with_buffer and other_start < end_with_buffer:
-            return {
-                'conflict': True,
-                'conflict_start': other_start,
-                'conflict_end': other_end_with_buffer
-            }
-    
+
+    other = existing.order_by('appointment_date').values('appointment_date', 'blocked_until').first()
+    if other:
+        return {
+            'conflict': True,
+            'conflict_start': other['appointment_date'],
+            'conflict_end': other['blocked_until']
+        }
+
     return {'conflict': False}
 
+# PostgreSQL exclusion constraint added by migration 0021
+OVERLAP_CONSTRAINT = 'appointment_no_overlap'
+
+def is_overlap_violation(error):
+    """True if an IntegrityError came from the appointment_no_overlap constraint"""
+    diag = getattr(error.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None) == OVERLAP_CONSTRAINT
+
+def save_appointment_if_free(appointment, duration):
+    """Save the appointment unless its slot is taken.
+
+    The conflict check and insert run under the booking lock for the
+    appointment's service and day, so only bookings that could actually
+    collide wait on each other. Returns the check_time_conflict result.
+    """
+    from .models import BookingLock
+
+    with transaction.atomic():
+        BookingLock.acquire(appointment.service, timezone.localdate(appointment.appointment_date))
+        conflict_result = check_time_conflict(
+            appointment.service, appointment.appointment_date, duration,
+            appointment if appointment.pk else None
+        )
+        if not conflict_result['conflict']:
+            try:
+                with transaction.atomic():
+                    appointment.save()
+            except IntegrityError as e:
+                # PostgreSQL's appointment_no_overlap constraint caught a clash
+                if not is_overlap_violation(e):
+                    raise
+                conflict_result = {'conflict': True}
+    return conflict_result
+
+def save_order_if_in_stock(order, item, quantity):
+    """Take quantity units of item, save the order and record the
+    reservation in one transaction.
+
+    Returns False, leaving stock and orders untouched, when fewer than
+    quantity units are left.
+    """
+    from .models import StockMovement
+
+    with transaction.atomic():
+        if not type(item).take_stock(item.pk, quantity):
+            return False
+        order.save()
+        StockMovement.record(item, 'reserve', quantity, order)
+    return True
+
+# Idempotency keys
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+
+def idempotent(view):
+    """Run a POST view at most once per idempotency key.
+
+    The key comes from the Idempotency-Key header or a hidden
+    ``idempotency_key`` form field. The first response is stored and
+    repeats with the same key get it back without the view running again.
+    Requests without a key, and server errors, are not recorded.
+    """
+    from .models import IdempotencyKey
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = None
+        if request.method == 'POST':
+            key = request.headers.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD)
+        if not key:
+            return view(request, *args, **kwargs)
+
+        if request.user.is_authenticated:
+            scope = f"user:{request.user.pk}"
+        else:
+            if not request.session.session_key:
+                request.session.save()
+            scope = f"session:{request.session.session_key}"
+
+        record, claimed = IdempotencyKey.claim(scope, key[:100], request.path)
+        if not claimed:
+            if record.path != request.path:
+                return JsonResponse({'error': 'Idempotency key was already used for a different request'}, status=422)
+            if record.status_code is None:
+                return JsonResponse({'error': 'A request with this idempotency key is still being processed'}, status=409)
+            response = HttpResponse(bytes(record.body), status=record.status_code, content_type=record.content_type)
+            if record.location:
+                response['Location'] = record.location
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500 or response.streaming:
+            record.delete()
+        else:
+            record.store(response)
+        return response
+
+    return wrapper
+
 # Enhanced SendGridEmailBackend
+SENDGRID_MAX_PERSONALIZATIONS = 1000
+# SendGrid's limit on the substitutions of one personalization
+SENDGRID_MAX_SUBSTITUTION_BYTES = 10000
+# Stands in for each recipient's own part of a shared body
+SENDGRID_BODY_TAG = '%salon_body%'
+
+def shared_content(bodies):
+    """(content, parts): the bodies' common start and end around
+    SENDGRID_BODY_TAG, and what each body has in its place. parts is None
+    when the bodies are identical.
+    """
+    if len(set(bodies)) == 1:
+        return bodies[0], None
+    prefix = os.path.commonprefix(bodies)
+    tails = [body[len(prefix):] for body in bodies]
+    suffix = os.path.commonprefix([tail[::-1] for tail in tails])[::-1]
+    parts = [tail[:len(tail) - len(suffix)] for tail in tails]
+    return prefix + SENDGRID_BODY_TAG + suffix, parts
+
 class SendGridEmailBackend(BaseEmailBackend):
+    """Send through the SendGrid v3 API over one keep-alive HTTP session.
+
+    Messages from one sender rendered from the same template (a
+    ``template`` attribute, as dispatch_outbox sets) or with the same
+    subject and body are posted as a single API call. The body they share
+    is sent once, and each message's personalization carries its own
+    subject and, as a substitution, the part of the body that differs.
+    After sending, each message carries ``sendgrid_status``, a
+    {recipient: bool} map of the outcome.
+    """
+
     def __init__(self, fail_silently=False, **kwargs):
         super().__init__(fail_silently=fail_silently, **kwargs)
-        self.sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
+        self.session = None
+        self.tracking_settings = self._build_tracking_settings()
+
+    @staticmethod
+    def _build_tracking_settings():
+        if not hasattr(settings, 'SENDGRID_TRACKING_SETTINGS'):
+            return None
+        tracking_settings = TrackingSettings()
+        if settings.SENDGRID_TRACKING_SETTINGS.get('click_tracking', True):
+            tracking_settings.click_tracking = ClickTracking(
+                enable=True,
+                enable_text=True
+            )
+        if settings.SENDGRID_TRACKING_SETTINGS.get('open_tracking', True):
+            tracking_settings.open_tracking = OpenTracking(enable=True)
+        return tracking_settings
+
+    def open(self):
+        if self.session is not None:
+            return False
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {settings.SENDGRID_API_KEY}',
+            'Accept': 'application/json',
+        })
+        return True
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
 
     def send_messages(self, email_messages):
         if not email_messages:
             return 0
-        
-        success_count = 0
+
+        groups = {}
         for email_message in email_messages:
-            try:
-                # Create Mail object with HTML content
-                mail = Mail(
-                    from_email=From(email_message.from_email or settings.DEFAULT_FROM_EMAIL),
-                    to_emails=To(email_message.to),
-                    subject=Subject(email_message.subject),
-                    html_content=Content("text/html", email_message.body)
-                )
-                
-                # Add tracking settings if configured
-                if hasattr(settings, 'SENDGRID_TRACKING_SETTINGS'):
-                    tracking_settings = TrackingSettings()
-                    if settings.SENDGRID_TRACKING_SETTINGS.get('click_tracking', True):
-                        tracking_settings.click_tracking = ClickTracking(
-                            enable=True,
-                            enable_text=True
-                        )
-                    if settings.SENDGRID_TRACKING_SETTINGS.get('open_tracking', True):
-                        tracking_settings.open_tracking = OpenTracking(enable=True)
-                    mail.tracking_settings = tracking_settings
-                
-                # Send email
-                response = self.sg.send(mail)
-                if response.status_code in [200, 202]:
-                    success_count += 1
-                    logger.info(f"Email sent successfully to {email_message.to}")
+            template = getattr(email_message, 'template', None)
+            key = (
+                email_message.from_email or settings.DEFAULT_FROM_EMAIL,
+                template or (email_message.subject, email_message.body),
+            )
+            groups.setdefault(key, []).append(email_message)
+
+        new_session = self.open()
+        success_count = 0
+        try:
+            for (from_email, _), messages in groups.items():
+                for batch in self._batches(messages):
+                    sent = self._post(from_email, batch)
+                    for email_message in batch:
+                        email_message.sendgrid_status = {
+                            recipient: sent for recipient in email_message.recipients()
+                        }
+                    if sent:
+                        success_count += len(batch)
+        finally:
+            if new_session:
+                self.close()
+
+        return success_count
+
+    def _batches(self, messages):
+        """Chunks of at most SENDGRID_MAX_PERSONALIZATIONS messages; a message
+        whose own part is too big to substitute, or whose body contains the
+        tag, goes alone
+        """
+        for start in range(0, len(messages), SENDGRID_MAX_PERSONALIZATIONS):
+            chunk = messages[start:start + SENDGRID_MAX_PERSONALIZATIONS]
+            _, parts = shared_content([email_message.body for email_message in chunk])
+            if parts is None:
+                yield chunk
+                continue
+            batch = []
+            for email_message, part in zip(chunk, parts):
+                if (
+                    len(part.encode()) > SENDGRID_MAX_SUBSTITUTION_BYTES
+                    or SENDGRID_BODY_TAG in email_message.body
+                ):
+                    yield [email_message]
                 else:
-                    logger.error(f"SendGrid API error: {response.status_code} - {response.body}")
-                    
-            except Exception as e:
-                logger.error(f"Error sending email via SendGrid: {e}")
-                if not self.fail_silently:
-                    raise
-        
-        return success_count
\ No newline at end of file
+                    batch.append(email_message)
+            if batch:
+                yield batch
+
+    def _post(self, from_email, email_messages):
+        subject = email_messages[0].subject
+        content, parts = shared_content([email_message.body for email_message in email_messages])
+        mail = Mail(
+            from_email=From(from_email),
+            subject=Subject(subject),
+            html_content=Content("text/html", content)
+        )
+        for index, email_message in enumerate(email_messages):
+            personalization = Personalization()
+            if email_message.subject != subject:
+                personalization.subject = email_message.subject
+            if parts is not None:
+                personalization.add_substitution(Substitution(SENDGRID_BODY_TAG, parts[index]))
+            for address in email_message.to:
+                personalization.add_to(To(address))
+            for address in email_message.cc:
+                personalization.add_cc(Cc(address))
+            for address in email_message.bcc:
+                personalization.add_bcc(Bcc(address))
+            mail.add_personalization(personalization)
+        if self.tracking_settings is not None:
+            mail.tracking_settings = self.tracking_settings
+
+        try:
+            response = self.session.post(
+                f"{settings.SENDGRID_API_HOST}/v3/mail/send",
+                json=mail.get(),
+                timeout=settings.SENDGRID_TIMEOUT,
+            )
+        except requests.RequestException as e:
+            logger.error(f"Error sending email via SendGrid: {e}")
+            if not self.fail_silently:
+                raise
+            return False
+
+        if response.status_code in [200, 202]:
+            logger.info(f"Email sent successfully to {len(email_messages)} recipient group(s)")
+            return True
+
+        logger.error(f"SendGrid API error: {response.status_code} - {response.text}")
+        if not self.fail_silently:
+            response.raise_for_status()
+        return False
@@ -1,21 +1,33 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.contrib.messages import get_messages
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
 from django.core.mail import send_mail
 from django.conf import settings
-from django.views.decorators.http import require_POST
-from django.http import JsonResponse
+from django.views.decorators.http import condition, require_POST
+from django.views.decorators.cache import cache_control
+from django.http import Http404, JsonResponse
+from django.core.exceptions import ValidationError
 from django.contrib.admin.views.decorators import staff_member_required
 from django.utils import timezone
-from django.utils.dateparse import parse_datetime
-from datetime import date, timedelta
+from django.utils.dateparse import parse_datetime, parse_date
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from django.contrib.auth import get_user_model
+import hashlib
 import logging
+from collections import defaultdict
+from urllib.parse import urlencode
 from .forms import UserRegisterForm
+from .db import replica_reads
+from .cache import cached_catalog, catalog_cache_stats, catalog_version
+from .search import search_catalog, search_terms
 from django.db import transaction
-from .models import Service, HairStyle, Wig, Appointment, WigOrder, SubService, ProductOrder
+from .models import (
+    Service, HairStyle, Wig, Appointment, WigOrder, SubService, ProductOrder, StatusCounter, StockMovement,
+    BookingLock,
+)
 from .utils import (
     send_appointment_request_notification, 
     send_appointment_request_acknowledgement,
@@ -25,7 +37,9 @@ from .utils import (
     send_appointment_cancellation_email,
     send_appointment_cancellation_notification_to_admin,
     send_appointment_cancellation_confirmation,
-    
+    save_appointment_if_free,
+    save_order_if_in_stock,
+    idempotent,
 )
 
 logger = logging.getLogger(__name__)
@@ -52,40 +66,12 @@ def calculate_duration(subservice=None, estimated_duration=None):
         return estimated_duration
     return timedelta(minutes=60)
 
-def check_time_conflicts(service, start_time, duration, exclude_appointment=None):
-    """Check for time conflicts - reusable function"""
-    end_time = start_time + duration
-    end_with_buffer = end_time + timedelta(minutes=10)
-    
-    existing = Appointment.objects.filter(
-        service=service,
-        status__in=["pending", "confirmed"]
-    )
-    
-    if exclude_appointment:
-        existing = existing.exclude(pk=exclude_appointment.pk)
-    
-    for other in existing:
-        other_duration = calculate_duration(other.subservice, other.estimated_duration)
-        other_start = other.appointment_date
-        other_end = other_start + other_duration
-        other_end_with_buffer = other_end + timedelta(minutes=10)
-        
-        if start_time < other_end_with_buffer and other_start < end_with_buffer:
-            return {
-                'conflict': True,
-                'conflict_start': other_start,
-                'conflict_end': other_end_with_buffer
-            }
-    
-    return {'conflict': False}
-
 def extract_appointment_data(request):
     """Extract and validate appointment form data"""
     return {
-        'customer_name': request.POST.get('customer_name'),
-        'customer_phone': request.POST.get('customer_phone'),
-        'customer_email': request.POST.get('customer_email'),
+        'customer_name': request.POST.get('customer_name', '').strip(),
+        'customer_phone': request.POST.get('customer_phone', '').strip(),
+        'customer_email': request.POST.get('customer_email', '').strip(),
         'appointment_date': parse_datetime(request.POST.get('appointment_date')),
         'notes': request.POST.get('notes', ''),
         'subservice_id': request.POST.get('subservice'),
@@ -135,19 +121,97 @@ def register(request):
     return render(request, 'register.html', {'form': form})
 
 # Main Pages
+def active_services():
+    return cached_catalog('services', lambda: list(Service.objects.filter(is_active=True)))
+
+def load_service_page(service_id):
+    """Catalog rows behind service_detail, or None for an unknown service"""
+    service = Service.objects.filter(id=service_id, is_active=True).first()
+    if service is None:
+        return None
+    page = {
+        'service': service,
+        'subservices': list(service.subservices.filter(is_active=True)),
+        'hairstyles': [],
+        'wigs': [],
+    }
+    if service.service_type == 'booking':
+        page['hairstyles'] = list(service.hairstyles.filter(is_active=True))
+        if not page['hairstyles'] and service.name.lower() == 'wigs':
+            page['wigs'] = list(Wig.objects.filter(is_active=True))
+    return page
+
+def load_search_results(query):
+    """[{'kind', 'item'}] for the active catalog items matching query, best first"""
+    models = {'service': Service, 'subservice': SubService, 'hairstyle': HairStyle, 'wig': Wig}
+    matches = search_catalog(query)
+    wanted = defaultdict(list)
+    for kind, object_id in matches:
+        wanted[kind].append(object_id)
+    items = {}
+    for kind, ids in wanted.items():
+        queryset = models[kind].objects.filter(pk__in=ids, is_active=True)
+        if kind != 'service':
+            queryset = queryset.filter(service__is_active=True).select_related('service')
+        items.update(((kind, item.pk), item) for item in queryset)
+    return [{'kind': kind, 'item': items[kind, pk]} for kind, pk in matches if (kind, pk) in items]
+
+def live_wig_stock(request, wigs):
+    """{pk: stock} for the wigs page; stock moves with every order so it is
+    never cached, but it is read only once per request
+    """
+    if not hasattr(request, '_wig_stock'):
+        request._wig_stock = dict(Wig.objects.filter(pk__in=[wig.pk for wig in wigs]).values_list('pk', 'stock'))
+    return request._wig_stock
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+def catalog_etag(request, *args, service_id=None):
+    """ETag for catalog pages, answered without touching the catalog tables.
+
+    Pages embed the visitor's login state and CSRF token, so both are part
+    of the tag; pages with flash messages waiting are always rendered.
+    """
+    version = catalog_version()
+    if version is None or len(get_messages(request)):
+        return None
+    parts = [version, request.session.get('_auth_user_id'), request.META.get('CSRF_COOKIE')]
+    if service_id is not None:
+        page = cached_catalog(f'service:{service_id}', lambda: load_service_page(service_id))
+        if page and page['wigs']:
+            parts.append(sorted(live_wig_stock(request, page['wigs']).items()))
+    return make_etag(*parts)
+
+def search_etag(request):
+    """catalog_etag for the words being searched"""
+    tag = catalog_etag(request)
+    return tag and make_etag(tag, search_terms(request.GET.get('q', '')))
+
+catalog_page = cache_control(private=True, no_cache=True)
+
+@catalog_page
+@condition(etag_func=catalog_etag)
+@replica_reads
 def index(request):
-    services = Service.objects.filter(is_active=True)
-    booking_services = services.filter(service_type='booking')
-    order_services = services.filter(service_type='order')
+    services = active_services()
+    booking_services = [s for s in services if s.service_type == 'booking']
+    order_services = [s for s in services if s.service_type == 'order']
     
     return render(request, 'index.html', {
         'booking_services': booking_services,
         'order_services': order_services,
     })
 
+@catalog_page
+@condition(etag_func=catalog_etag)
+@replica_reads
 def service_detail(request, service_id):
-    service = get_object_or_404(Service, id=service_id, is_active=True)
-    subservices = service.subservices.filter(is_active=True)
+    page = cached_catalog(f'service:{service_id}', lambda: load_service_page(service_id))
+    if page is None:
+        raise Http404("No Service matches the given query.")
+    service = page['service']
+    subservices = page['subservices']
 
     if service.service_type == 'order':
         return render(request, 'order_service.html', {
@@ -155,16 +219,19 @@ def service_detail(request, service_id):
             'subservices': subservices
         })
     elif service.service_type == 'booking':
-        hairstyles = service.hairstyles.filter(is_active=True)
+        hairstyles = page['hairstyles']
         
-        if hairstyles.exists():
+        if hairstyles:
             return render(request, 'hairstyles.html', {
                 'service': service,
                 'hairstyles': hairstyles,
                 'subservices': subservices
             })
         elif service.name.lower() == 'wigs':
-            wigs = Wig.objects.filter(is_active=True)
+            wigs = page['wigs']
+            stock = live_wig_stock(request, wigs)
+            for wig in wigs:
+                wig.stock = stock.get(wig.pk, wig.stock)
             return render(request, 'wigs.html', {
                 'service': service,
                 'wigs': wigs,
@@ -176,10 +243,13 @@ def service_detail(request, service_id):
         'subservices': subservices
     })
 
+@catalog_page
+@condition(etag_func=catalog_etag)
+@replica_reads
 def service_list(request):
-    services = Service.objects.filter(is_active=True)
-    booking_services = services.filter(service_type='booking')
-    product_services = services.filter(service_type='order')
+    services = active_services()
+    booking_services = [s for s in services if s.service_type == 'booking']
+    product_services = [s for s in services if s.service_type == 'order']
     
     return render(request, 'service_list.html', {
         'booking_services': booking_services,
@@ -187,8 +257,26 @@ def service_list(request):
         'all_services': services,
     })
 
+@catalog_page
+@condition(etag_func=search_etag)
+@replica_reads
+def search(request):
+    query = request.GET.get('q', '').strip()
+    # Cached under the normalised words, so 'Braids' and 'braids!' share an entry
+    terms = search_terms(query)
+    results = []
+    if terms:
+        results = cached_catalog(f'search:{make_etag(terms)}', lambda: load_search_results(' '.join(terms)))
+    return render(request, 'search.html', {'query': query, 'results': results})
+
+@staff_member_required
+def catalog_cache_status(request):
+    """Catalog cache version and hit ratio, shared by every worker"""
+    return JsonResponse(catalog_cache_stats())
+
 # Appointment Views
 @login_required
+@idempotent
 def book_appointment(request, service_id):
     service = get_object_or_404(Service, id=service_id, is_active=True)
     
@@ -216,32 +304,28 @@ def book_appointment(request, service_id):
                 )
                 duration = calculate_duration(subservice)
 
-            # --- Atomic transaction to avoid race conditions ---
+            # Saved under the per-service/day booking lock to avoid double bookings
+            appointment = create_appointment_instance(
+                service, form_data, request.user, payment_method, payment_status
+            )
             with transaction.atomic():
-                conflict_result = check_time_conflicts(
-                    service, form_data['appointment_date'], duration
-                )
-                
-                if conflict_result['conflict']:
-                    available_slots = Appointment.objects.get_available_slots(
-                        service, form_data['appointment_date'].date(), subservice
-                    )
-                    formatted_slots = [slot.strftime("%Y-%m-%d %H:%M") for slot in available_slots[:5]]
-                    
-                    msg = "Sorry, this slot conflicts with an existing booking. "
-                    msg += "Here are some available times: " + ", ".join(formatted_slots) if formatted_slots else "No alternative slots available today."
-                    messages.error(request, msg)
-                    return redirect('salon:book_appointment', service_id=service.id)
-                
-                # Create the appointment safely
-                appointment = create_appointment_instance(
-                    service, form_data, request.user, payment_method, payment_status
+                conflict_result = save_appointment_if_free(appointment, duration)
+                if not conflict_result['conflict']:
+                    # Queued in the same transaction as the booking
+                    send_appointment_request_notification(appointment)
+                    send_appointment_request_acknowledgement(appointment)
+
+            if conflict_result['conflict']:
+                available_slots = Appointment.objects.get_available_slots(
+                    service, form_data['appointment_date'].date(), subservice
                 )
-                appointment.save()
+                formatted_slots = [slot.strftime("%Y-%m-%d %H:%M") for slot in available_slots[:5]]
+
+                msg = "Sorry, this slot conflicts with an existing booking. "
+                msg += "Here are some available times: " + ", ".join(formatted_slots) if formatted_slots else "No alternative slots available today."
+                messages.error(request, msg)
+                return redirect('salon:book_appointment', service_id=service.id)
 
-            # Send notifications outside the transaction
-            send_appointment_request_notification(appointment)
-            send_appointment_request_acknowledgement(appointment)
             messages.success(request, 'Your appointment has been requested. We will confirm shortly.')
             return redirect('salon:index')
 
@@ -257,16 +341,74 @@ def book_appointment(request, service_id):
         'subservices': subservices,
     })
 
+MAX_AVAILABILITY_DAYS = 14
+
+def availability_window(request):
+    """(start_date, days) from the ``from`` and ``days`` query params.
+
+    Raises ValueError with a message for the client when either is invalid.
+    """
+    start_date = timezone.localdate()
+    if request.GET.get('from'):
+        try:
+            start_date = parse_date(request.GET['from'])
+        except ValueError:
+            start_date = None
+        if start_date is None:
+            raise ValueError('Invalid from date')
+
+    try:
+        days = int(request.GET.get('days', 1))
+    except ValueError:
+        raise ValueError('Invalid number of days') from None
+    return start_date, max(1, min(days, MAX_AVAILABILITY_DAYS))
+
+def availability_etag(request, service_id):
+    """ETag from the availability version of each day in the window: one query"""
+    version = catalog_version()
+    try:
+        start_date, days = availability_window(request)
+    except ValueError:
+        return None
+    if version is None:
+        return None
+    days_versions = list(BookingLock.objects.filter(
+        service_id=service_id, date__gte=start_date, date__lt=start_date + timedelta(days=days),
+    ).order_by('date').values_list('date', 'version'))
+    return make_etag(version, service_id, start_date, days, days_versions)
+
+@cache_control(public=True, no_cache=True)
+@condition(etag_func=availability_etag)
 def check_availability(request, service_id):
+    """Free slots per day and per subservice for a window of days.
+
+    Query params: ``from`` (YYYY-MM-DD, defaults to today) and ``days``
+    (defaults to 1, capped at MAX_AVAILABILITY_DAYS).
+    """
     service = get_object_or_404(Service, pk=service_id)
-    today = date.today()
-    available_slots = {}
-    
-    for sub in service.subservices.filter(is_active=True):
-        slots = Appointment.objects.get_available_slots(service, today, sub)
-        available_slots[sub.name] = [slot.strftime("%Y-%m-%d %H:%M") for slot in slots]
-    
-    return JsonResponse({"available_slots": available_slots})
+
+    try:
+        start_date, days = availability_window(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    subservices = list(service.subservices.filter(is_active=True))
+    calendar = Appointment.objects.get_availability_calendar(service, start_date, days, subservices)
+
+    available_slots = {
+        day.isoformat(): {
+            sub.name: [slot.strftime("%Y-%m-%d %H:%M") for slot in slots]
+            for sub, slots in day_slots.items()
+        }
+        for day, day_slots in calendar.items()
+    }
+
+    return JsonResponse({
+        "service": service.id,
+        "from": start_date.isoformat(),
+        "days": days,
+        "available_slots": available_slots,
+    })
 
 @login_required
 def appointment_list(request):
@@ -292,6 +434,7 @@ def appointment_detail(request, appointment_id):
 
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
+from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib.auth import get_user_model
 from .models import Appointment
@@ -313,8 +456,9 @@ def confirm_appointment(request, appointment_id):
         except (User.DoesNotExist, User.MultipleObjectsReturned):
             pass
 
-    appointment.save()
-    send_appointment_confirmation_to_customer(appointment)
+    with transaction.atomic():
+        appointment.save()
+        send_appointment_confirmation_to_customer(appointment)
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'success': True, 'message': 'Appointment confirmed'})
@@ -329,9 +473,9 @@ def confirm_appointment_payment(request, appointment_id):
     """Confirm payment for an appointment"""
     appointment = get_object_or_404(Appointment, id=appointment_id)
     appointment.payment_status = 'paid'
-    appointment.save()
-    
-    send_payment_confirmation_to_customer(appointment)
+    with transaction.atomic():
+        appointment.save()
+        send_payment_confirmation_to_customer(appointment)
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'success': True, 'message': 'Appointment payment confirmed'})
@@ -349,9 +493,10 @@ def confirm_product_payment(request, order_type, order_id):
         
         order.payment_status = 'paid'
         order.payment_confirmed = True
-        order.save()
-
-        send_order_confirmation_to_customer(order, order_type)
+        with transaction.atomic():
+            order.save()
+            StockMovement.settle(order, 'commit')
+            send_order_confirmation_to_customer(order, order_type)
 
         return JsonResponse({'success': True, 'message': f'{order_type} order payment confirmed'})
         
@@ -377,13 +522,14 @@ def cancel_appointment_common(request, appointment_id, is_admin_cancellation=Fal
         appointment.cancellation_reason = reason
         appointment.cancelled_by = 'admin' if is_admin_cancellation else 'client'
         appointment.cancelled_at = timezone.now()
-        appointment.save()
-        
-        if is_admin_cancellation:
-            send_appointment_cancellation_email(appointment, reason)
-        else:
-            send_appointment_cancellation_notification_to_admin(appointment, reason)
-            send_appointment_cancellation_confirmation(appointment, reason)
+        with transaction.atomic():
+            appointment.save()
+
+            if is_admin_cancellation:
+                send_appointment_cancellation_email(appointment, reason)
+            else:
+                send_appointment_cancellation_notification_to_admin(appointment, reason)
+                send_appointment_cancellation_confirmation(appointment, reason)
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'success': True, 'message': 'Appointment cancelled'})
@@ -417,6 +563,7 @@ def cancel_appointment_client(request, appointment_id):
     return cancel_appointment_common(request, appointment_id, is_admin_cancellation=False)
 
 @login_required
+@idempotent
 def order_product(request, service_id, subservice_id):
     try:
         service = get_object_or_404(Service, id=service_id, is_active=True)
@@ -441,7 +588,7 @@ def order_product(request, service_id, subservice_id):
                 total_price = quantity * subservice.price
                 payment_method, payment_status = process_payment_method(request)
                 
-                order = ProductOrder.objects.create(
+                order = ProductOrder(
                     user=request.user,  # <-- link to logged-in user
                     subservice=subservice,
                     customer_name=request.POST.get('customer_name'),
@@ -455,11 +602,12 @@ def order_product(request, service_id, subservice_id):
                     payment_status=payment_status
                 )
                 
-                subservice.stock -= quantity
-                subservice.save()
+                if save_order_if_in_stock(order, subservice, quantity):
+                    messages.success(request, f'Order placed for {quantity} x {subservice.name}. Total: ${total_price:.2f}')
+                    return redirect('salon:index')
                 
-                messages.success(request, f'Order placed for {quantity} x {subservice.name}. Total: ${total_price:.2f}')
-                return redirect('salon:index')
+                subservice.refresh_from_db(fields=['stock'])
+                messages.error(request, f"Sorry, only {subservice.stock} units available in stock.")
         
         return render(request, 'order_product.html', {
             'service': service,
@@ -472,6 +620,7 @@ def order_product(request, service_id, subservice_id):
         return redirect('salon:index')
 
 @login_required
+@idempotent
 def order_wig(request, wig_id):
     wig = get_object_or_404(Wig, id=wig_id, is_active=True)
     
@@ -498,20 +647,30 @@ def order_wig(request, wig_id):
                 payment_method=payment_method,
                 payment_status=payment_status
             )
-            order.save()
             
-            messages.success(request, 'Your order has been placed. You will receive payment instructions shortly.')
-            return redirect('salon:index')
+            if save_order_if_in_stock(order, wig, quantity):
+                messages.success(request, 'Your order has been placed. You will receive payment instructions shortly.')
+                return redirect('salon:index')
+            
+            wig.refresh_from_db(fields=['stock'])
+            messages.error(request, f'Sorry, only {wig.stock} units available in stock.')
     
     return render(request, 'order_wig.html', {'wig': wig})
 
+def customer_order_or_404(request, model, order_id):
+    """The order if it belongs to the user; staff can open any order"""
+    orders = model.objects.all() if request.user.is_staff else model.objects.filter(user=request.user)
+    return get_object_or_404(orders, id=order_id)
+
+@login_required
 def view_order(request, order_id):
-    order = get_object_or_404(ProductOrder, id=order_id)
-    return render(request, 'view_order.html', {'order': order})
+    order = customer_order_or_404(request, ProductOrder, order_id)
+    return render(request, 'view_order.html', {'order': order, 'item_name': order.product_name})
 
+@login_required
 def view_wig_order(request, order_id):
-    order = get_object_or_404(WigOrder, id=order_id)
-    return render(request, 'view_wig_order.html', {'order': order})
+    order = customer_order_or_404(request, WigOrder, order_id)
+    return render(request, 'view_order.html', {'order': order, 'item_name': f"{order.wig.name} (Wig)"})
 
 def order_action_common(request, order_id, order_type, action):
     """Common logic for order actions (confirm/cancel)"""
@@ -528,13 +687,21 @@ def order_action_common(request, order_id, order_type, action):
     if action == 'confirm':
         order.payment_confirmed = True
         order.status = 'confirmed'
-        order.save()
-        send_order_confirmation_to_customer(order, order_type)
+        with transaction.atomic():
+            order.save()
+            StockMovement.settle(order, 'commit')
+            send_order_confirmation_to_customer(order, order_type)
         message = f'{order_type.title()} order confirmed'
     elif action == 'cancel':
-        order.status = 'cancelled'
-        order.save()
-        send_order_cancellation_email(order, order_type)
+        try:
+            with transaction.atomic():
+                order.cancel()  # releases the order's reserved stock
+                send_order_cancellation_email(order, order_type)
+        except ValidationError as e:
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({'success': False, 'message': e.messages[0]})
+            messages.error(request, e.messages[0])
+            return redirect('salon:admin_dashboard')
         message = f'{order_type.title()} order cancelled'
     else:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -569,66 +736,184 @@ def confirm_payment(request, order_type, order_id):
         return order_action_common(request, order_id, order_type, 'confirm')
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
-from django.db.models import Case, When, IntegerField
+from django.db.models import Case, When, IntegerField, CharField, F, Q, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
 from django.contrib.admin.views.decorators import staff_member_required
 
+DASHBOARD_PAGE_SIZE = 25
+DASHBOARD_STATUS_CHOICES = ['pending', 'confirmed', 'paid', 'completed', 'shipped', 'delivered', 'cancelled']
+DASHBOARD_KINDS = ('appointments', 'wigs', 'products')
+
+# Custom ordering: pending -> confirmed -> completed -> cancelled
+APPOINTMENT_STATUS_RANK = Case(
+    When(status='pending', then=0),
+    When(status='confirmed', then=1),
+    When(status='completed', then=2),
+    When(status='cancelled', then=3),
+    output_field=IntegerField(),
+)
+WIG_ORDER_STATUS_RANK = Case(
+    When(status='pending', then=0),
+    When(status='confirmed', then=1),
+    When(status='shipped', then=2),
+    When(status='delivered', then=3),
+    When(status='cancelled', then=4),
+    output_field=IntegerField(),
+)
+PRODUCT_ORDER_STATUS_RANK = Case(
+    When(payment_status='pending', then=0),
+    When(payment_status='paid', then=1),
+    output_field=IntegerField(),
+)
+
+def encode_dashboard_cursor(item, date_field):
+    """Keyset cursor (status rank, date, id) for the last row of a page"""
+    moment = getattr(item, date_field)
+    micros = (moment - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)) // timedelta(microseconds=1)
+    return f"{item.status_rank}_{micros}_{item.pk}"
+
+def decode_dashboard_cursor(cursor):
+    try:
+        rank, micros, pk = (int(part) for part in cursor.split('_'))
+    except (AttributeError, ValueError):
+        return None
+    return rank, datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=micros), pk
+
+def dashboard_pages(queryset, service_field, date_field, status_rank, status_filter, service_ids, cursor=None):
+    """Fetch one page of rows per service in a single windowed query.
+
+    Rows are ordered by (status rank, newest date, newest id) within each
+    service; `cursor` is (service_id, (rank, date, id)) to resume one service
+    after its previous page. Returns {service_id: (items, next_cursor)}.
+    """
+    queryset = queryset.filter(**{f'{service_field}__in': service_ids}).annotate(
+        status_rank=status_rank,
+        dashboard_service=F(service_field),
+    )
+    if status_filter:
+        queryset = queryset.filter(status_filter)
+    if cursor:
+        cursor_service, (rank, moment, pk) = cursor
+        after = (
+            Q(status_rank__gt=rank)
+            | Q(status_rank=rank, **{f'{date_field}__lt': moment})
+            | Q(status_rank=rank, **{date_field: moment}, pk__lt=pk)
+        )
+        queryset = queryset.filter(~Q(**{service_field: cursor_service}) | after)
+
+    queryset = queryset.annotate(
+        dashboard_row=Window(
+            RowNumber(),
+            partition_by=F(service_field),
+            order_by=[F('status_rank').asc(), F(date_field).desc(), F('pk').desc()],
+        )
+    ).filter(dashboard_row__lte=DASHBOARD_PAGE_SIZE + 1).order_by('status_rank', f'-{date_field}', '-pk')
+
+    rows = {}
+    for item in queryset:
+        rows.setdefault(item.dashboard_service, []).append(item)
+
+    pages = {}
+    for service_id, items in rows.items():
+        next_cursor = None
+        if len(items) > DASHBOARD_PAGE_SIZE:
+            items = items[:DASHBOARD_PAGE_SIZE]
+            next_cursor = encode_dashboard_cursor(items[-1], date_field)
+        pages[service_id] = (items, next_cursor)
+    return pages
+
 @staff_member_required
+@replica_reads
 def admin_dashboard(request):
-    services = Service.objects.filter(is_active=True)
-    service_data = []
+    """Staff dashboard built from a fixed number of queries.
+
+    Query params: ``status`` filters every tab; ``service`` with
+    ``after_appointments``, ``after_wigs`` and ``after_products`` resumes
+    that service's lists from their cursors, each independently.
+    """
+    services = list(Service.objects.filter(is_active=True))
+    booking_ids = [s.id for s in services if s.service_type == 'booking']
+    order_ids = [s.id for s in services if s.service_type == 'order']
+
+    status = request.GET.get('status', '')
+    active_service = None
+    positions = {}  # kind -> cursor of the page shown for active_service
+    if request.GET.get('service', '').isdigit():
+        active_service = int(request.GET['service'])
+        for name in DASHBOARD_KINDS:
+            if decode_dashboard_cursor(request.GET.get(f'after_{name}')):
+                positions[name] = request.GET[f'after_{name}']
+
+    def kind_cursor(name):
+        if name not in positions:
+            return None
+        return active_service, decode_dashboard_cursor(positions[name])
+
+    def more_link(service, name, next_cursor):
+        # Advance one list and keep the others where they are
+        params = {'service': service.id}
+        if service.id == active_service:
+            params.update((f'after_{kind}', value) for kind, value in positions.items())
+        params[f'after_{name}'] = next_cursor
+        if status:
+            params['status'] = status
+        return urlencode(params)
+
+    appointment_pages = wig_pages = product_pages = {}
+    if booking_ids:
+        appointment_pages = dashboard_pages(
+            Appointment.objects.select_related('service', 'subservice'),
+            'service', 'appointment_date', APPOINTMENT_STATUS_RANK,
+            Q(status=status) if status else None, booking_ids, kind_cursor('appointments'),
+        )
+    if order_ids:
+        wig_pages = dashboard_pages(
+            WigOrder.objects.select_related('wig'),
+            'wig__service', 'order_date', WIG_ORDER_STATUS_RANK,
+            Q(status=status) if status else None, order_ids, kind_cursor('wigs'),
+        )
+        product_pages = dashboard_pages(
+            ProductOrder.objects.select_related('subservice'),
+            'subservice__service', 'order_date', PRODUCT_ORDER_STATUS_RANK,
+            Q(payment_status=status) if status else None, order_ids, kind_cursor('products'),
+        )
+
+    counters = StatusCounter.for_services(services)
+    totals = {'appointments': 0, 'orders': 0, 'services': len(services)}
 
+    service_data = []
     for service in services:
-        if service.service_type == "booking":
-            # Custom ordering: pending -> confirmed -> completed -> cancelled
-            items = Appointment.objects.filter(service=service).order_by(
-                Case(
-                    When(status='pending', then=0),
-                    When(status='confirmed', then=1),
-                    When(status='completed', then=2),
-                    When(status='cancelled', then=3),
-                    output_field=IntegerField(),
-                ),
-                '-appointment_date'  # newest first
-            )
+        summary = counters.get(service.id, {})
+        totals['appointments'] += sum(summary.get('appointment', {}).values())
+        totals['orders'] += sum(summary.get('wig_order', {}).values()) + sum(summary.get('product_order', {}).values())
 
+        if service.service_type == "booking":
+            items, next_cursor = appointment_pages.get(service.id, ([], None))
+            next_cursors = {'appointments': next_cursor}
         elif service.service_type == "order":
-            # For Wig orders
-            wigs_items = WigOrder.objects.filter(wig__service=service).order_by(
-                Case(
-                    When(status='pending', then=0),
-                    When(status='confirmed', then=1),
-                    When(status='shipped', then=2),
-                    When(status='delivered', then=3),
-                    When(status='cancelled', then=4),
-                    output_field=IntegerField(),
-                ),
-                '-order_date'  # newest first
-            )
-
-            # For Product orders
-            products_items = ProductOrder.objects.filter(subservice__service=service).order_by(
-                Case(
-                    When(payment_status='pending', then=0),
-                    When(payment_status='paid', then=1),
-                    output_field=IntegerField(),
-                ),
-                '-order_date'  # newest first
-            )
-
-            # Combine both types of orders
-            items = list(wigs_items) + list(products_items)
-
+            wig_items, wig_cursor = wig_pages.get(service.id, ([], None))
+            product_items, product_cursor = product_pages.get(service.id, ([], None))
+            items = wig_items + product_items
+            next_cursors = {'wigs': wig_cursor, 'products': product_cursor}
         else:
-            items = []
+            items, next_cursors = [], {}
 
+        next_cursors = {name: value for name, value in next_cursors.items() if value}
         service_data.append({
             "service": service,
-            "items": items
+            "summary": summary,
+            "items": items,
+            "next_cursors": next_cursors,
+            "more_links": {name: more_link(service, name, value) for name, value in next_cursors.items()},
         })
 
     context = {
         "user": request.user,
         "service_data": service_data,
+        "totals": totals,
+        "status": status,
+        "status_choices": DASHBOARD_STATUS_CHOICES,
+        "active_service": active_service,
     }
 
     return render(request, "admin_dashboard.html", context)
@@ -655,18 +940,118 @@ def send_appointment_confirmation(appointment):
     '''
     send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [appointment.customer_email])
 
+MY_ORDERS_PAGE_SIZE = 20
+
+def encode_feed_cursor(row):
+    micros = (row['created_at'] - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)) // timedelta(microseconds=1)
+    return f"{micros}_{row['kind']}_{row['id']}"
+
+def decode_feed_cursor(cursor):
+    try:
+        micros, kind, pk = cursor.split('_')
+        return datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=int(micros)), kind, int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+def order_feed(user, cursor=None, limit=MY_ORDERS_PAGE_SIZE):
+    """One page of a user's product and wig orders, newest first.
+
+    The union and ordering run in SQL and only the columns the template
+    shows are selected. Rows are ordered by (created_at, kind, id) so the
+    keyset `cursor` is unambiguous across the two tables.
+    """
+    columns = ('id', 'quantity', 'total_price', 'created_at', 'kind', 'item_name', 'status_label')
+    sides = {
+        'product': ProductOrder.objects.filter(user=user).annotate(
+            kind=Value('product', output_field=CharField()),
+            item_name=Coalesce('subservice__name', 'product_name'),
+            status_label=F('payment_status'),
+        ),
+        'wig': WigOrder.objects.filter(user=user).annotate(
+            kind=Value('wig', output_field=CharField()),
+            item_name=F('wig__name'),
+            status_label=F('status'),
+        ),
+    }
+
+    parts = []
+    for kind, queryset in sides.items():
+        if cursor:
+            created_at, cursor_kind, pk = cursor
+            if kind < cursor_kind:
+                after = Q(created_at__lte=created_at)
+            elif kind == cursor_kind:
+                after = Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            else:
+                after = Q(created_at__lt=created_at)
+            queryset = queryset.filter(after)
+        parts.append(queryset.order_by().values(*columns))
+
+    rows = list(parts[0].union(parts[1], all=True).order_by('-created_at', '-kind', '-id')[:limit + 1])
+    next_cursor = encode_feed_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
 @login_required
 def my_orders(request):
-    product_orders = ProductOrder.objects.filter(user=request.user)
-    wig_orders = WigOrder.objects.filter(user=request.user)
+    orders, next_cursor = order_feed(request.user, decode_feed_cursor(request.GET.get('after')))
+    return render(request, 'my_orders.html', {'orders': orders, 'next_cursor': next_cursor})
 
-    orders = sorted(
-        list(product_orders) + list(wig_orders),
-        key=lambda o: o.created_at,
-        reverse=True
-    )
+from .cart import Cart, checkout_cart
+
+def view_cart(request):
+    cart = Cart(request.session)
+    lines = cart.lines()
+    return render(request, 'cart.html', {
+        'lines': lines,
+        'total': sum(line['line_total'] for line in lines),
+    })
+
+@require_POST
+def cart_add(request):
+    cart = Cart(request.session)
+    try:
+        quantity = int(request.POST.get('quantity', 1))
+        item_id = int(request.POST.get('item_id'))
+    except (TypeError, ValueError):
+        messages.error(request, "Please enter a valid quantity.")
+        return redirect('salon:view_cart')
+    if quantity <= 0:
+        messages.error(request, "Please enter a valid quantity.")
+        return redirect('salon:view_cart')
+
+    try:
+        cart.add(request.POST.get('kind'), item_id, quantity)
+    except ValidationError as e:
+        messages.error(request, e.messages[0])
+    else:
+        messages.success(request, "Added to your cart.")
+    return redirect('salon:view_cart')
+
+@require_POST
+def cart_remove(request, kind, item_id):
+    Cart(request.session).remove(kind, item_id)
+    return redirect('salon:view_cart')
+
+@login_required
+@require_POST
+@idempotent
+def checkout(request):
+    cart = Cart(request.session)
+    payment_method, payment_status = process_payment_method(request)
+    customer = {
+        'customer_name': request.POST.get('customer_name', '').strip(),
+        'customer_email': request.POST.get('customer_email', '').strip(),
+        'customer_phone': request.POST.get('customer_phone', '').strip(),
+        'customer_address': request.POST.get('customer_address', '').strip(),
+    }
+    try:
+        orders = checkout_cart(cart, request.user, customer, payment_method, payment_status)
+    except ValidationError as e:
+        messages.error(request, e.messages[0])
+        return redirect('salon:view_cart')
 
-    return render(request, 'my_orders.html', {'orders': orders})
+    messages.success(request, f"Order placed for {len(orders)} item(s). You will receive a confirmation email shortly.")
+    return redirect('salon:my_orders')
 
 from django.contrib.auth.views import PasswordResetView
 from .forms import CustomPasswordResetForm
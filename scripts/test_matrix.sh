@@ -0,0 +1,18 @@
+#!/bin/sh
+# Run the test suite on SQLite and, when TEST_DATABASE_URL is set, on PostgreSQL.
+#
+#   TEST_DATABASE_URL=postgres://postgres@127.0.0.1:5432/hairsalon scripts/test_matrix.sh
+#
+# The PostgreSQL user needs CREATEDB, since Django creates test_<name>.
+set -e
+cd "$(dirname "$0")/.."
+
+echo "== sqlite"
+DATABASE_URL= python manage.py test "$@"
+
+if [ -n "$TEST_DATABASE_URL" ]; then
+    echo "== postgresql"
+    DATABASE_URL="$TEST_DATABASE_URL" python manage.py test "$@"
+else
+    echo "TEST_DATABASE_URL is not set; skipping PostgreSQL"
+fi